@@ -12,10 +12,17 @@ import pybiosis.loader as loader
 import pybiosis.core as pybiosis
 import atexit
 import sys
+import os
 
 START_MSG = f"🟢 Starting the Pybiosis CLI."
 STOP_MSG = f"🔴 Stopping the Pybiosis CLI."
 
+def requested_command():
+	""" The command given on the command line (found as run_cli does), or None. """
+	command_args = [a for a in sys.argv[1:] if not a.startswith('-')]
+	return command_args[0] if command_args else None
+
+
 class Commands(CommandFramework):
 	CONFIG_VARIABLES = ['user_path']
 
@@ -23,7 +30,7 @@ class Commands(CommandFramework):
 		""" Run and search for functions to run. """
 
 		manager = ConfigurationManager(Path(__file__).parent / '.config.json')
-		if manager.has('user_path'):
+		if manager.has('user_path') and requested_command() != 'load':  # `load` times the imports, so they mustn't happen first.
 			with general.ChangeDir(loader.get_user_path()):
 				pybiosis.load()
 				_, cmds = commands.RunHelper.load_data()
@@ -34,6 +41,8 @@ class Commands(CommandFramework):
 			setup.add_argument('-r', '--run', choices=sorted(list(cmds)), help='Run a command')
 			setup.add_argument('-l', '--list', nargs='*', help='List the subhierarchy.')
 			setup.add_argument('-d', '--depth', nargs='?', default=None, type=int, help='Limit the depths of the hierarchy, starting at 1.')
+			setup.add_argument('-P', '--profile', choices=sorted(list(cmds)) or None, metavar='IDENTIFIER', help='Run a command under cProfile, writing reports to .compilers/profiles.')
+			setup.add_argument('-m', '--memory', action='store_true', help='With --profile, also report the top allocations (tracemalloc).')
 			return
 
 		print(f"🏃 Running the [green]RUN[/green] command.")
@@ -53,11 +62,70 @@ class Commands(CommandFramework):
 		if setup:
 			setup.add_argument('-d', '--detached', action='store_true', help="Run as a detached process [only use in GUI CLI].")
 			setup.add_argument('-w', '--no-wait', action='store_true', help="Don't wait for the process to finish (calls are blocking by default).")
+			setup.add_argument('-t', '--tail', type=int, nargs='?', const=50, help="Show the last N lines of the driver's output, and follow it while the driver runs.")
 			return
 
 		print("👨 Running the [green]USER[/green] command.")
 		commands.call_user(args.detached, not args.no_wait, args, kwargs.get('unknown_args'))
 
+	def add_schedule(self, setup, args, **kwargs):
+		""" Run the Scheduler functions in this process (works on any platform). """
+		if setup:
+			setup.add_argument('-r', '--run', action='store_true', help='Run the scheduler engine until interrupted.')
+			setup.add_argument('-w', '--workers', type=int, default=4, help='The number of functions that can run at the same time.')
+			setup.add_argument('-c', '--catch-up', choices=['skip', 'once', 'all'], default='once', help='How to handle runs that were missed.')
+			setup.add_argument('-o', '--overlap', choices=['skip', 'queue', 'parallel'], default='skip', help='How to handle a run that is due while the previous one is still running.')
+			setup.add_argument('-p', '--preview', action='store_true', help='Show when the functions will run, and where they pile up.')
+			setup.add_argument('--horizon', default='7d', help='How far ahead to preview, eg: 12h, 7d, 2w.')
+			setup.add_argument('--threshold', type=int, default=2, help='The number of runs in the same minute that counts as a collision.')
+			setup.add_argument('--stagger', nargs='?', const=10, default=None, type=int, help='Suggest start offsets that spread collisions over this many minutes.')
+			return
+
+		print("⏰ Running the [green]SCHEDULE[/green] command.")
+		commands.call_schedule(args, kwargs.get('unknown_args'))
+
+	def add_serve(self, setup, args, **kwargs):
+		""" Serve the functions over a local HTTP gateway (phrases, calls, batches and metrics). """
+		if setup:
+			setup.add_argument('--host', default='127.0.0.1', help='The address to listen on (localhost by default).')
+			setup.add_argument('-p', '--port', type=int, default=8765, help='The port to listen on.')
+			setup.add_argument('-w', '--workers', type=int, default=4, help='The number of functions that can run at the same time.')
+			setup.add_argument('-m', '--max-concurrency', type=int, default=32, help='The number of calls that can run or wait before answering 503.')
+			setup.add_argument('-r', '--reload', action='store_true', help='Reload the user modules when they change.')
+			setup.add_argument('-t', '--token', default=os.getenv('PYBIOSIS_GATEWAY_TOKEN'), help='Require "Authorization: Bearer <token>" (required to listen beyond localhost).')
+			return
+
+		print("🌐 Running the [green]SERVE[/green] command.")
+		commands.call_serve(args, kwargs.get('unknown_args'))
+
+	def add_history(self, setup, args, **kwargs):
+		""" Show what ran, when, how long it took and whether it failed. """
+		if setup:
+			setup.add_argument('-f', '--function', help='Only this function (module.name), * wildcards are allowed.')
+			setup.add_argument('-s', '--status', choices=['ok', 'failed', 'timeout', 'memory', 'skipped'], help='Only runs with this status.')
+			setup.add_argument('--since', help='Only runs since, eg: 12h, 7d or 2024-01-31.')
+			setup.add_argument('--until', help='Only runs before, eg: 1d or 2024-02-01.')
+			setup.add_argument('-n', '--limit', type=int, default=20, help='The number of runs to list.')
+			setup.add_argument('-p', '--percentiles', action='store_true', help='Summarize the durations per function (p50, p95, p99).')
+			setup.add_argument('--slowest', type=int, nargs='?', const=10, help='List the N slowest runs.')
+			setup.add_argument('--prune', type=float, nargs='?', const=-1, help='Delete runs older than this many days (PYBIOSIS_HISTORY_DAYS by default).')
+			return
+
+		print("📜 Running the [green]HISTORY[/green] command.")
+		commands.call_history(args, kwargs.get('unknown_args'))
+
+	def add_load(self, setup, args, **kwargs):
+		""" Load the user modules, and report how long each one takes to import. """
+		if setup:
+			setup.add_argument('-t', '--timings', action='store_true', help='Report the import time and memory of each user module (and its heaviest imports).')
+			setup.add_argument('-b', '--save-baseline', action='store_true', help='Save these timings as the baseline that later runs are compared with.')
+			setup.add_argument('--threshold', type=float, default=25, help='Flag the modules that are this many percent slower than the baseline.')
+			setup.add_argument('-n', '--top', type=int, default=3, help='The number of heaviest imports to list per module.')
+			return
+
+		print("⏱️ Running the [green]LOAD[/green] command.")
+		commands.call_load(args, kwargs.get('unknown_args'))
+
 	def add_config(self, setup, args, **kwargs):
 		""" Access the config functionality. """
 		if setup:
@@ -62,13 +62,22 @@ class RunHelper:
 		return '.'.join(chunks[:min(len(chunks), depth)])
 
 	@classmethod
-	def call_function_by_dot_syntax(cls, identifier: str):
+	def call_function_by_dot_syntax(cls, identifier: str, profile=False, memory=False):
+		""" With profile, the call is profiled and the reports are written to .compilers/profiles (memory adds tracemalloc). """
 		if not identifier:
 			raise ValueError("You did not supply an function to call.")
 		module, function_name = identifier.rsplit('.', 1)
-		module = general.import_module(module.replace('.', os.sep) + '.py')  # We are in the user_path.
+		module = general.import_module(module.replace('.', os.sep) + '.py')  # We are in the user_path. Loaded modules are reused.
 		function = getattr(module, function_name)
-		function()
+		if not profile:
+			function()
+			return
+
+		from pybiosis.profiling import Profiler
+		with Profiler(identifier, memory=memory) as profiler:
+			function()
+		for path in profiler.paths:
+			print("Profile written to:", path)
 
 	class Info:
 		def __init__(self, name, title, description):
@@ -117,6 +126,11 @@ def call_run(args, unknown_args):
 			case argparse.Namespace(depth=int()):
 				raise ValueError("Can't use depth flag outside of --list (-l).")
 
+			# For `run --profile identifier`:
+			case argparse.Namespace(profile=str() as identifier):
+				print("Profiling:", identifier)
+				RunHelper.call_function_by_dot_syntax(identifier, profile=True, memory=args.memory)
+
 			# For `run identifier`:
 			case argparse.Namespace(run=identifier) if not unknown_args:
 				if identifier:
@@ -140,19 +154,139 @@ def call_compile(args, unknown_args):
 		pybiosis.Device.compile_all()
 
 
+def call_schedule(args, unknown_args):
+	from pybiosis.scheduling.engine import SchedulerEngine
+	with general.ChangeDir(loader.get_user_path()):
+		pybiosis.load()
+		functions = [f for c, f in pybiosis.Device.FUNCTIONS if c.__name__ == 'Scheduler']
+		if args.preview:
+			preview_schedule(functions, args)
+			return
+
+		state_file = loader.get_user_path() / '.compilers/scheduler/engine.json'
+		state_file.parent.mkdir(parents=True, exist_ok=True)
+		engine = SchedulerEngine.from_functions(functions, max_workers=args.workers, catch_up=args.catch_up, overlap=args.overlap, state_file=state_file)
+		for name, info in sorted(engine.summary().items(), key=lambda item: str(item[1]['next_run'])):
+			print(f"{name}: next run at {info['next_run']}")
+
+		if args.run:
+			print(f"Running {len(engine.jobs)} scheduled function(s). Press Ctrl+C to stop.")
+			engine.run()
+			for name, info in engine.summary().items():
+				print(f"{name}: {info}")
+
+
+def preview_schedule(functions, args):
+	from pybiosis.scheduling.preview import Preview, parse_horizon
+	import time
+	start = time.perf_counter()
+	preview = Preview.from_functions(functions, horizon=parse_horizon(args.horizon))
+	print(f"Expanded {len(functions)} schedule(s) into {len(preview.times)} run(s) over {args.horizon} in {time.perf_counter() - start:.3f} seconds.")
+
+	print("Runs per minute (load: number of minutes):")
+	for load, count in preview.load_distribution().items():
+		print(f"\t{load:>4}: {count}")
+
+	collisions = preview.collisions(threshold=args.threshold)
+	print(f"Busiest minutes with at least {args.threshold} runs:" if collisions else "There are no collisions.")
+	for minute, names in collisions:
+		print(f"\t{minute:%Y/%m/%d %H:%M} ({len(names)}): {', '.join(sorted(set(names)))}")
+
+	if args.stagger:
+		offsets = preview.stagger(threshold=args.threshold, spread=args.stagger)
+		print("Suggested start offsets:" if offsets else "There is nothing to stagger.")
+		for name, offset in offsets.items():
+			print(f"\t{name}: +{offset} minute(s)")
+
+
+def call_serve(args, unknown_args):
+	from pybiosis.gateway import Gateway
+	with general.ChangeDir(loader.get_user_path()):
+		pybiosis.load()
+		gateway = Gateway.from_functions(pybiosis.Device.FUNCTIONS, host=args.host, port=args.port, workers=args.workers, max_concurrency=args.max_concurrency, token=args.token)
+		if args.reload:
+			from pybiosis.reloader import Reloader
+
+			Reloader(loader.get_user_path(), on_reload=lambda modules: gateway.refresh(pybiosis.Device.FUNCTIONS)).start()
+		print(f"Serving {len(gateway.functions)} function(s) on http://{args.host}:{args.port}. Press Ctrl+C to stop.")
+		gateway.run()
+
+
+def call_history(args, unknown_args):
+	from pybiosis.history import History, RETENTION_DAYS
+	from pybiosis.runtime import state_path
+	from pybiosis.scheduling.preview import parse_horizon
+	import datetime as dt
+
+	def moment(value):  # '7d' means 7 days ago.
+		if value is None:
+			return None
+		try:
+			return (dt.datetime.now() - parse_horizon(value)).timestamp()
+		except ValueError:
+			return dt.datetime.fromisoformat(value).timestamp()
+
+	history = History(str(state_path('history.db')))
+	if args.prune is not None:
+		days = RETENTION_DAYS if args.prune < 0 else args.prune
+		print(f"Deleted {history.prune(days)} run(s) older than {days:g} days.")
+		return
+
+	filters = dict(function=args.function, status=args.status, since=moment(args.since), until=moment(args.until))
+	if args.percentiles:
+		print(f"{'function':<40} {'runs':>7} {'failed':>7} {'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9}")
+		for function, entry in sorted(history.summary(**filters).items()):
+			print(f"{function:<40} {entry['runs']:>7} {entry['failed']:>7} {entry['p50']:>9.3f} {entry['p95']:>9.3f} {entry['p99']:>9.3f}")
+		return
+
+	runs = history.slowest(args.slowest, **filters) if args.slowest else history.runs(args.limit, **filters)
+	for run in runs:
+		started = dt.datetime.fromtimestamp(run['started']).strftime('%Y-%m-%d %H:%M:%S')
+		print(f"{started}  {run['status']:<8} {run['duration']:>9.3f}s  {run['function']}" + (f"  ({run['error']})" if run['error'] else ''))
+
+
+def call_load(args, unknown_args):
+	from pybiosis.importtime import ImportTimings, load_baseline, save_baseline
+	from pybiosis.runtime import state_path
+	with general.ChangeDir(loader.get_user_path()):
+		timings = ImportTimings() if (args.timings or args.save_baseline) else None
+		pybiosis.load(timings)
+		print(f"Loaded {len(pybiosis.Device.FUNCTIONS)} function(s).")
+		if timings is None:
+			return
+
+		path = state_path('import_timings.json')
+		baseline = load_baseline(path)
+		for line in timings.report(baseline, args.threshold, args.top):
+			print(line)
+		if baseline and (regressions := timings.regressions(baseline, args.threshold)):
+			print(f"{len(regressions)} module(s) are more than {args.threshold:g}% slower than the baseline.")
+		if args.save_baseline:
+			save_baseline(path, timings)
+			print("Saved the baseline to:", path)
+
+
 def call_user(gui, wait, args, unknown_args):
+	import pybiosis.processes as processes
+	if getattr(args, 'tail', None) is not None:
+		processes.tail(args.tail)
+		return
+
 	command_list = [sys.executable, 'driver.py'] + unknown_args
-	if gui:
-		subprocess.Popen(command_list, cwd=loader.get_user_path(),
-			start_new_session=True,
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,			
-		)
-	else:
-		process = subprocess.Popen(command_list, cwd=loader.get_user_path())
-	
-	if wait:
-		process.wait()
+	if gui or not wait:
+		# A supervisor process pumps the output into the logs, so it keeps being read after this process exits.
+		with open(processes.user_state('supervisor.log'), 'a') as errors:
+			process = subprocess.Popen([sys.executable, '-m', 'pybiosis.processes', '--'] + command_list, cwd=loader.get_user_path(),
+				start_new_session=True,
+				stdin=subprocess.DEVNULL,
+				stdout=subprocess.DEVNULL,
+				stderr=errors,
+			)
+		if wait:
+			process.wait()
+		return
+
+	processes.DriverProcess(command_list, loader.get_user_path(), echo=True).start().wait()
 
 
 def call_config(args, unknown_args, config_variables):
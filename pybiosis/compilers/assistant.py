@@ -5,7 +5,11 @@ from pathlib import Path
 import os
 import glob
 import json
+import math
 import itertools as it
+from pybiosis.util.automaton import PhraseAutomaton, normalize, ARGUMENT
+from pybiosis.util.jsonl import JsonlWriter, JsonlReader
+import contextlib
 
 ## Tasker is a phone app that may be able to use google assistant to communicate between phone and these commands.
 # Okay Google, on pc, play "balloon 6" -> Okay Google, run, balloon 6, in Tasker
@@ -16,7 +20,7 @@ import itertools as it
 
 def multi_phrase(*words):
 	""" This function accepts a sequence of lists, where each list corresponds to multiple versions of a word.
-	    The returned value is a list of all the possible ways to say that sentence.
+	    The returned value represents all the possible ways to say that sentence.
 	    This is useful since the Google assistant may mis-hear a particular phrasing,
 	    and this makes it easier to construct multiple variants.
 
@@ -24,36 +28,126 @@ def multi_phrase(*words):
 	    	voice = multi_phrase(['open', 'play', 'place'], ['spire', 'fire', 'buyer'])
 	    	voice = multi_phrase(['play'], ['spire']) == (['play'], ['spire'])
 
+	    The phrases are kept as a PhraseGrammar (the lists themselves), rather than every combination,
+	    so its size grows with the number of synonyms rather than their product.
 	    Because of this, multi_phrase can be used everywhere and is therefore automatically applied.
 	"""
-	return list(map(' '.join, it.product(*words)))
+	return PhraseGrammar([words])
+
+
+class PhraseGrammar:
+	""" A compact set of phrases. It is a list of alternatives, each of which is a sequence of slots,
+		and each slot is a list of synonyms (which may be several words long):
+			[[['open', 'play'], ['spire', 'fire']], [['slay the spire']]]
+
+		It behaves like the list of every phrase it describes (iteration, len, in),
+		but matching and counting work on the slots directly, without listing the phrases.
+		A phrase ending in '$' takes the rest of the utterance as an argument.
+	"""
+
+	ARGUMENT = ARGUMENT
+
+	def __init__(self, alternatives):
+		self.alternatives = [[[str(synonym) for synonym in slot] for slot in alternative] for alternative in alternatives]
+		self.tokens = [  # The normalized synonyms of each slot, as tuples of words.
+			[[tuple(normalize(synonym).split()) for synonym in slot] for slot in alternative]
+			for alternative in self.alternatives
+		]
+
+	@classmethod
+	def from_phrases(cls, phrases):
+		""" Each phrase (a string) becomes an alternative with one slot per word. """
+		return cls([[[word] for word in phrase.split()] for phrase in phrases])
+
+	@property
+	def takes_argument(self):
+		""" Whether a synonym of a last slot ends in a '$' word, as `match` expects. """
+		return any(s and s[-1] == self.ARGUMENT for alternative in self.tokens for s in alternative[-1])
+
+	def match(self, utterance):
+		""" Returns (True, argument) if the utterance is one of the phrases, otherwise (False, None).
+			The argument is the text matched by a trailing '$' (or None).
+		"""
+		words = normalize(utterance).split()
+		for alternative in self.tokens:
+			positions = {0}  # The possible number of words consumed so far.
+			for i, slot in enumerate(alternative):
+				if i == len(alternative) - 1 and any(s and s[-1] == self.ARGUMENT for s in slot):
+					for position in sorted(positions):
+						for synonym in slot:
+							prefix = synonym[:-1]
+							if tuple(words[position:position + len(prefix)]) == prefix and position + len(prefix) < len(words):
+								return True, ' '.join(utterance.split()[position + len(prefix):])
+					positions = set()
+					break
+				positions = {p + len(s) for p in positions for s in slot if tuple(words[p:p + len(s)]) == s}
+				if not positions:
+					break
+			if len(words) in positions:
+				return True, None
+		return False, None
+
+	def __contains__(self, utterance):
+		return self.match(utterance)[0]
+
+	def __iter__(self):
+		""" Lists every phrase (this is the product of the synonyms, so prefer match). """
+		for alternative in self.alternatives:
+			yield from map(' '.join, it.product(*alternative))
+
+	def __len__(self):
+		return sum(math.prod(len(slot) for slot in alternative) for alternative in self.alternatives)
+
+	def __getitem__(self, index):
+		return next(it.islice(iter(self), index, None))
+
+	def patterns(self):
+		""" One compact string per alternative, eg: '(open|play) (spire|fire)'. """
+		slot = lambda synonyms: synonyms[0] if len(synonyms) == 1 else '(' + '|'.join(synonyms) + ')'
+		return [' '.join(map(slot, alternative)) for alternative in self.alternatives]
+
+	def __str__(self):
+		return ' / '.join(self.patterns())
+
+	def to_json(self):
+		return self.alternatives
+
 
 class Assistant(Device):
 	""" A decorator that allows a function to be called from google assistant. """
 	HEADERS = ['phrase']
+	FORMAT = os.environ.get('PYBIOSIS_ASSISTANT_FORMAT', 'json')  # 'json' or 'jsonl' (streamed, with an index).
 
 	@classmethod
 	@property
 	def DATA_FILE(self):
 		DATA_DIRECTORY = get_user_path() / '.compilers/assistant'
 		DATA_DIRECTORY.mkdir(parents=True, exist_ok=True)
-		return os.path.abspath(DATA_DIRECTORY / 'pybiosis.json')
+		return os.path.abspath(DATA_DIRECTORY / f'pybiosis.{self.FORMAT}')
+
+	@classmethod
+	@property
+	def AUTOMATON_FILE(self):
+		return os.path.splitext(self.DATA_FILE)[0] + '.automaton'
 
 	def __init__(self, phrase):
 		"""
 		 phrase can be a list of lists of words: [["wordA", "synonymA", "synonymB"], ["wordB"]]
 		 or they can be a list of words or a single phrase: ["wordA", "wordB", "wordC"] == "wordA wordB wordC"
+		 or a multi_phrase(...).
 
 		 this format is not accepted: ["wordA", ["wordB", "synonymB"]]
 		    instead it should be wrapped as in the first example.
 		"""
-		if isinstance(phrase, str):
-			self.phrase = [phrase]
+		if isinstance(phrase, PhraseGrammar):
+			self.phrase = phrase
+		elif isinstance(phrase, str):
+			self.phrase = PhraseGrammar.from_phrases([phrase])
 		else:
 			phrase_type = type(phrase[0])
 			assert all(type(p) == phrase_type for p in phrase)
 			if phrase_type == str:
-				self.phrase = phrase
+				self.phrase = PhraseGrammar.from_phrases(phrase)
 			else:  # container
 				self.phrase = multi_phrase(*phrase)
 
@@ -65,32 +159,66 @@ class Assistant(Device):
 	@classmethod
 	def compile(cls, functions):
 		general_execution_string = lambda f, args: f'python -c "import {f.module.__name__}; {f.module.__name__}.{f.name}({args})"'
-		execution_string = lambda f: general_execution_string(f, "'$'" if any(p[-1] == '$' for p in f.phrase) else '')
+		execution_string = lambda f: general_execution_string(f, "'$'" if f.phrase.takes_argument else '')
 
 		print(PRINTING_COLORS.device + f'\t{Assistant.__name__}: {len(functions)} Function(s). "Hey Google:"')
+		# In jsonl mode, each record is written as soon as it is made, along with an index entry for
+		# its identifier and each of its phrase patterns, so a reader can seek to it.
+		jsonl = cls.FORMAT == 'jsonl'
 		function_json = []
-		for i, f in enumerate(functions):
-			# Print
-			print_function_header(f, i)
-			print(PRINTING_COLORS.key + '\t\t\tCommand:', execution_string(f))
-			if len(f.phrase) == 1:
-				print(PRINTING_COLORS.key + '\t\t\tPhrases:', f.phrase[0])
-			else:
-				print(PRINTING_COLORS.key + '\t\t\tPhrases:', 'v'+'='*max(len(c) for c in f.phrase)+'v')
-				for command in f.phrase:
-					print('\t\t\t\t', command)
-			print()
-
-			for p in f.phrase:
-				function_json.append({
+		with (JsonlWriter(cls.DATA_FILE) if jsonl else contextlib.nullcontext()) as writer:
+			for i, f in enumerate(functions):
+				# Print
+				print_function_header(f, i)
+				print(PRINTING_COLORS.key + '\t\t\tCommand:', execution_string(f))
+				if len(f.phrase.alternatives) == 1:
+					print(PRINTING_COLORS.key + '\t\t\tPhrases:', f.phrase, f'({len(f.phrase)} variations)' if len(f.phrase) > 1 else '')
+				else:
+					print(PRINTING_COLORS.key + '\t\t\tPhrases:', f'{len(f.phrase)} variations')
+					for alternative in f.phrase.patterns():
+						print('\t\t\t\t', alternative)
+				print()
+
+				# The grammar is stored once per function, rather than once per phrase.
+				record = {
 					"title": f.title,
-					"phrase": p,
+					"function": f'{f.module.__name__}.{f.name}',
+					"phrases": f.phrase.to_json(),
 					"command": execution_string(f),
 					"start": str(get_user_path()),
-				})
+				}
+				if jsonl:
+					writer.write(record, keys=[record['function'], *f.phrase.patterns()])
+				else:
+					function_json.append(record)
 
-		with open(cls.DATA_FILE, "w") as file:
-			json.dump(function_json, file, indent=4)
+		if not jsonl:
+			with open(cls.DATA_FILE, "w") as file:
+				json.dump(function_json, file, indent=4)
+
+		# The matching side: resolves an utterance to "module.function" (and its '$' argument).
+		PhraseAutomaton.from_grammars([(f'{f.module.__name__}.{f.name}', f.phrase) for f in functions]).save(cls.AUTOMATON_FILE)
+
+	@classmethod
+	def lookup(cls, utterance):
+		""" Returns ("module.function", argument) for an utterance, using the compiled automaton, or None. """
+		return PhraseAutomaton.load(cls.AUTOMATON_FILE).lookup(utterance)
+
+	@classmethod
+	def record(cls, key):
+		""" Returns the compiled record for "module.function", a phrase pattern, or an utterance (or None).
+			In jsonl mode, only the matching record is read.
+		"""
+		if cls.FORMAT != 'jsonl':
+			with open(cls.DATA_FILE) as file:
+				records = json.load(file)
+			match = next((r for r in records if normalize(key) in map(normalize, (r['function'], *PhraseGrammar(r['phrases']).patterns()))), None)
+		else:
+			with JsonlReader(cls.DATA_FILE) as reader:
+				match = reader.get(key)
+		if match is None and (resolved := cls.lookup(key)):
+			return cls.record(resolved[0])
+		return match
 
 
 # This is the old version that worked with Push2Run and IFFFT, which is now useless.
@@ -3,13 +3,133 @@ from pathlib import Path
 import pybiosis.commands as commands
 import pybiosis.loader as loader
 import pybiosis.core as pybiosis
+import pybiosis.runtime as runtime
+from pybiosis.compilers.streamdeck import Layout
 import pybiosis.util.general as general
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import streamlit as st
-import ast
+import contextlib
+import traceback
+import threading
+import hashlib
+import time
+import sys
 import os
-
-
-def create_grid(num_rows: int, num_cols: int, button_info):
+import io
+
+
+class ThreadOutput(io.TextIOBase):
+	""" Sends the output of the capturing threads to their own buffer, and the rest to the stream it replaced.
+		It is only installed as sys.stdout/stderr while some thread captures its output (see capture).
+	"""
+	lock = threading.Lock()
+
+	def __init__(self, stream):
+		self.stream = stream
+		self.buffers = {}
+
+	def write(self, text):
+		return self.buffers.get(threading.get_ident(), self.stream).write(text)
+
+	def flush(self):
+		self.stream.flush()
+
+	@property
+	def encoding(self):
+		return getattr(self.stream, 'encoding', 'utf-8')
+
+	def isatty(self):
+		return False
+
+	@classmethod
+	@contextlib.contextmanager
+	def capture(cls, name, buffer):
+		""" Sends what this thread writes to sys.<name> into the buffer, during the block. """
+		thread = threading.get_ident()
+		with cls.lock:
+			router = getattr(sys, name)
+			if not isinstance(router, cls):
+				router = cls(router)
+				setattr(sys, name, router)
+			router.buffers[thread] = buffer
+		try:
+			yield
+		finally:
+			with cls.lock:
+				router.buffers.pop(thread, None)
+				if not router.buffers and getattr(sys, name) is router:  # Unless it was replaced meanwhile.
+					setattr(sys, name, router.stream)
+
+
+class Execution:
+	""" A function clicked in the GUI, with its status, timing and output. """
+	def __init__(self, identifier):
+		self.identifier = identifier
+		self.status = 'queued'  # queued, running, done or failed
+		self.submitted = time.time()
+		self.started = self.finished = None
+		self.output = io.StringIO()
+		self.error = None
+
+	@property
+	def duration(self):
+		return ((self.finished or time.time()) - (self.started or time.time()))
+
+
+class Executor:
+	""" Runs the functions in this process on a shared thread pool, so a click returns immediately
+		and several clicks run in parallel (up to max_workers). The last HISTORY executions are kept.
+	"""
+	HISTORY = 50
+
+	def __init__(self, max_workers):
+		self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pybiosis-gui')
+		self.executions = deque(maxlen=self.HISTORY)
+
+	def submit(self, function):
+		""" function is a Device function (from Device.FUNCTIONS). """
+		execution = Execution(f'{function.module.__name__}.{function.name}')
+		self.executions.append(execution)
+		self.pool.submit(self.run, execution, function)
+		return execution
+
+	def run(self, execution, function):
+		execution.status, execution.started = 'running', time.time()
+		try:
+			with ThreadOutput.capture('stdout', execution.output), ThreadOutput.capture('stderr', execution.output):
+				# The function is called through the runtime, with the policies of all its decorators (eg: the Device
+				# above a StreamDeck entry), rather than the registered wrapper, so a failure is reported here, not in a dialog.
+				runtime.call(function)
+			execution.status = 'done'
+		except BaseException as e:
+			execution.status, execution.error = 'failed', e
+			traceback.print_exc(file=execution.output)
+		finally:
+			execution.finished = time.time()
+
+
+@st.cache_resource
+def get_executor(max_workers):
+	return Executor(max_workers)
+
+
+def show_executions(executor):
+	icons = {'queued': '⏳', 'running': '🏃', 'done': '✅', 'failed': '❌'}
+	st.write("### Runs")
+	for execution in reversed(executor.executions):
+		label = f"{icons[execution.status]} {execution.identifier} ({execution.status}, {execution.duration:.2f}s)"
+		with st.expander(label, expanded=execution.status == 'running'):
+			st.code(execution.output.getvalue() or '(no output)')
+
+
+# Refreshes the runs every second without rerunning the page (when streamlit supports fragments).
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+if fragment:
+	show_executions = fragment(run_every=1)(show_executions)
+
+
+def create_grid(num_rows: int, num_cols: int, button_info, executor):
 	# Create a NxM grid of buttons with tooltips
 	for i in range(num_rows):
 		cols = st.columns(num_cols)
@@ -21,21 +141,70 @@ def create_grid(num_rows: int, num_cols: int, button_info):
 				function = button_info[button_info_idx]["function"]
 				button_clicked = st.button(button_label, help=tooltip, disabled=not bool(function))
 				if button_clicked:
-					identifier = f"{function['dot']}.{function['name']}"
-
-					file_path = Path(function['file']).resolve()
-					module_dir = file_path.parent
-					module_name = file_path.stem  # This is the filename without .py
-
-					# st.write(function, identifier)
-					command = (
-					    f'python -c "import sys; '
-					    f'sys.path.append(r\'{module_dir}\'); '
-					    f'import {module_name}; '
-					    f'getattr({module_name}, \'{function["name"]}\')()"'
-					)
-					os.system(command)
-					
+					executor.submit(function.function)  # Returns immediately, see the runs below the grid.
+
+
+class Button:
+	""" A StreamDeck button in the GUI layout. """
+	def __init__(self, name, dot, file, folder, coords, function):
+		self.name = name
+		self.function = function  # The Device function.
+		self.dot = dot  # The module, in dot syntax relative to the user path.
+		self.file = file
+		self.folder = folder
+		self.coords = coords
+
+	def __getitem__(self, key):  # Allows button['name'], as with the dictionaries used previously.
+		return getattr(self, key)
+
+
+def fingerprint(user_path):
+	""" Identifies the state of the user's modules (their paths, sizes and modification times). """
+	digest = hashlib.sha1()
+	for module in sorted(loader.get_user_modules()):
+		try:
+			stat = os.stat(str(user_path) + module)
+		except OSError:
+			continue
+		digest.update(f'{module}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+	return digest.hexdigest()
+
+
+def build_layout(functions, user_path):
+	""" Returns {folder: {"col,row": Button}} for the StreamDeck functions. """
+	layout = {}
+	for decorator, end_call in functions:
+		if not hasattr(end_call, 'location'):
+			continue
+		dot = str(Path(end_call.module.__file__).relative_to(user_path)).replace(os.sep, '.').replace('.py', '')
+		locations = [end_call.location] if isinstance(end_call.location, str) else end_call.location
+		for location in locations:
+			location = str(location).replace('\n', '_')
+			if location.startswith(Layout.AUTO_PREFIX):
+				continue  # Placed when compiling, so it has no fixed coordinates.
+			folder, _, coords = location.rpartition('/')
+			folder = folder.strip('/')
+			layout.setdefault(folder, {})[coords] = Button(str(end_call.name), dot, str(Path(end_call.module.__file__)), folder, coords, end_call)
+	return layout
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading Commands...")
+def load_layout(user_path, fingerprint):
+	""" Loads the user modules and builds the layout. Streamlit reruns main() on every interaction,
+		so this only runs again when the user files change (a new fingerprint), and max_entries keeps one layout.
+	"""
+	user_path = Path(user_path)
+	with general.ChangeDir(user_path):
+		get_reloader(str(user_path)).poll()  # Only the changed modules (and their importers) are executed again.
+		pybiosis.load()
+		return build_layout(pybiosis.Device.FUNCTIONS, user_path)
+
+
+@st.cache_resource
+def get_reloader(user_path):
+	from pybiosis.reloader import Reloader, PollingWatcher
+	return Reloader(user_path, watcher=PollingWatcher(user_path))  # Polled when the fingerprint changes.
+
 
 def main():
 	st.set_page_config(layout="wide")
@@ -44,52 +213,17 @@ def main():
 
 	tabs = st.tabs(["StreamDeck", "Assistant", "Scheduler", "CLI", ])
 	with tabs[0]:
-		with st.spinner("Loading Commands..."):
-			layout = {}
-			user_path = loader.get_user_path()
-			with general.ChangeDir(user_path):
-				pybiosis.load()
-				for decorator, end_call in pybiosis.Device.FUNCTIONS:
-					if hasattr(end_call, 'location'):
-						dot = str(Path(end_call.module.__file__).relative_to(user_path)).replace(os.sep, '.').replace('.py', '')
-						location = str(end_call.location).replace('\n', '_')
-						layout[location] = {'dot': dot, 'name': str(end_call.name), 'file': str(Path(end_call.module.__file__))}
-
-
-			grouped_data = {}
-			for string_key in layout:
-				try:
-					key = ast.literal_eval(string_key)
-				except:
-					key = string_key
-
-				if isinstance(key, str):
-					prefix, coords = key.rsplit('/', 1)
-					prefix = prefix.strip('/')
-					if prefix not in grouped_data:
-						grouped_data[prefix] = []
-					grouped_data[prefix].append( {**layout[string_key], 'coords': coords})
-				else:
-					for subkey in key:
-						if '/' in subkey:
-							prefix, coords = subkey.rsplit('/', 1)
-							prefix = prefix.strip('/')
-						else:
-							prefix, coords = '', subkey
-
-						if prefix not in grouped_data:
-							grouped_data[prefix] = []
-						grouped_data[prefix].append( {**layout[string_key], 'coords': coords})
-
-		NUM_ROWS = 3
-		NUM_COLS = 5
+		user_path = loader.get_user_path()
+		grouped_data = load_layout(str(user_path), fingerprint(user_path))
+		executor = get_executor(int(os.getenv('PYBIOSIS_GUI_WORKERS', 4)))
+
+		NUM_ROWS = pybiosis.StreamDeck.NUM_ROWS
+		NUM_COLS = pybiosis.StreamDeck.NUM_COLUMNS
 		st.write("### StreamDeck")
 		location = st.selectbox(f"Select a location: ", sorted([g for g in grouped_data if (',' not in g)]))
 		st.write('---')
 
-		mapping = {}
-		for function in grouped_data[location]:
-			mapping[function['coords']] = function
+		mapping = grouped_data.get(location, {})
 		button_info = [  # Define labels and tool tips for buttons
 		    {
 		    	"label": mapping.get(f"{i},{j}", {'name': f'{i},{j}'})['name'],
@@ -98,7 +232,9 @@ def main():
 		    	"function": mapping.get(f"{i},{j}"),
 		    } for j in range(NUM_ROWS) for i in range(NUM_COLS)
 		]
-		create_grid(NUM_ROWS, NUM_COLS, button_info)
+		create_grid(NUM_ROWS, NUM_COLS, button_info, executor)
+		st.write('---')
+		show_executions(executor)
 
 
 	for tab in tabs[1:]:
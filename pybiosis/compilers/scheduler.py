@@ -39,14 +39,18 @@ R""" Provides a decorator and wrapper for the Windows Scheduler.
 
 import pybiosis.validate as validate
 from pybiosis.core import PRINTING_COLORS, Device, print_function_header
-from pybiosis.utility import command, save_function
+from pybiosis.utility import save_function
 from pybiosis.loader import get_user_path
+from pybiosis.scheduling.triggers import Trigger, NOW_DELAY
+from pybiosis.scheduling.schtasks import TaskSchedulerBackend, render_task
+from pybiosis.scheduling.cron import CronBackend, shell_command
+from pybiosis.scheduling.systemd import SystemdBackend, render_units
 from pathlib import Path
-from io import StringIO
 import datetime as dt
-import subprocess
 import inspect
+import json
 import glob
+import sys
 import os
 
 
@@ -57,12 +61,19 @@ class Scheduler(Device):
 	EXE = "schtasks"
 	HEADERS = ['values']
 	TASKNAME_PREFIX = "PYBIOSIS_"
+	BACKENDS = ['schtasks', 'cron', 'systemd']
+	BACKEND = os.getenv('PYBIOSIS_SCHEDULER_BACKEND', 'schtasks')  # cron and systemd edit the user's crontab/units, so they are opt-in.
 
 	@classmethod
 	@property
 	def TEMP_PATH(self):
 		return get_user_path() / '.compilers/scheduler'
 
+	@classmethod
+	@property
+	def STARTS_PATH(self):
+		return get_user_path() / '.compilers/scheduler_starts.json'
+
 	def __init__(self, trigger, modifier=None, start=None, end=None, day=None, month=None, idle=None):
 		self.values = locals()
 		del self.values['self']
@@ -73,9 +84,18 @@ class Scheduler(Device):
 
 	@staticmethod
 	def compile(functions):
-		validate.require_windows()
-		Scheduler.clear()		
-		print(PRINTING_COLORS.device + f'\t{Scheduler.__name__}: {len(functions)} Function(s)')
+		if Scheduler.BACKEND not in Scheduler.BACKENDS:
+			raise validate.InvalidEnvironment(f"Unknown scheduler backend {Scheduler.BACKEND}, expected one of: {', '.join(Scheduler.BACKENDS)}.")
+		if Scheduler.BACKEND == 'schtasks' and os.name != validate.WINDOWS_OS_NAME:
+			raise validate.InvalidEnvironment("Must compile on Windows, or set PYBIOSIS_SCHEDULER_BACKEND to cron or systemd (or run `bb schedule --run`).")
+		print(PRINTING_COLORS.device + f'\t{Scheduler.__name__}: {len(functions)} Function(s) using {Scheduler.BACKEND}')
+
+		# Each function becomes one task, with a trigger for each of its Scheduler decorators.
+		tasks = {}  # {task name: (function, [triggers])}
+		try:
+			starts = json.loads(Scheduler.STARTS_PATH.read_text())
+		except (FileNotFoundError, json.JSONDecodeError):
+			starts = {}
 		for i, f in enumerate(functions):
 			# Print
 			print_function_header(f, i)
@@ -83,115 +103,56 @@ class Scheduler(Device):
 				print(PRINTING_COLORS.key+f'\t\t\t{k.title()}:', v)
 			print()
 
-			# Process
-			module_name = inspect.getmodule(f).__name__
-			function_name = f.name
-			file = save_function(Scheduler.TEMP_PATH, f.__name__+'_'+str(id(f)), Rf'''cd /d {get_user_path()} && python -c "import {module_name}; {module_name}.{function_name}();"''', f=f)
-			failure = Scheduler.create(function_name, file, **f.values)
-			if failure:
-				raise ValueError(function_name + " failed with " + failure)
+			name = Scheduler.TASKNAME_PREFIX + f'{inspect.getmodule(f).__name__}.{f.name}'
+			tasks.setdefault(name, (f, []))[1].append(Trigger.from_values(Scheduler.pin_now(f.values, name, starts)))
+
+		Scheduler.STARTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+		Scheduler.STARTS_PATH.write_text(json.dumps({name: start for name, start in starts.items() if name in tasks}, indent=4))
+		getattr(Scheduler, 'compile_' + Scheduler.BACKEND)(tasks)
 
 	@staticmethod
-	def get_tasks(custom=False):
-		""" Returns a list of scheduled tasks. """
-		command_output = subprocess.run(['schtasks.exe', '/query', '/fo', 'CSV', '/nh'], capture_output=True, text=True)
-		output_lines = command_output.stdout.strip().split('\n')
-		names = [line.split(',')[0] for line in output_lines]
-		if custom:
-			return [n.strip('"') for n in names if n.strip('"').strip("/").strip("\\").startswith(Scheduler.TASKNAME_PREFIX)]
-		else:
-			return names
+	def pin_now(values, name, starts):
+		""" Replaces a start of 'now' with the time it was first compiled at (kept in starts by task name),
+			so that the task is the same every compile, and isn't registered again.
+		"""
+		if str(values.get('start') or '').strip().lower() != 'now':
+			return values
+		if name not in starts:
+			starts[name] = (dt.datetime.now() + NOW_DELAY).strftime('%Y/%m/%d-%H:%M')
+		return {**values, 'start': starts[name]}
 
 	@staticmethod
-	def clear():
-		""" Deletes all custom tasks. """
-		
-		# Remove from task scheduler
+	def compile_schtasks(tasks):
+		# The batch files are named after the task, so unchanged tasks keep pointing to the same file.
+		desired = {}
+		for name, (f, triggers) in tasks.items():
+			module_name = inspect.getmodule(f).__name__
+			file = save_function(Scheduler.TEMP_PATH, name, Rf'''cd /d {get_user_path()} && python -c "import {module_name}; {module_name}.{f.name}();"''', f=f)
+			desired[name] = render_task(triggers, file, description=f.title, working_directory=get_user_path())
+		stale = [file for file in glob.glob(str(Scheduler.TEMP_PATH / '*.*')) if Path(file).stem not in tasks]
+		for file in stale:
+			os.remove(file)
+
 		try:
-			for task in Scheduler.get_tasks(custom=True):
-				command([Scheduler.EXE, '/delete', '/f', '/tn', task])		
+			created, updated, deleted = TaskSchedulerBackend(Scheduler.TEMP_PATH / 'xml', prefix=Scheduler.TASKNAME_PREFIX).sync(desired)
 		except ValueError as e:
 			if str(e).startswith('ERROR: Access is denied.'):
-				raise PermissionError("Tasks cannot be cleared. Please compile with administrative privileges.")
+				raise PermissionError("Tasks cannot be updated. Please compile with administrative privileges.")
 			raise
+		print(PRINTING_COLORS.key + f'\t\tCreated {len(created)}, updated {len(updated)}, deleted {len(deleted)} and kept {len(tasks) - len(created) - len(updated)} task(s).')
 
-		# Remove batch files
-		for f in glob.glob(str(Scheduler.TEMP_PATH / '*')):
-			os.remove(f)
-		
 	@staticmethod
-	def create(name, action, trigger, modifier, start, end, day, month, idle):
-		R""" Schedules a command to execute according to the schedule.
-			trigger: minute, hourly, daily, monthly, once/onstart/onlogon/(onidle with \i #)
-			modifier: sc amount (#)
-				monthly: lastday, (FIRST, SECOND, THIRD, FOURTH along with the /d <day> parameter)
-			day: MON etc or #
-			month: FEB etc or *
-			st/sd and et/ed: yyyy/MM/dd-hh:mm
-		
-			eg:
-				Every other month 21st day of the month at midnight for a year, from July 2, 2002 to June 30, 2003
-				/sc monthly /mo 2 /d 21 /st 00:00 /sd 2002/07/01 /ed 2003/06/30
-				create("test_task", R'C:\Program Files\Internet Explorer\iexplore.exe'
-					'monthly', 2, '2002/07/01-00:00', day=21
-				)
-
-			Returns if there was a failure.
-		"""
-		arguments = [Scheduler.EXE,
-			'/create',
-			'/tn', 'PYBIOSIS_'+name,
-			'/tr', action,
-			'/f',
-			# '/z'  # Doesn't seem to work
-		]
-		if start:
-			if start == 'now':  # This may need more work...
-				delay = 2  # minutes
-				start_date, start_time = dt.datetime.today().strftime("%Y/%m/%d-%H:%M").split('-')
-				h, m = start_time.split(':')
-
-				# Increment to the next hour if the delay means the there are more than 60 minutes.
-				h = h if int(m) + delay < 60 else h + 1
-				m = max(int(m) + delay, 59)
-
-				start_time = f'{h}:{m:02}'
-			elif '-' in start:
-				start_date, start_time = start.split('-')
-			else:
-				start_date, start_time = start, None
-		else:
-			start_date, start_time = None, None
-
-		if end:
-			if '-' in end:
-				end_date, end_time = end.split('-')
-			else:
-				end_date, end_time = end, None
-		else:
-			end_date, end_time = None, None
-
-		flags = {
-			'/sc': trigger,
-			'/mo': modifier,
-			'/sd': start_date,
-			'/st': start_time,
-			'/ed': end_date,
-			'/et': end_time,
-			'/m': month,
-			'/d': day,
-			'/i': idle,
-		}
-		for flag, value in flags.items():
-			if value is not None:
-				arguments.extend([flag, str(value)])
-		try:
-			response = command(arguments)
-			if response.startswith('SUCCESS'):
-				return False
-		except Exception as e:
-			return str(e).strip()
-
-		return True
-
+	def compile_cron(tasks):
+		entries = {name: (triggers, shell_command(get_user_path(), sys.executable, inspect.getmodule(f).__name__, f.name)) for name, (f, triggers) in tasks.items()}
+		changed = CronBackend().sync(entries)
+		print(PRINTING_COLORS.key + f'\t\t{"Installed" if changed else "Kept"} the crontab with {len(tasks)} task(s).')
 
+	@staticmethod
+	def compile_systemd(tasks):
+		units = {}
+		for name, (f, triggers) in tasks.items():
+			module_name = inspect.getmodule(f).__name__
+			exec_start = f"{sys.executable} -c 'import {module_name}; {module_name}.{f.name}()'"
+			units.update(render_units(name, triggers, get_user_path(), exec_start, description=f.title))
+		written, removed = SystemdBackend().sync(units)
+		print(PRINTING_COLORS.key + f'\t\tWrote {len(written)} and removed {len(removed)} unit(s), of {len(units)}.')
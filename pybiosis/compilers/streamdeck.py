@@ -2,29 +2,37 @@ import pybiosis.validate as validate
 from pybiosis.core import PRINTING_COLORS, Device, print_function_header
 from pybiosis.utility import save_function
 from pybiosis.loader import get_user_path
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
 import time
 import json
+import uuid
 import shutil
 import glob
 
 class StreamDeck(Device):
 	""" A decorator that allows a function to be called from a StreamDeck button. """
 
-	HEADERS = ['location', 'image', 'setter']
-	NUM_ROWS = 3
-	NUM_COLUMNS = 5
+	HEADERS = ['location', 'image', 'setter', 'profile']
+	NUM_ROWS = int(os.getenv('PYBIOSIS_DECK_ROWS', 3))
+	NUM_COLUMNS = int(os.getenv('PYBIOSIS_DECK_COLUMNS', 5))
+	IMAGE_DIRECTORY = 'Images'
 
 	@classmethod
 	@property
 	def TEMP_PATH(self):
 		return get_user_path() / '.compilers/streamdeck'
 	
-	def __init__(self, location, image=None, setter=None): 
+	def __init__(self, location, image=None, setter=None, profile=None): 
+		""" location can be 'Folder/col,row', a list of them, or 'auto:Folder' to be placed automatically.
+			profile is the name or identifier of the StreamDeck profile (or a list of them).
+			If it is omitted, PYBIOSIS_PROFILE_ID or the first profile is used.
+		"""
 		self.location = location
 		self.image = image
 		self.setter = setter
+		self.profile = profile
 
 	def __call__(self, func):
 		func = super().__call__(func)
@@ -36,21 +44,33 @@ class StreamDeck(Device):
 	def compile(functions):
 		validate.require_windows()
 		execution_string = lambda f: f'cd /d {get_user_path()} && python -c "import {f.module.__name__}; {f.module.__name__}.{f.name}();"'
+		DECK_EXE = R'"C:\Program Files\Elgato\StreamDeck\StreamDeck.exe"'
+		DECK_PROFILES = os.path.join(os.getenv('APPDATA', ''), 'Elgato', 'StreamDeck', 'ProfilesV2')
 		try:
-			DECK_EXE = R'"C:\Program Files\Elgato\StreamDeck\StreamDeck.exe"'
-			DECK_PROFILES = fR"{os.getenv('APPDATA')}\Elgato\StreamDeck\ProfilesV2"
-			DECK_PROFILE_IDENTIFIER = os.getenv('PYBIOSIS_PROFILE_ID', os.listdir(DECK_PROFILES)[0].replace('.sdProfile', ''))
-		except FileNotFoundError as e:
-			raise validate.InvalidEnvironment(f"StreamDeck.exe could not be found in Program Files. ({DECK_EXE})")
-		DECK_PROFILE_PATH = fR"{DECK_PROFILES}\{DECK_PROFILE_IDENTIFIER}.sdProfile"
-		IMAGE_DIRECTORY = 'Images'
-
-		if os.system('powershell.exe -command "taskkill /IM Streamdeck.exe /T /F | out-null"') == 0:  # Requires terminal with admin priv.
-			time.sleep(1)
-		folders = get_folders(DECK_PROFILE_PATH)
-		print(PRINTING_COLORS.device+f'\t{StreamDeck.__name__}: {len(functions)} Function(s)')
+			profiles = get_profiles(DECK_PROFILES)
+		except FileNotFoundError:
+			raise validate.InvalidEnvironment(f"The StreamDeck profiles could not be found in {DECK_PROFILES}, is StreamDeck installed? ({DECK_EXE})")
+		DECK_PROFILE_IDENTIFIER = os.getenv('PYBIOSIS_PROFILE_ID') or next(iter(profiles), None)
+		if DECK_PROFILE_IDENTIFIER is None:
+			raise validate.InvalidEnvironment(f"There are no StreamDeck profiles in {DECK_PROFILES}, create one in StreamDeck first (or set PYBIOSIS_PROFILE_ID).")
+
+		# Route each function to its profile(s).
+		targets = {}  # {profile identifier: [functions]}
+		for f in functions:
+			for profile in ([f.profile] if isinstance(f.profile, str) or f.profile is None else f.profile):
+				targets.setdefault(resolve_profile(profiles, profile or DECK_PROFILE_IDENTIFIER), []).append(f)
+
+		# Every location is resolved (and checked for collisions) before anything on disk is modified.
+		# The buttons that pybiosis didn't write are kept, so the functions are placed around them.
+		layouts = {ID: Layout(StreamDeck.NUM_ROWS, StreamDeck.NUM_COLUMNS) for ID in targets}
+		profile_path = lambda ID: os.path.join(DECK_PROFILES, f'{ID}.sdProfile')
+		placements = {ID: layouts[ID].plan(fs, unmanaged_buttons(profile_path(ID))) for ID, fs in targets.items()}
+
+		print(PRINTING_COLORS.device+f'\t{StreamDeck.__name__}: {len(functions)} Function(s) in {len(targets)} Profile(s)')
 		for f in glob.glob(str(StreamDeck.TEMP_PATH / '*')):
 			os.remove(f)
+
+		files = {}
 		for i, f in enumerate(functions):
 
 			if f.setter:
@@ -59,63 +79,332 @@ class StreamDeck(Device):
 			# Print
 			print_function_header(f, i)
 			print(PRINTING_COLORS.key+f'\t\t\tCommand:', execution_string(f))
-			print(PRINTING_COLORS.key+f'\t\t\tLocation:', str(f.location).replace('\n', ' '))
+			for ID in targets:
+				if f in placements[ID]:
+					print(PRINTING_COLORS.key+f'\t\t\tLocation:', f'{profiles[ID]}:', str(placements[ID][f]).replace('\n', ' '))
 			print(PRINTING_COLORS.key+f'\t\t\tImage:', f.image)
 			print(PRINTING_COLORS.key+f'\t\t\tName:', '|'.join([f.__name__, f.name, f.title]))
 
 			# Process
-			file = save_function(StreamDeck.TEMP_PATH, f.__name__+'_'+str(id(f)), execution_string(f), f=f)
-			locations = [f.location] if isinstance(f.location, str) else f.location  # single location or list of them.
-			for location in locations:
-				if '/' in location:
-					folder, coords = location.rsplit('/', 1)
-					# folder = folder.rstrip('/')  # Ignore duplicate /'s that may pass through, eg: location//1,3
-					if folder not in folders:
-						raise ValueError(f'Could not find the folder "{folder}" for function "{f.name}" in {location}, {f.module}.')
-					folder_ID = folders[folder]
-					folder_path = DECK_PROFILE_PATH + f'/Profiles/{folder_ID}.sdProfile/'
-				else:
-					coords = location
-					folder_path = DECK_PROFILE_PATH
+			files[f] = save_function(StreamDeck.TEMP_PATH, f.__name__+'_'+str(id(f)), execution_string(f), f=f)
+
+		killed = os.system('powershell.exe -command "taskkill /IM Streamdeck.exe /T /F | out-null"') == 0  # Requires terminal with admin priv.
+		if killed:
+			time.sleep(1)
+
+		try:
+			# Profiles don't share any files, so they are written concurrently. One failing doesn't stop the others.
+			with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+				jobs = {ID: pool.submit(write_profile, profile_path(ID), layouts[ID], placements[ID], files) for ID in targets}
+			failed = {ID: job.exception() for ID, job in jobs.items() if job.exception()}
+			if failed:
+				errors = '; '.join(f'"{profiles[ID]}" [{ID}] ({type(e).__name__}: {e})' for ID, e in failed.items())
+				raise ValueError(f'Could not write the StreamDeck profile(s): {errors}') from next(iter(failed.values()))
+		finally:
+			if functions or killed:  # The application is restarted once, after every profile is written (or one failed).
+				os.system(Rf'start "" /max {DECK_EXE} --runinbk')
+
+
+def get_profiles(profiles_path):
+	""" Returns {identifier: name} for the profiles in the ProfilesV2 directory. """
+	profiles = {}
+	for directory in sorted(os.listdir(profiles_path)):
+		if not directory.endswith('.sdProfile'):
+			continue
+		ID = directory.replace('.sdProfile', '')
+		try:
+			profiles[ID] = json.load(open(os.path.join(profiles_path, directory, 'manifest.json'))).get('Name', ID)
+		except (FileNotFoundError, json.decoder.JSONDecodeError):
+			profiles[ID] = ID
+	return profiles
+
+
+def resolve_profile(profiles, profile):
+	""" Accepts either a profile identifier or a profile name. """
+	if profile in profiles:
+		return profile
+	matches = [ID for ID, name in profiles.items() if name == profile]
+	if len(matches) != 1:
+		raise ValueError(f'Could not find a unique StreamDeck profile "{profile}" in: {", ".join(map(str, profiles.values()))}.')
+	return matches[0]
+
+
+OPEN_ACTION = 'com.elgato.streamdeck.system.open'
+FOLDER_ACTION = 'com.elgato.streamdeck.profile.openchild'
+BACK_ACTION = 'com.elgato.streamdeck.profile.backtoparent'
+
+
+def managed(action):
+	""" Whether a button was written by pybiosis: a function's button, or a folder it created. """
+	settings = action.get('Settings', {})
+	if action.get('UUID') == OPEN_ACTION:
+		return os.path.normcase(str(StreamDeck.TEMP_PATH)) in os.path.normcase(str(settings.get('path', '')))
+	return action.get('UUID') == FOLDER_ACTION and settings.get('pybiosis', False)
+
+
+def folder_manifest_path(profile_path, ID=None):
+	return profile_path + (f'/Profiles/{ID}.sdProfile' if ID else '')
+
+
+def unmanaged_buttons(profile_path, ID=None, folder=''):
+	""" Returns {folder: {coords: description}} of the buttons pybiosis didn't write. A folder it created is
+		only kept (and so occupies its button) while it holds such buttons, see clean_profile.
+	"""
+	try:
+		manifest = json.load(open(folder_manifest_path(profile_path, ID) + '/manifest.json'))
+	except FileNotFoundError:
+		return {}
+	buttons = {folder: {}}
+	for coords, action in manifest['Actions'].items():
+		title = (action.get('States') or [{}])[0].get('Title') or action.get('Name', '')
+		if action.get('UUID') == FOLDER_ACTION:
+			nested = unmanaged_buttons(profile_path, action['Settings']['ProfileUUID'], f'{folder}/{title}'.strip('/'))
+			if not managed(action) or any(nested.values()):
+				buttons[folder][coords] = f'the folder "{title}"'
+				buttons.update(nested)
+		elif action.get('UUID') != BACK_ACTION and not managed(action):
+			buttons[folder][coords] = f'the button "{title}"'
+	return buttons
+
+
+def clean_profile(profile_path, ID=None):
+	""" Removes the buttons pybiosis wrote (they are written again), and the folders it created that hold nothing else.
+		Returns whether the folder still holds any button.
+	"""
+	folder_path = folder_manifest_path(profile_path, ID)
+	manifest = json.load(open(folder_path + '/manifest.json'))
+	for coords, action in list(manifest['Actions'].items()):
+		if action.get('UUID') == FOLDER_ACTION:
+			child = action['Settings']['ProfileUUID']
+			try:
+				empty = not clean_profile(profile_path, child)
+			except FileNotFoundError:
+				empty = True
+			if empty and managed(action):
+				del manifest['Actions'][coords]
+				shutil.rmtree(folder_manifest_path(profile_path, child), ignore_errors=True)
+		elif managed(action):
+			del manifest['Actions'][coords]
+			shutil.rmtree(f'{folder_path}/{coords}', ignore_errors=True)  # Its custom image.
+	json.dump(manifest, open(folder_path + '/manifest.json', 'w'), indent=4)
+	return any(action.get('UUID') != BACK_ACTION for action in manifest['Actions'].values())
+
+
+def write_profile(profile_path, layout, placements, files):
+	""" Writes the planned buttons into a single profile, replacing the ones written before. """
+	clean_profile(profile_path)
+	folders = get_folders(profile_path)
+	layout.create_folders(profile_path, folders)
 
-				
+	manifests = {}  # Each manifest is loaded and written once, regardless of how many buttons it holds.
+	for f, locations in placements.items():
+		for location in locations:
+			if '/' in location:
+				folder, coords = location.rsplit('/', 1)
+				# folder = folder.rstrip('/')  # Ignore duplicate /'s that may pass through, eg: location//1,3
+				if folder not in folders:
+					raise ValueError(f'Could not find the folder "{folder}" for function "{f.name}" in {location}, {f.module}.')
+				folder_ID = folders[folder]
+				folder_path = profile_path + f'/Profiles/{folder_ID}.sdProfile/'
+			else:
+				coords = location
+				folder_path = profile_path
+
+			if folder_path not in manifests:
 				try:
-					folder_manifest = json.load(open(folder_path + '/manifest.json'))
+					manifests[folder_path] = json.load(open(folder_path + '/manifest.json'))
 				except FileNotFoundError:
 					continue
-				folder_manifest['Actions'][coords] = {
-					'Name': 'Open',
-					'Settings': {
-						'openInBrowser': True,
-						'path': str(file),
-					},
+			folder_manifest = manifests[folder_path]
+			folder_manifest['Actions'][coords] = {
+				'Name': 'Open',
+				'Settings': {
+					'openInBrowser': True,
+					'path': str(files[f]),
+				},
+				'State': 0,
+				'States': [{'FFamily': '',
+					'FSize': '9',
+					'FStyle': '',
+					'FUnderline': 'off',
+					'Image': 'state0.png',
+					'Title': f.title,
+					'TitleAlignment': 'top',
+					'TitleColor': '#ffffff',
+					'TitleShow': ''
+				}],
+				'UUID': OPEN_ACTION
+			}
+
+			# Image Support
+			if f.image:
+				image_path = get_user_path() / StreamDeck.IMAGE_DIRECTORY / f.image
+				state_path = f'{folder_path}/{coords}/CustomImages'
+				if f.image == 'default':
+					Path(f'{state_path}/state0.png').unlink(missing_ok=True)
+					shutil.rmtree(state_path, ignore_errors=True)
+				else:
+					Path(state_path).mkdir(parents=True, exist_ok=True)
+					shutil.copyfile(image_path, f'{state_path}/state0.png')
+	for folder_path, folder_manifest in manifests.items():
+		json.dump(folder_manifest, open(f'{folder_path}/manifest.json', 'w'), indent=4)
+
+
+class Layout:
+	""" Resolves the locations of every StreamDeck function before anything is written.
+
+		Explicit locations ('Folder/col,row') are indexed once to find collisions (with each other and with the buttons
+		already on the deck), while 'auto:Folder' locations are packed into the free buttons of that folder.
+		When a folder is full, the last free button opens a nested 'Page N' folder that continues the group.
+		The folders to create get the first free button of their parent, and the back button (0,0) of every folder
+		is always reserved. Everything that doesn't fit is reported here, before the profile is touched.
+	"""
+
+	AUTO_PREFIX = 'auto:'
+	BACK_BUTTON = '0,0'
+	PAGE_NAME = 'Page {}'
+
+	def __init__(self, rows, columns):
+		self.rows = rows
+		self.columns = columns
+		self.occupied = {}  # {folder: {coords: function, or the description of a button on the deck}}
+		self.folders = {}  # {folder path to create: coords of its button in the parent, or None to pick one}
+
+	@property
+	def slots(self):
+		""" The buttons of a folder in reading order, excluding the back button. """
+		return [f'{col},{row}' for row in range(self.rows) for col in range(self.columns) if f'{col},{row}' != self.BACK_BUTTON]
+
+	@staticmethod
+	def split(location):
+		if '/' in location:
+			return location.rsplit('/', 1)
+		return '', location
+
+	def plan(self, functions, existing=None):
+		""" Returns {function: [locations]} with every 'auto:' location resolved, around the existing buttons
+			({folder: {coords: description}}, see unmanaged_buttons). Raises a ValueError listing every collision, if there are any.
+		"""
+		for folder, buttons in (existing or {}).items():
+			self.occupied.setdefault(folder, {}).update(buttons)
+		placements = {f: [] for f in functions}
+		groups = {}  # {folder: [functions]}, preserving the order of registration.
+		collisions = []
+		for f in functions:
+			for location in ([f.location] if isinstance(f.location, str) else f.location):
+				if location.startswith(self.AUTO_PREFIX):
+					groups.setdefault(location[len(self.AUTO_PREFIX):].strip('/'), []).append(f)
+					continue
+
+				folder, coords = self.split(location)
+				buttons = self.occupied.setdefault(folder, {})
+				if coords in buttons and buttons[coords] is not f:
+					owner = buttons[coords]
+					collisions.append(f'{location}: {owner if isinstance(owner, str) else owner.name} and {f.name}')
+				buttons.setdefault(coords, f)
+				placements[f].append(location)
+
+		if collisions:
+			raise ValueError('StreamDeck locations are used by multiple functions:\n\t' + '\n\t'.join(collisions))
+
+		for group, members in groups.items():
+			self.folders.setdefault(group, None)
+			self.pack(group, members, placements, page=1)
+
+		if existing is not None:
+			missing = {self.split(l)[0] for ls in placements.values() for l in ls} - set(existing) - set(self.folders) - {''}
+			if missing:
+				raise ValueError(f'Could not find the StreamDeck folder(s): {", ".join(sorted(missing))}')
+		self.place_folders(existing or {})
+		return placements
+
+	def place_folders(self, existing):
+		""" Picks the button of each folder to create (the first free one of its parent), so that a full parent
+			is reported before anything is written. The folders in existing are already on the deck.
+		"""
+		for path in list(self.folders):
+			parts = path.split('/')
+			for depth in range(1, len(parts) + 1):
+				sub_path = '/'.join(parts[:depth])
+				if sub_path in existing or self.folders.get(sub_path) is not None:
+					continue
+				parent = '/'.join(parts[:depth - 1])
+				buttons = self.occupied.setdefault(parent, {})
+				free = [c for c in self.slots if c not in buttons]
+				if not free:
+					raise ValueError(f'There is no room in "{parent or "/"}" for the folder "{parts[depth - 1]}".')
+				buttons[free[0]] = None
+				self.folders[sub_path] = free[0]
+
+	def pack(self, folder, members, placements, page):
+		# Iterative rather than recursive, since large groups can span many pages.
+		remaining = members
+		while remaining:
+			buttons = self.occupied.setdefault(folder, {})
+			free = [coords for coords in self.slots if coords not in buttons]
+			if not free:
+				raise ValueError(f'There is no room in "{folder}" to place: {", ".join(f.name for f in remaining)}')
+
+			if len(remaining) > len(free):  # The last button continues onto the next page.
+				if len(free) == 1:
+					raise ValueError(f'There is no room in "{folder}" to place: {", ".join(f.name for f in remaining)}')
+				*free, next_page = free
+			else:
+				next_page = None
+
+			for coords, f in zip(free, remaining):
+				buttons[coords] = f
+				placements[f].append(f'{folder}/{coords}')
+			remaining = remaining[len(free):]
+
+			if next_page:
+				page += 1
+				buttons[next_page] = None
+				folder = f'{folder}/{self.PAGE_NAME.format(page)}'
+				self.folders[folder] = next_page
+
+	def create_folders(self, profile_path, folders):
+		""" Creates the manifests for any planned folder that does not exist yet. Updates `folders` in place. """
+		for path in self.folders:
+			parts = path.split('/')
+			for depth in range(1, len(parts) + 1):
+				sub_path = '/'.join(parts[:depth])
+				if sub_path not in folders:
+					folders[sub_path] = self.create_folder(profile_path, folders, sub_path, self.folders.get(sub_path))
+
+	def create_folder(self, profile_path, folders, path, coords):
+		parent, title = path.rsplit('/', 1) if '/' in path else ('', path)
+		parent_path = profile_path + (f'/Profiles/{folders[parent]}.sdProfile' if parent else '')
+		parent_manifest = json.load(open(parent_path + '/manifest.json'))
+
+		ID = str(uuid.uuid4()).upper()
+		root_manifest = json.load(open(profile_path + '/manifest.json'))
+		folder_path = Path(profile_path) / 'Profiles' / f'{ID}.sdProfile'
+		folder_path.mkdir(parents=True)
+		json.dump({
+			'Actions': {
+				self.BACK_BUTTON: {
+					'Name': 'Parent Folder',
+					'Settings': {},
 					'State': 0,
-					'States': [{'FFamily': '',
-						'FSize': '9',
-						'FStyle': '',
-						'FUnderline': 'off',
-						'Image': 'state0.png',
-						'Title': f.title,
-						'TitleAlignment': 'top',
-						'TitleColor': '#ffffff',
-						'TitleShow': ''
-					}],
-					'UUID': 'com.elgato.streamdeck.system.open'
-				}
-
-				# Image Support
-				if f.image:
-					image_path = get_user_path() / IMAGE_DIRECTORY / f.image
-					state_path = f'{folder_path}/{coords}/CustomImages'
-					if f.image == 'default':
-						Path(f'{state_path}/state0.png').unlink(missing_ok=True)
-						shutil.rmtree(state_path, ignore_errors=True)
-					else:
-						Path(state_path).mkdir(parents=True, exist_ok=True)
-						shutil.copyfile(image_path, f'{state_path}/state0.png')
-				json.dump(folder_manifest, open(f'{folder_path}/manifest.json', 'w'), indent=4)
-		if functions:
-			os.system(Rf'start "" /max {DECK_EXE} --runinbk')
+					'States': [{}],
+					'UUID': BACK_ACTION
+				},
+			},
+			**{k: root_manifest[k] for k in ('DeviceModel', 'DeviceUUID') if k in root_manifest},
+			'Name': title,
+			'Version': '1.0',
+		}, open(folder_path / 'manifest.json', 'w'), indent=4)
+
+		parent_manifest['Actions'][coords] = {
+			'Name': 'Create Folder',
+			'Settings': {'ProfileUUID': ID, 'pybiosis': True},  # Removed by clean_profile once it's unused.
+			'State': 0,
+			'States': [{'Title': title}],
+			'UUID': FOLDER_ACTION
+		}
+		json.dump(parent_manifest, open(parent_path + '/manifest.json', 'w'), indent=4)
+		return ID
 
 
 def get_folders(profile_path):
@@ -4,7 +4,9 @@ from colorama import init, Fore, Style
 import pybiosis.validate as validate
 from pybiosis.loader import load_user_modules, get_user_path
 from pybiosis.utility import save_function
+import pybiosis.runtime as runtime
 from pathlib import Path
+import contextlib
 import importlib
 import inspect
 import shutil
@@ -22,10 +24,10 @@ PRINTING_COLORS = type('Colors', (object,), {
 	'key': Fore.RED,
 })
 
-def load():
-	""" Loads the modules located in PYBIOSIS_USER_PATH. """
+def load(timings=None):
+	""" Loads the modules located in PYBIOSIS_USER_PATH (timing each import, see pybiosis.importtime). """
 	sys.path.insert(1, str(get_user_path()))
-	load_user_modules()
+	load_user_modules(timings)
 
 def apply_list(decorators):
     """ A decorator that applies a list of decorators to a function. """
@@ -85,16 +87,46 @@ class Device:
 		Can be used to provide function metadata, must be the first (highest) decorator.
 	"""
 
-	HEADERS = ['title', 'description', 'name', 'module', 'show', 'pause']  # All self parameters assigned in __call__
+	POLICIES = runtime.POLICIES  # Applied by pybiosis.runtime
+	HEADERS = ['title', 'description', 'name', 'module', 'show', 'pause'] + POLICIES  # All self parameters assigned in __call__
 	FUNCTIONS = []
+	ORIGINALS = {}  # Device.key -> the function that was decorated, to detect a module executed again.
 	PRIORITY = 0
 
-	def __init__(self, title=None, description=None, show=None, pause=None):
-		""" If no title is provided, the capitalized function name is used with _ and __ replaced by ' ' and '\n'. """
+	def __init__(self, title=None, description=None, show=None, pause=None,
+		concurrency=None, max_concurrency=None, debounce_ms=None,
+		timeout=None, max_rss=None, nice=None, cpu_affinity=None,
+		profile=None, profile_memory=None):
+		""" If no title is provided, the capitalized function name is used with _ and __ replaced by ' ' and '\n'.
+
+			Concurrency is enforced across processes (eg: a button pressed repeatedly, or a slow scheduled function):
+				concurrency: 'skip', 'queue' or 'replace' a run when another one is in progress.
+				max_concurrency: the number of runs allowed at the same time (1 by default).
+				debounce_ms: drop runs that start within this many milliseconds of the previous one.
+
+			Resources are controlled when the function runs (see `pybiosis.util.resources`):
+				timeout: seconds before the run is interrupted.
+				max_rss: a memory cap, eg: '512M'.
+				nice: the CPU priority, from -20 (highest) to 19 (lowest).
+				cpu_affinity: the CPU (or list of CPUs) to run on.
+
+			Profiling writes reports to .compilers/profiles (see `pybiosis.profiling`):
+				profile: True to profile every call, or N to profile every Nth call.
+				profile_memory: also trace the allocations (with tracemalloc).
+		"""
 		self.title = title
 		self.description = description
 		self.show = show
 		self.pause = pause
+		self.concurrency = concurrency
+		self.max_concurrency = max_concurrency
+		self.debounce_ms = debounce_ms
+		self.timeout = timeout
+		self.max_rss = max_rss
+		self.nice = nice
+		self.cpu_affinity = cpu_affinity
+		self.profile = profile
+		self.profile_memory = profile_memory
 
 	def __call__(self, func):  # Decorator
 		def get(self, attribute, default):
@@ -110,6 +142,8 @@ class Device:
 		self.title = get(self, 'title', func.__name__.replace('__', '\n').replace('_', ' ').title()) # Readable name
 		self.show = get(self, 'show', False)
 		self.pause = get(self, 'pause', False)
+		for attribute in Device.POLICIES:
+			setattr(self, attribute, get(self, attribute, None))
 
 		# Description is chosen in this order: description, docstring, ""
 		if func.__doc__ is not None:
@@ -125,7 +159,10 @@ class Device:
 		# Create unique function to register...
 		def f(*args, **kwargs):
 			try:
-				func(*args, **kwargs)  # ...that just calls the function being decorated,
+				if cls == Device:
+					runtime.invoke(f, func, args, kwargs)  # ...that calls the decorated function once (applying its policies),
+				else:
+					func(*args, **kwargs)
 			except Exception as e:  # or indicates that there was an error calling it.
 				if cls != Device:
 					return
@@ -153,6 +190,7 @@ class Device:
 
 		# Copy metadata to f
 		[setattr(f, k, getattr(func, k, '')) for k in ['__name__', '__doc__', '__module__']]
+		f.original = getattr(func, 'original', func)  # The undecorated function, shared by stacked decorators.
 		[setattr(f, k, getattr(decorator, k)) for k in Device.HEADERS]
 		[setattr(f, k, getattr(decorator, k)) for k in decorator.HEADERS]
 
@@ -170,9 +208,40 @@ class Device:
 				return lambda: None  # This causes the issue. ERROR: The filename, directory name, or volume label syntax is incorrect.
 			
 
-			Device.FUNCTIONS.append((decorator.__class__, f))
+			# Every Device wrapper of a function (eg: its StreamDeck and Scheduler entries, and the @Device above them)
+			# shares the policies, so they are applied once however the function is called (see runtime.policies).
+			with contextlib.suppress(AttributeError, TypeError):
+				f.original.pybiosis_wrappers = getattr(f.original, 'pybiosis_wrappers', []) + [f]
+			Device.register(decorator, f)
 		return f
 
+	@staticmethod
+	def register(decorator, f):
+		""" Adds f to FUNCTIONS. If its module was executed again (eg: reloaded, or re-run by streamlit),
+			the entries of the previous execution are replaced rather than duplicated.
+		"""
+		key = Device.key(f)
+		if Device.ORIGINALS.get(key, f.original) is not f.original:
+			Device.FUNCTIONS[:] = [(c, g) for c, g in Device.FUNCTIONS if Device.key(g) != key]
+		Device.ORIGINALS[key] = f.original
+		Device.FUNCTIONS.append((decorator.__class__, f))
+
+	@staticmethod
+	def key(f):
+		""" Identifies a decorated function: its module and qualified name (functions of nested classes can share a name). """
+		return (f.module.__name__, getattr(f.original, '__qualname__', f.name))
+
+	@staticmethod
+	def unregister(module_names):
+		""" Removes the functions of these modules (eg: before they are reloaded). Returns the removed entries. """
+		module_names = set(module_names)
+		removed = [(c, g) for c, g in Device.FUNCTIONS if g.module.__name__ in module_names]
+		if removed:
+			Device.FUNCTIONS[:] = [(c, g) for c, g in Device.FUNCTIONS if g.module.__name__ not in module_names]
+		for key in [key for key in Device.ORIGINALS if key[0] in module_names]:
+			del Device.ORIGINALS[key]
+		return removed
+
 	@staticmethod
 	def compile(functions):
 		raise NotImplementedError
@@ -189,9 +258,10 @@ class Device:
 		#
 		# I need to preserve the order that the functions are entered.
 		functions = Device.FUNCTIONS
-		rename = {f.__name__: tuple([getattr(f, h) for h in Device.HEADERS]) for c, f in functions}
+		headers = [h for h in Device.HEADERS if h not in Device.POLICIES]  # The policies are resolved per function by runtime.policies.
+		rename = {f.__name__: tuple([getattr(f, h) for h in headers]) for c, f in functions}
 		for c, f in functions:
-			for attr, value in zip(Device.HEADERS, rename[f.__name__]):
+			for attr, value in zip(headers, rename[f.__name__]):
 				setattr(f, attr, value)
 
 		# Printing and Compiling
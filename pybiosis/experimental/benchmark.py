@@ -0,0 +1,216 @@
+""" A latency benchmark for the voice pipeline, which runs offline (no microphone, network or speakers).
+
+WAV fixtures (one command per file, named after it: "play_spire.wav") are replayed in bursts through the
+same stages as voice.py (its VoiceCommandInterface.evaluate_command dispatches them), with a stub recognizer
+and a recording TTS engine standing in for the services:
+
+    source (+ vad) -> recognize -> queue -> match -> acknowledge (tts) -> action
+
+Every command records a timestamp per stage, and the report gives the p50/p95/p99 of each stage,
+of the end-to-end latency (from the audio being available to the action finishing), and the throughput.
+
+    python -m pybiosis.experimental.benchmark --bursts 5 --burst 20 --recognizer-delay 0.05
+    python -m pybiosis.experimental.benchmark --fixtures recordings/ --vad --json
+"""
+from pybiosis.experimental.listener import VoiceListener, Audio
+from pybiosis.experimental.speech import SpeechWorker, RecordingEngine
+from pybiosis.experimental.voice import VoiceCommandInterface
+from pybiosis.experimental.vad import VoiceActivityDetector, pcm_chunks
+from concurrent.futures import CancelledError
+from collections import namedtuple
+from pathlib import Path
+import numpy as np
+import argparse
+import threading
+import tempfile
+import json
+import time
+import wave
+
+STAGES = ['vad', 'recognize', 'queue', 'match', 'acknowledge', 'action']
+PHRASES = ['hello', 'what time is it', 'play spire', 'open settings', 'volume up', 'lights off', 'next track', 'stop']
+
+TracedAudio = namedtuple('TracedAudio', ['audio', 'trace'])
+
+
+class Trace(dict):
+    """ The timestamps (time.perf_counter) of one command, by stage. """
+
+    def mark(self, stage):
+        self[stage] = time.perf_counter()
+
+
+class Command(str):
+    """ A recognized command that carries its trace through the queue. """
+    trace = None
+
+
+def make_fixtures(directory, phrases=PHRASES, sample_rate=16000):
+    """ Writes one synthetic WAV per phrase (a tone between silences), and returns their paths. """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, phrase in enumerate(phrases):
+        t = np.arange(int(0.2 * sample_rate * (1 + len(phrase.split())))) / sample_rate
+        speech = 8000 * np.sin(2 * np.pi * (150 + 20 * i) * t)
+        silence = np.zeros(int(0.4 * sample_rate))
+        samples = np.concatenate([silence, speech, silence]) + rng.normal(0, 100, len(t) + 2 * len(silence))
+        path = directory / f"{phrase.replace(' ', '_')}.wav"
+        with wave.open(str(path), 'wb') as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(sample_rate)
+            file.writeframes(samples.astype(np.int16).tobytes())
+        paths.append(path)
+    return paths
+
+
+class FixtureSource:
+    """ Replays the fixtures in bursts (every command of a burst is available at once), with an optional VAD stage. """
+
+    def __init__(self, paths, bursts=1, burst=10, interval=0.5, vad=False):
+        self.fixtures = []
+        for path in paths:
+            with wave.open(str(path), 'rb') as file:
+                audio = Audio(file.readframes(file.getnframes()), file.getframerate(), file.getsampwidth())
+            self.fixtures.append((Path(path).stem.replace('_', ' '), path, audio))
+        self.bursts, self.burst, self.interval, self.vad = bursts, burst, interval, vad
+        self.traces = []
+
+    def __iter__(self):
+        for b in range(self.bursts):
+            if b:
+                time.sleep(self.interval)
+            traces = []
+            for i in range(self.burst):
+                phrase, path, audio = self.fixtures[(b * self.burst + i) % len(self.fixtures)]
+                trace = Trace(phrase=phrase)
+                trace.mark('available')
+                traces.append((trace, path, audio))
+            for trace, path, audio in traces:
+                if self.vad:
+                    detector = VoiceActivityDetector(sample_rate=audio.sample_rate)
+                    segments = [s for chunk in pcm_chunks(path) for s in detector.feed(chunk)] + detector.flush()
+                    audio = segments[0] if segments else None
+                    trace.mark('vad')
+                self.traces.append(trace)
+                if audio is not None:
+                    yield TracedAudio(audio, trace)
+
+    def close(self):
+        pass
+
+
+class StubRecognizer:
+    """ "Recognizes" a fixture as its file name, after delay seconds (like a recognition service would take). """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def __call__(self, traced):
+        time.sleep(self.delay)
+        command = Command(traced.trace['phrase'])
+        command.trace = traced.trace
+        traced.trace.mark('recognize')
+        return command
+
+
+def run(paths, bursts=1, burst=10, interval=0.5, vad=False, recognizer_delay=0.0, tts_delay=0.0, action_delay=0.0,
+        workers=2, queue_size=64, policy='block'):
+    """ Runs the pipeline over the fixtures, and returns (traces, summary of the listener). """
+    source = FixtureSource(paths, bursts, burst, interval, vad)
+    speaker = SpeechWorker(lambda: RecordingEngine(tts_delay))
+    current = threading.local()  # The trace of the command a worker is evaluating.
+
+    def speak(text, key=None):
+        # Called by evaluate_command once it has matched the command, before the action.
+        current.trace.mark('match')
+        current.acknowledged = speaker.speak(text, key=key)
+        return current.acknowledged
+
+    interface = VoiceCommandInterface({phrase: lambda: time.sleep(action_delay) for phrase, _, _ in source.fixtures}, speak=speak)
+
+    def dispatch(command):
+        trace = current.trace = command.trace
+        current.acknowledged = None
+        trace.mark('queue')
+        interface.evaluate_command(command)
+        trace.mark('action')
+        if current.acknowledged is not None:
+            # The worker's result is the time from queueing the acknowledgement to having said it.
+            try:
+                trace['acknowledge'] = trace['match'] + current.acknowledged.result()
+            except CancelledError:  # A newer command's acknowledgement superseded it.
+                trace['superseded'] = True
+
+    listener = VoiceListener(source, StubRecognizer(recognizer_delay), dispatch, workers=workers, queue_size=queue_size, policy=policy)
+    summary = listener.run()
+    speaker.close()
+    return source.traces, summary
+
+
+def report(traces, summary):
+    """ Returns the latency percentiles (ms) of each stage and end to end, and the throughput (commands/s). """
+    completed = [t for t in traces if 'action' in t]
+    percentiles = lambda values: dict(zip(['p50', 'p95', 'p99'], np.round(np.percentile(values, [50, 95, 99]) * 1000, 3).tolist())) if len(values) else {}
+
+    # Each stage is measured from the end of the one before it, except that the acknowledgement and
+    # the action run alongside each other, so both are measured from the match.
+    stages = {}
+    for stage, start in zip(STAGES, ['available', 'vad', 'recognize', 'queue', 'match', 'match']):
+        if completed and start not in completed[0]:  # Without the vad stage, recognition starts from the audio.
+            start = 'available'
+        durations = [t[stage] - t[start] for t in completed if stage in t]
+        if durations:
+            stages[stage] = percentiles(durations)
+
+    end = lambda t: max(t['action'], t.get('acknowledge', t['action']))  # A command is done once it is also acknowledged.
+    end_to_end = [end(t) - t['available'] for t in completed]
+    span = max(map(end, completed)) - min(t['available'] for t in completed) if completed else 0
+    return {
+        'commands': len(traces),
+        'completed': len(completed),
+        'dropped': summary['dropped'],
+        'superseded': sum('superseded' in t for t in completed),
+        'end_to_end_ms': percentiles(end_to_end),
+        'stages_ms': stages,
+        'throughput_per_s': round(len(completed) / span, 2) if span else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the latency of the voice pipeline with recorded fixtures.')
+    parser.add_argument('--fixtures', help='A directory of WAV files named after their command (default: synthetic ones).')
+    parser.add_argument('--bursts', type=int, default=3, help='The number of bursts.')
+    parser.add_argument('--burst', type=int, default=20, help='The number of commands per burst.')
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between bursts.')
+    parser.add_argument('--vad', action='store_true', help='Run the voice-activity detector on each fixture.')
+    parser.add_argument('--recognizer-delay', type=float, default=0.0, help='Seconds the stub recognizer takes.')
+    parser.add_argument('--tts-delay', type=float, default=0.0, help='Seconds the recording TTS engine takes.')
+    parser.add_argument('--action-delay', type=float, default=0.0, help='Seconds each action takes.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument('--policy', default='block', choices=['block', 'drop_newest', 'drop_oldest'])
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = sorted(Path(args.fixtures).glob('*.wav')) if args.fixtures else make_fixtures(directory)
+        traces, summary = run(paths, args.bursts, args.burst, args.interval, args.vad, args.recognizer_delay,
+                              args.tts_delay, args.action_delay, args.workers, args.queue_size, args.policy)
+    result = report(traces, summary)
+
+    if args.json:
+        print(json.dumps(result, indent=4))
+        return result
+    print(f"{result['completed']}/{result['commands']} commands completed ({result['dropped']} dropped, "
+          f"{result['superseded']} acknowledgements superseded), {result['throughput_per_s']} commands/s")
+    print(f"{'end to end':>12}: {result['end_to_end_ms']}")
+    for stage, values in result['stages_ms'].items():
+        print(f"{stage:>12}: {values}")
+    return result
+
+
+if __name__ == '__main__':
+    main()
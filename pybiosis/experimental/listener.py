@@ -0,0 +1,220 @@
+""" An event-driven runtime for the voice interface.
+
+    audio source --(capture thread: recognize)--> bounded CommandQueue --(worker pool)--> dispatch(command)
+
+The main thread only waits on a stop event, recognition never waits for a command to finish,
+and a burst of commands is bounded by the queue, whose policy decides what happens when it is full:
+    'block'        the capture thread waits for room (up to block_timeout, then the command is dropped),
+    'drop_newest'  the new command is dropped,
+    'drop_oldest'  the oldest waiting command is dropped to make room.
+
+Audio sources are iterables of audio (speech_recognition.AudioData or anything with the same attributes),
+so the loop can run from recorded WAV files without a microphone:
+    VoiceListener(WavFileSource(['on.wav', 'off.wav']), recognize, dispatch).run()
+"""
+from collections import namedtuple
+import threading
+import queue
+import wave
+
+POLICIES = ['block', 'drop_newest', 'drop_oldest']
+
+# Has the attributes of speech_recognition.AudioData that the recognizers use.
+Audio = namedtuple('Audio', ['frame_data', 'sample_rate', 'sample_width'])
+
+
+class CommandQueue:
+    """ A bounded queue with a policy for when it is full. Counts what was accepted and dropped. """
+
+    def __init__(self, maxsize=8, policy='drop_oldest', block_timeout=None):
+        assert policy in POLICIES, f'policy must be one of {POLICIES}'
+        self.queue = queue.Queue(maxsize)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.accepted = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def put(self, item):
+        """ Returns whether the item was queued. """
+        try:
+            if self.policy == 'block':
+                self.queue.put(item, timeout=self.block_timeout)
+            elif self.policy == 'drop_newest':
+                self.queue.put_nowait(item)
+            else:
+                with self.lock:
+                    while True:
+                        try:
+                            self.queue.put_nowait(item)
+                            break
+                        except queue.Full:
+                            try:
+                                self.queue.get_nowait()
+                                self.queue.task_done()
+                                self.dropped += 1
+                            except queue.Empty:
+                                pass
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def done(self):
+        self.queue.task_done()
+
+    def join(self):
+        self.queue.join()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+
+class WavFileSource:
+    """ Yields the audio of each WAV file (16-bit PCM), as if each were one phrase heard by the microphone. """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            with wave.open(str(path), 'rb') as file:
+                frames = file.readframes(file.getnframes())
+                if file.getnchannels() > 1:  # Keep the first channel.
+                    width, channels = file.getsampwidth(), file.getnchannels()
+                    frames = b''.join(frames[i:i + width] for i in range(0, len(frames), width * channels))
+                yield Audio(frames, file.getframerate(), file.getsampwidth())
+
+    def close(self):
+        pass
+
+
+class MicrophoneSource:
+    """ Yields the phrases heard by the microphone (using listen_in_background) until closed. """
+
+    def __init__(self, recognizer, phrase_time_limit=2, device_index=None):
+        self.recognizer = recognizer
+        self.phrase_time_limit = phrase_time_limit
+        self.device_index = device_index
+        self.chunks = queue.Queue()
+        self.stop_listening = None
+
+    def __iter__(self):
+        import speech_recognition as sr
+        source = sr.Microphone(device_index=self.device_index)
+        with source:
+            self.recognizer.adjust_for_ambient_noise(source)
+        self.stop_listening = self.recognizer.listen_in_background(source, lambda _, audio: self.chunks.put(audio), phrase_time_limit=self.phrase_time_limit)
+        while (audio := self.chunks.get()) is not None:
+            yield audio
+
+    def close(self):
+        if self.stop_listening:
+            self.stop_listening(wait_for_stop=False)
+        self.chunks.put(None)
+
+
+def google_recognizer(recognizer=None):
+    """ Returns recognize(audio) -> text (lower case), or None if nothing was understood. """
+    import speech_recognition as sr
+    recognizer = recognizer or sr.Recognizer()
+
+    def recognize(audio):
+        if not isinstance(audio, sr.AudioData):
+            audio = sr.AudioData(audio.frame_data, audio.sample_rate, audio.sample_width)
+        try:
+            return recognizer.recognize_google(audio).lower()
+        except sr.UnknownValueError:
+            return None
+        except sr.RequestError as e:
+            print(f"Could not request results; {e}")
+            return None
+    return recognize
+
+
+class VoiceListener:
+    """ Recognizes the audio of a source on a capture thread, and dispatches the commands on a pool of workers.
+
+        source: an iterable of audio (with an optional close()).
+        recognize(audio) -> command (or None), dispatch(command) -> anything (its exceptions are counted).
+    """
+
+    def __init__(self, source, recognize, dispatch, workers=2, queue_size=8, policy='drop_oldest', block_timeout=None):
+        self.source = source
+        self.recognize = recognize
+        self.dispatch = dispatch
+        self.workers = workers
+        self.commands = CommandQueue(queue_size, policy, block_timeout)
+        self.stopped = threading.Event()
+        self.exhausted = threading.Event()  # The source has no more audio.
+        self.threads = []
+        self.stats = {'heard': 0, 'recognized': 0, 'executed': 0, 'failed': 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def capture(self):
+        try:
+            for audio in self.source:
+                if self.stopped.is_set():
+                    break
+                self.count('heard')
+                command = self.recognize(audio)
+                if command:
+                    self.count('recognized')
+                    self.commands.put(command)
+        finally:
+            self.exhausted.set()
+            self.commands.join()  # Let the workers finish what was queued,
+            self.stopped.set()  # then stop.
+
+    def work(self):
+        while not self.stopped.is_set():
+            try:
+                command = self.commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                self.dispatch(command)
+                self.count('executed')
+            except Exception as e:
+                self.count('failed')
+                print(f"Command {command!r} failed: {e}")
+            finally:
+                self.commands.done()
+
+    def start(self):
+        self.threads = [threading.Thread(target=self.capture, name='voice-capture', daemon=True)]
+        self.threads += [threading.Thread(target=self.work, name=f'voice-worker-{i}', daemon=True) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        close = getattr(self.source, 'close', None)
+        if close:
+            close()
+
+    def run(self):
+        """ Blocks (without using the CPU) until the source is exhausted, stop() is called, or Ctrl+C. """
+        self.start()
+        try:
+            while not self.stopped.wait(timeout=0.5):  # A timeout keeps Ctrl+C responsive on Windows.
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            for thread in self.threads:
+                thread.join(timeout=1)
+        return self.summary()
+
+    def summary(self):
+        return {**self.stats, 'dropped': self.commands.dropped}
@@ -0,0 +1,255 @@
+""" Fuzzy matching of recognized speech against the registered phrases.
+
+Speech recognition mishears words in ways that sound alike ("spire" -> "fire", "buyer"), which is what
+multi_phrase works around by listing the variants. Instead, the phrases are indexed by a phonetic key
+(a simplified Metaphone), and looked up by edit distance in a BK-tree, so only a small part of the
+vocabulary is compared for each utterance.
+
+    matcher = PhraseMatcher.from_phrases({'play spire': play_spire, 'volume $': volume})
+    matcher.match('play spier')     # -> Match(phrase='play spire', value=play_spire, argument=None, confidence=1.0)
+    matcher.match('lay spire')      # -> Match(phrase='play spire', ..., confidence=0.8)
+    matcher.match('play fire')      # -> None: PLFR is 2 edits from PLSPR (confidence 0.6), below the default threshold.
+    matcher.match('volume 30')      # -> Match(phrase='volume $', value=volume, argument='30', confidence=1.0)
+"""
+from collections import namedtuple
+import re
+
+VOWELS = set('AEIOU')
+FRONT = set('EIY')  # Letters that soften C and G.
+ARGUMENT = '$'
+
+Match = namedtuple('Match', ['phrase', 'value', 'argument', 'confidence'])
+
+
+def metaphone(word):
+    """ A simplified Metaphone key: letters that sound alike map to the same symbol, and most vowels are dropped. """
+    word = re.sub('[^A-Z0-9]', '', word.upper())
+    if not word:
+        return ''
+    for prefix in ('KN', 'GN', 'PN', 'AE', 'WR'):
+        if word.startswith(prefix):
+            word = word[1:]
+    word = 'S' + word[1:] if word[0] == 'X' else word
+    word = 'W' + word[2:] if word.startswith('WH') else word
+
+    key = []
+    for i, c in enumerate(word):
+        prev, following, after = word[i - 1:i], word[i + 1:i + 2], word[i + 2:i + 3]
+        if c == prev and c != 'C':
+            continue
+        if c.isdigit():
+            key.append(c)
+        elif c in VOWELS:
+            key.append(c) if i == 0 else None
+        elif c == 'B':
+            key.append('B') if not (prev == 'M' and i == len(word) - 1) else None
+        elif c == 'C':
+            if following == 'H' or (following == 'I' and after == 'A'):
+                key.append('X')
+            elif following in FRONT:
+                key.append('S') if prev != 'S' else None
+            else:
+                key.append('K')
+        elif c == 'D':
+            key.append('J' if following == 'G' and after in FRONT else 'T')
+        elif c == 'G':
+            if following == 'H' and after not in VOWELS:
+                continue  # Silent, eg: "night".
+            if following == 'N' and i == len(word) - 2:
+                continue  # Silent, eg: "sign".
+            key.append('J' if following in FRONT and prev != 'G' else 'K')
+        elif c == 'H':
+            key.append('H') if following in VOWELS and prev not in VOWELS | set('CGPST') else None
+        elif c == 'K':
+            key.append('K') if prev != 'C' else None
+        elif c == 'P':
+            key.append('F' if following == 'H' else 'P')
+        elif c == 'Q':
+            key.append('K')
+        elif c == 'S':
+            key.append('X' if following == 'H' or (following == 'I' and after in 'OA') else 'S')
+        elif c == 'T':
+            if following == 'H':
+                key.append('0')  # "th"
+            elif not (following == 'C' and after == 'H'):
+                key.append('X' if following == 'I' and after in 'OA' else 'T')
+        elif c == 'V':
+            key.append('F')
+        elif c in 'WY':
+            key.append(c) if following in VOWELS else None
+        elif c == 'X':
+            key.append('KS')
+        elif c == 'Z':
+            key.append('S')
+        else:
+            key.append(c)
+    return ''.join(key)
+
+
+def phonetic_key(phrase):
+    """ The phonetic key of a phrase, ignoring word boundaries (so "slay the spire" ~ "slaythe spire"). """
+    return ''.join(metaphone(word) for word in phrase.split())
+
+
+def levenshtein(a, b, limit=None):
+    """ The edit distance between a and b (Myers' bit-parallel algorithm, one step per character of b),
+        or limit + 1 if it is known to exceed limit.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        return len(a) or len(b)
+    masks = {}
+    for i, c in enumerate(a):
+        masks[c] = masks.get(c, 0) | 1 << i
+    full, last = (1 << len(a)) - 1, 1 << (len(a) - 1)
+    positive, negative, score = full, 0, len(a)
+    for c in b:
+        equal = masks.get(c, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        up = negative | ~(horizontal | positive)
+        down = positive & horizontal
+        if up & last:
+            score += 1
+        elif down & last:
+            score -= 1
+        up = (up << 1) | 1
+        down <<= 1
+        positive = (down | ~(vertical | up)) & full
+        negative = up & vertical
+    return score if limit is None else min(score, limit + 1)
+
+
+class BKTree:
+    """ A metric tree over strings: each child is stored under its distance to the parent, so a search
+        within a radius r only descends into children whose distance is within r of the query's distance.
+    """
+
+    def __init__(self, distance=levenshtein):
+        self.distance = distance
+        self.root = None  # [key, values, {distance: child}]
+        self.size = 0
+
+    def add(self, key, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [value], {}]
+            return
+        node = self.root
+        while True:
+            d = self.distance(key, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            if d not in node[2]:
+                node[2][d] = [key, [value], {}]
+                return
+            node = node[2][d]
+
+    def search(self, key, radius):
+        """ Returns [(distance, key, values)] for every key within the radius. """
+        if self.root is None:
+            return []
+        found, pending = [], [self.root]
+        while pending:
+            node = pending.pop()
+            # Beyond radius + the largest child distance, no child can be in range, so the exact distance isn't needed.
+            d = self.distance(key, node[0], radius + max(node[2], default=0))
+            if d <= radius:
+                found.append((d, node[0], node[1]))
+            pending.extend(child for distance, child in node[2].items() if d - radius <= distance <= d + radius)
+        return found
+
+    def __len__(self):
+        return self.size
+
+
+class PhraseMatcher:
+    """ Matches utterances to phrases by sound. A phrase ending in '$' matches any utterance that starts
+        like it, and the rest of the utterance is its argument.
+
+        confidence = 1 - distance / length of the longer phonetic key. Matches below threshold are rejected.
+    """
+
+    def __init__(self, threshold=0.75):
+        self.threshold = threshold
+        self.tree = BKTree()
+        self.exact = {}
+        self.grammars = []  # [(PhraseGrammar, value)], matched exactly without listing their phrases.
+        self.argument_lengths = set()  # The number of words before '$' in the registered phrases.
+
+    @classmethod
+    def from_phrases(cls, phrases, **kwargs):
+        """ phrases: {phrase: value}. """
+        matcher = cls(**kwargs)
+        for phrase, value in phrases.items():
+            matcher.add(phrase, value)
+        return matcher
+
+    @classmethod
+    def from_functions(cls, registry, **kwargs):
+        """ Indexes the phrases of the Assistant functions in Device.FUNCTIONS. The values are the functions. """
+        matcher = cls(**kwargs)
+        for decorator, f in registry:
+            if decorator.__name__ == 'Assistant':
+                matcher.add_grammar(f.phrase, f)
+        return matcher
+
+    def add_grammar(self, grammar, value):
+        """ Indexes a PhraseGrammar without listing its phrases (the product of its synonyms): its utterances are
+            matched exactly by the grammar, and by sound through the phrases that differ from its first one in one slot.
+        """
+        self.grammars.append((grammar, value))
+        for alternative in grammar.alternatives:
+            first = [slot[0] for slot in alternative]
+            variants = [first[:i] + [synonym] + first[i + 1:] for i, slot in enumerate(alternative) for synonym in slot]
+            for phrase in dict.fromkeys(map(' '.join, variants)):
+                self.add(phrase, value)
+
+    def add(self, phrase, value):
+        words = phrase.lower().split()
+        takes_argument = bool(words) and words[-1].endswith(ARGUMENT)
+        if takes_argument:
+            words[-1] = words[-1][:-1]
+            words = [w for w in words if w]
+            self.argument_lengths.add(len(words))
+        text = ' '.join(words)
+        self.exact.setdefault((text, takes_argument), (phrase, value))
+        self.tree.add(phonetic_key(text), (text, takes_argument, phrase, value))
+
+    def candidates(self, text, takes_argument):
+        key = phonetic_key(text)
+        radius = int((1 - self.threshold) * len(key) / self.threshold) if self.threshold else len(key)
+        for distance, other, entries in self.tree.search(key, radius):
+            confidence = 1 - distance / max(len(key), len(other), 1)
+            for entry_text, entry_argument, phrase, value in entries:
+                if entry_argument == takes_argument and confidence >= self.threshold:
+                    yield confidence, -levenshtein(text, entry_text), phrase, value
+
+    def match(self, utterance):
+        """ Returns the best Match for the utterance, or None. """
+        words = utterance.lower().split()
+        text = ' '.join(words)
+        if (text, False) in self.exact:
+            return Match(*self.exact[(text, False)], None, 1.0)
+        for grammar, value in self.grammars:
+            accepted, argument = grammar.match(utterance)
+            if accepted:
+                return Match(next(iter(grammar)), value, argument, 1.0)
+
+        best = None
+        for confidence, closeness, phrase, value in self.candidates(text, False):
+            if best is None or (confidence, closeness) > best[:2]:
+                best = (confidence, closeness, Match(phrase, value, None, confidence))
+        for length in sorted(self.argument_lengths, reverse=True):
+            if len(words) <= length:
+                continue
+            prefix, argument = ' '.join(words[:length]), ' '.join(utterance.split()[length:])
+            for confidence, closeness, phrase, value in self.candidates(prefix, True):
+                if best is None or (confidence, closeness) > best[:2]:
+                    best = (confidence, closeness, Match(phrase, value, argument, confidence))
+        return best[2] if best else None
+
+    def __len__(self):
+        return len(self.tree)
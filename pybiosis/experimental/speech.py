@@ -0,0 +1,170 @@
+""" Spoken feedback from a single worker thread.
+
+pyttsx3 engines are not thread-safe, and runAndWait hangs when an engine is created or driven from several
+places (https://stackoverflow.com/questions/56032027/pyttsx3-runandwait-method-gets-stuck).
+So one thread owns the only engine, and everyone else queues utterances with speak(), which returns at once:
+
+    speak("Running: volume")                      # -> Future, whose result is the seconds from speak() to spoken.
+    speak("Volume 30", key='volume')              # Replaces a pending message with the same key.
+    speak("Stopping.", interrupt=True).result()   # Cancels everything pending, and waits until it is said.
+
+The engine is pluggable (anything with say and runAndWait), eg: NullEngine or RecordingEngine for headless tests.
+The shared worker uses pyttsx3 (NullEngine if it isn't installed), or PYBIOSIS_SPEECH_ENGINE=null, or configure(factory).
+"""
+from concurrent.futures import Future
+from collections import namedtuple, deque
+import threading
+import logging
+import time
+import os
+
+Utterance = namedtuple('Utterance', ['text', 'key', 'future', 'queued'])
+
+
+def pyttsx3_engine():
+    import pyttsx3
+    return pyttsx3.init()
+
+
+def default_engine():
+    """ The engine named by PYBIOSIS_SPEECH_ENGINE (pyttsx3 or null), or a NullEngine if pyttsx3 isn't installed. """
+    if os.getenv('PYBIOSIS_SPEECH_ENGINE', 'pyttsx3').lower() == 'null':
+        return NullEngine()
+    try:
+        return pyttsx3_engine()
+    except ImportError:
+        logging.warning("pyttsx3 is not installed, so nothing will be said.")
+        return NullEngine()
+
+
+class NullEngine:
+    """ Says nothing. """
+
+    def say(self, text):
+        pass
+
+    def runAndWait(self):
+        pass
+
+
+class RecordingEngine:
+    """ Records what would be said (with timestamps), taking delay seconds per utterance. """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.spoken = []  # [(text, start, end)]
+        self.buffer = []
+
+    def say(self, text):
+        self.buffer.append(text)
+
+    def runAndWait(self):
+        for text in self.buffer:
+            start = time.perf_counter()
+            time.sleep(self.delay)
+            self.spoken.append((text, start, time.perf_counter()))
+        self.buffer.clear()
+
+
+class SpeechWorker:
+    """ Owns one engine (created on its own thread by engine_factory) and says the queued utterances in order. """
+
+    def __init__(self, engine_factory=default_engine):
+        self.engine_factory = engine_factory
+        self.engine = None
+        self.error = None
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='pybiosis-speech', daemon=True)
+        self.thread.start()
+
+    def speak(self, text, key=None, interrupt=False):
+        """ Queues text and returns a Future. A pending message is cancelled (superseded) if it has the same key,
+            or if interrupt is set.
+        """
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('The speech worker is closed.')
+            if interrupt or key is not None:
+                superseded = [u for u in self.pending if interrupt or u.key == key]
+                for utterance in superseded:
+                    utterance.future.cancel()
+                    self.pending.remove(utterance)
+            self.pending.append(Utterance(text, key, future, time.perf_counter()))
+            self.condition.notify()
+        return future
+
+    def cancel_pending(self):
+        with self.condition:
+            for utterance in self.pending:
+                utterance.future.cancel()
+            self.pending.clear()
+
+    def run(self):
+        try:
+            self.engine = self.engine_factory()
+        except Exception as e:
+            self.error = e  # Every utterance will fail with this error.
+
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                utterance = self.pending.popleft()
+
+            if not utterance.future.set_running_or_notify_cancel():
+                continue
+            if self.error:
+                utterance.future.set_exception(self.error)
+                continue
+            try:
+                self.engine.say(utterance.text)
+                self.engine.runAndWait()
+                utterance.future.set_result(time.perf_counter() - utterance.queued)
+            except Exception as e:
+                utterance.future.set_exception(e)
+
+    def close(self, wait=True):
+        """ Stops once the pending utterances are said. """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if wait:
+            self.thread.join()
+
+    def __len__(self):
+        return len(self.pending)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+_engine_factory = default_engine
+
+
+def configure(engine_factory):
+    """ Sets the engine of the shared worker, eg: configure(RecordingEngine). A running worker is replaced
+        (after saying what it has pending).
+    """
+    global _worker, _engine_factory
+    with _worker_lock:
+        _engine_factory = engine_factory
+        if _worker is not None:
+            _worker.close(wait=False)
+            _worker = None
+
+
+def get_worker():
+    """ The shared speech worker (started on first use). """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = SpeechWorker(_engine_factory)
+        return _worker
+
+
+def speak(text, key=None, interrupt=False):
+    return get_worker().speak(text, key=key, interrupt=interrupt)
@@ -0,0 +1,166 @@
+""" Voice-activity detection in front of the speech recognizer.
+
+Raw 16-bit mono PCM is split into frames, and each chunk's frames are scored at once with NumPy:
+    energy  the mean square amplitude, compared with an adaptive noise floor,
+    zcr     the zero-crossing rate, which is high for hiss and low for voiced speech.
+Only segments of speech reach the recognizer (silence and background noise are dropped), and a segment
+is handed over as soon as hangover_ms of silence follows it, instead of waiting for a fixed phrase window.
+
+The buffers (frame features, the current segment and the pre-roll) are allocated once and reused.
+
+    source = VadSource(microphone_chunks(), VoiceActivityDetector())   # or pcm_chunks('recording.wav')
+    VoiceListener(source, recognize, dispatch).run()
+"""
+from pybiosis.experimental.listener import Audio
+import numpy as np
+import wave
+
+
+class VoiceActivityDetector:
+    """ feed(pcm bytes) -> the finished speech segments (Audio), flush() -> the segment in progress (if any). """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, threshold=3.0, min_energy=2e4, max_zcr=0.4,
+                 min_speech_ms=100, hangover_ms=300, pre_roll_ms=150, max_utterance_s=10):
+        self.sample_rate = sample_rate
+        self.frame = sample_rate * frame_ms // 1000
+        self.threshold = threshold  # Speech is this many times louder than the noise floor,
+        self.min_energy = min_energy  # and at least this loud (mean square of int16 samples).
+        self.max_zcr = max_zcr
+        self.min_speech = max(1, min_speech_ms // frame_ms)  # Frames of speech that start a segment.
+        self.hangover = max(1, hangover_ms // frame_ms)  # Frames of silence that end it.
+        self.noise = None
+
+        # Reused buffers.
+        self.features = np.empty((0, self.frame), np.float32)
+        self.signs = np.empty((0, self.frame), bool)
+        self.crossings = np.empty((0, self.frame - 1), bool)
+        self.partial = np.empty(self.frame, np.int16)  # The samples of an incomplete frame.
+        self.partial_length = 0
+        self.pre_roll = np.zeros((max(self.min_speech, pre_roll_ms // frame_ms), self.frame), np.int16)
+        self.pre_roll_index = 0
+        self.segment = np.empty(int(max_utterance_s * sample_rate), np.int16)
+        self.length = 0
+
+        self.active = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.stats = {'frames': 0, 'speech_frames': 0, 'segments': 0}
+
+    def reserve(self, n):
+        if len(self.features) < n:
+            self.features = np.empty((n, self.frame), np.float32)
+            self.signs = np.empty((n, self.frame), bool)
+            self.crossings = np.empty((n, self.frame - 1), bool)
+
+    def classify(self, frames):
+        """ Returns a boolean array: whether each frame (a row) is speech. Updates the noise floor. """
+        n = len(frames)
+        self.reserve(n)
+        features, signs, crossings = self.features[:n], self.signs[:n], self.crossings[:n]
+        np.copyto(features, frames, casting='unsafe')
+        energy = np.einsum('ij,ij->i', features, features) / self.frame
+        np.signbit(frames, out=signs)
+        np.not_equal(signs[:, 1:], signs[:, :-1], out=crossings)
+        zcr = crossings.sum(axis=1) / (self.frame - 1)
+
+        if self.noise is None:
+            self.noise = float(energy.min())
+        speech = (energy > max(self.noise * self.threshold, self.min_energy)) & (zcr < self.max_zcr)
+        if not speech.all():
+            self.noise = 0.9 * self.noise + 0.1 * float(energy[~speech].mean())
+        self.stats['frames'] += n
+        self.stats['speech_frames'] += int(speech.sum())
+        return speech
+
+    def feed(self, data):
+        samples = np.frombuffer(data, np.int16)
+        segments = []
+
+        # Complete the frame left over from the previous chunk.
+        if self.partial_length:
+            needed = min(self.frame - self.partial_length, len(samples))
+            self.partial[self.partial_length:self.partial_length + needed] = samples[:needed]
+            self.partial_length += needed
+            samples = samples[needed:]
+            if self.partial_length == self.frame:
+                self.partial_length = 0
+                self.process(self.partial[None, :], segments)
+
+        n = len(samples) // self.frame
+        if n:
+            self.process(samples[:n * self.frame].reshape(n, self.frame), segments)
+        rest = samples[n * self.frame:]
+        self.partial[:len(rest)] = rest
+        self.partial_length += len(rest)
+        return segments
+
+    def process(self, frames, segments):
+        for frame, speech in zip(frames, self.classify(frames)):
+            if not self.active:
+                self.pre_roll[self.pre_roll_index] = frame
+                self.pre_roll_index = (self.pre_roll_index + 1) % len(self.pre_roll)
+                self.speech_run = self.speech_run + 1 if speech else 0
+                if self.speech_run >= self.min_speech:
+                    self.start()
+                continue
+
+            self.segment[self.length:self.length + self.frame] = frame
+            self.length += self.frame
+            self.silence_run = 0 if speech else self.silence_run + 1
+            if self.silence_run >= self.hangover or self.length + self.frame > len(self.segment):
+                segments.append(self.finish())
+
+    def start(self):
+        """ Starts a segment with the pre-roll (which includes the speech that triggered it), oldest first. """
+        self.active, self.length, self.silence_run = True, 0, 0
+        for i in range(len(self.pre_roll)):
+            frame = self.pre_roll[(self.pre_roll_index + i) % len(self.pre_roll)]
+            self.segment[self.length:self.length + self.frame] = frame
+            self.length += self.frame
+
+    def finish(self):
+        end = self.length - max(0, self.silence_run - 1) * self.frame  # Keep one frame of the trailing silence.
+        audio = Audio(self.segment[:end].tobytes(), self.sample_rate, 2)
+        self.active, self.length, self.speech_run, self.silence_run = False, 0, 0, 0
+        self.pre_roll[:] = 0
+        self.stats['segments'] += 1
+        return audio
+
+    def flush(self):
+        return [self.finish()] if self.active else []
+
+
+class VadSource:
+    """ An audio source (see listener.py) that yields only the speech segments of a stream of PCM chunks. """
+
+    def __init__(self, chunks, vad=None):
+        self.chunks = chunks
+        self.vad = vad or VoiceActivityDetector()
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.closed:  # Checked here, since a running generator can't be closed from another thread.
+                return
+            yield from self.vad.feed(chunk)
+        yield from self.vad.flush()
+
+    def close(self):
+        self.closed = True
+
+
+def pcm_chunks(path, chunk_ms=30):
+    """ Yields the frames of a 16-bit mono WAV file in chunks, as a microphone would. """
+    with wave.open(str(path), 'rb') as file:
+        assert file.getsampwidth() == 2 and file.getnchannels() == 1, 'Expected 16-bit mono PCM.'
+        size = file.getframerate() * chunk_ms // 1000
+        while data := file.readframes(size):
+            yield data
+
+
+def microphone_chunks(sample_rate=16000, chunk_ms=30, device_index=None):
+    """ Yields raw PCM chunks from the microphone. """
+    import speech_recognition as sr
+    with sr.Microphone(device_index=device_index, sample_rate=sample_rate, chunk_size=sample_rate * chunk_ms // 1000) as source:
+        while True:
+            yield source.stream.read(source.CHUNK)
@@ -33,33 +33,21 @@ If detected:
 
 
 from colorama import Fore, Style
+from pybiosis.experimental.matching import PhraseMatcher
+from pybiosis.experimental.listener import VoiceListener, MicrophoneSource, google_recognizer
+from pybiosis.experimental.vad import VoiceActivityDetector, VadSource, microphone_chunks
 import speech_recognition as sr
 import datetime
 import inspect
 import sys
 
 
-import pyttsx3 as pyttsx
+from pybiosis.experimental.speech import speak
 import time
-# time.sleep(6)
-engine = pyttsx.init()
 
 
-class _TTS:
 
-    engine = None
-    rate = None
-    def __init__(self):
-        self.engine = pyttsx.init()
-
-
-    def start(self,text_):
-        self.engine.say(text_)
-        self.engine.runAndWait()
-
-
-
-def cheesecake_action():
+def cheesecake_action(speak=speak):
     import winsound
     winsound.Beep(1000, 100)
     winsound.Beep(1000, 100)
@@ -71,13 +59,9 @@ def cheesecake_action():
             audio = recognizer.listen(source, timeout=5)
             command = recognizer.recognize_google(audio).lower()
 
-            tts = _TTS()
-            tts.start("Running: " + str(command))  # gets stuck here
-            tts.start("A second command")
-            del(tts)
-            # engine = pyttsx.init()
-            # engine.say("Running: " + str(command))
-            # engine.runAndWait()  # This hangs infinitely...  https://stackoverflow.com/questions/56032027/pyttsx3-runandwait-method-gets-stuck
+            # A single speech thread owns the engine, since creating several makes runAndWait hang.
+            speak("Running: " + str(command))
+            speak("A second command").result()  # Wait before the closing beeps.
     finally:
         winsound.Beep(1000, 100)
         winsound.Beep(1000, 100)
@@ -101,21 +85,25 @@ def callback(recognizer, audio):
 
 
 class VoiceCommandInterface:
-    def __init__(self, commands):
+    def __init__(self, commands, threshold=0.75, speak=speak):
+        """ speak(text, key=None) -> Future says the acknowledgements (the shared speech worker by default). """
         self.recognizer = sr.Recognizer()
         self.commands = commands
+        self.speak = speak
+        self.matcher = PhraseMatcher.from_phrases(commands, threshold=threshold)  # Tolerates mis-heard commands.
     
-    def listen_command_background(self):
-        engine.say("Ready for your command. Say hello.")
-        engine.runAndWait()
-
-        with sr.Microphone() as source:
-        # source = sr.Microphone()
-            print(">>> Listening...", end=' '); sys.stdout.flush()
-            self.recognizer.adjust_for_ambient_noise(source)
-        stop_listening = self.recognizer.listen_in_background(source, callback, phrase_time_limit=2)
-        while True:
-            pass
+    def listen_command_background(self, source=None, recognize=None, vad=True, **kwargs):
+        """ Listens until stopped. The source defaults to the microphone (eg: use WavFileSource to replay recordings).
+            With vad, only the speech in the microphone stream is sent to the recognizer (see VoiceActivityDetector).
+            The commands are executed on a worker pool, so a slow action doesn't block listening (see VoiceListener).
+        """
+        self.speak("Ready for your command. Say hello.")
+
+        print(">>> Listening...", end=' '); sys.stdout.flush()
+        if source is None:
+            source = VadSource(microphone_chunks(), VoiceActivityDetector()) if vad else MicrophoneSource(self.recognizer, phrase_time_limit=2)
+        self.listener = VoiceListener(source, recognize or google_recognizer(self.recognizer), self.evaluate_command, **kwargs)
+        return self.listener.run()
 
     # def listen_command(self):
     #     # print(sr.Microphone.list_microphone_names().index("Headphones (WH-1000XM3 Stereo)"))
@@ -142,11 +130,13 @@ class VoiceCommandInterface:
     #         return ""
 
     def evaluate_command(self, command):
-        action = self.commands.get(command)
+        match = self.matcher.match(command)
+        action = match.value if match else None
         if action:
-            engine.say(f'Very good Sir, performing action "{command}".');
-            engine.runAndWait()
-            action()
+            if match.phrase != command:
+                print(f"{Fore.YELLOW}Heard \"{command}\" as \"{match.phrase}\" ({match.confidence:.0%}){Style.RESET_ALL}")
+            self.speak(f'Very good Sir, performing action "{match.phrase}".', key='action')  # A newer command supersedes it.
+            action() if match.argument is None else action(match.argument)
         else:
             print(f"{Fore.RED}Command not recognized{Style.RESET_ALL}")
         return True
@@ -168,40 +158,39 @@ class VoiceCommandInterface:
 
 
 class Commands:
-    def __init__(self, command_actions=None):
-        """ If command_actions are supplied they are used, otherwise the class functions are used. """
+    def __init__(self, command_actions=None, speak=speak):
+        """ If command_actions are supplied they are used, otherwise the class functions are used.
+            speak is used like in VoiceCommandInterface.
+        """
         if command_actions is None:
             class_methods = inspect.getmembers(self, predicate=inspect.ismethod)
             self.actions = {cmd: fn for cmd, fn in class_methods if not cmd.startswith("__")}
         else:
             self.actions = command_actions
+        self.speak = speak  # Set after listing the actions, so that it isn't one.
 
     def hello(self):
         """ Say 'COMMAND_NAME' for a greeting. """
         print(f"\t- {Fore.BLUE}Hello! How can I assist you?{Style.RESET_ALL}")
-        engine.say(f"Hello and good day. How can I help you?")
-        engine.runAndWait()
+        self.speak(f"Hello and good day. How can I help you?")
 
     def time(self):
         """ Say 'COMMAND_NAME' to get the current time. """
         now = datetime.datetime.now()
         current_time = now.strftime("%H:%M:%S")
-        engine.say(f"The current time is {now.strftime("%I:%M %p")}.")
-        engine.runAndWait()
+        self.speak(f"The current time is {now.strftime("%I:%M %p")}.")
         print(f"\t- {Fore.BLUE}Current time is:{Style.RESET_ALL} {current_time}")
 
     def list(self):
         """ Say 'COMMAND_NAME' to list the possible commands. """
         for cmd, fn in self.actions.items():
             print(f"\t- {Fore.BLUE}{fn.__doc__.replace('COMMAND_NAME', cmd)}{Style.RESET_ALL}")
-        engine.say(f"The available commands are: {', '.join(self.actions)}.")
-        engine.runAndWait()
+        self.speak(f"The available commands are: {', '.join(self.actions)}.")
 
     def exit(self):
         """ Say 'COMMAND_NAME' to quit the program. """
         print(f"\t- {Fore.BLUE}Exiting...{Style.RESET_ALL}")
-        engine.say(f"Very good Sir, sleeping now, wake me if you need anything.")
-        engine.runAndWait()
+        self.speak(f"Very good Sir, sleeping now, wake me if you need anything.").result()
         return False
 
 
@@ -0,0 +1,274 @@
+""" A local HTTP gateway that calls the loaded functions directly, instead of starting an interpreter per trigger.
+
+	Endpoints (JSON in, JSON out):
+		GET  /health                      -> {"status": "ok", "functions": N}
+		GET  /metrics                     -> request counts and latency percentiles per endpoint.
+		POST /phrase  {"phrase": "..."}   -> resolves the phrase with the Assistant automaton and calls the function.
+		POST /call    {"function": "module.name", "args": [...], "kwargs": {...}}
+		POST /batch   [{"phrase": "..."}, {"function": "..."}, ...]  -> a list of results, run concurrently.
+
+	Connections are kept alive (HTTP/1.1), the functions run on a thread pool,
+	and at most max_concurrency calls run (or wait) at once; further calls are answered with 503.
+
+	It binds to localhost by default. Functions are only called by POST requests with a JSON body, which a web page
+	can't send to another origin without a preflight (that the gateway doesn't answer). Without a token, requests must
+	name a loopback Host, so that a page can't reach the gateway through a domain that resolves to 127.0.0.1 (DNS rebinding).
+	With a token, every request but /health needs an "Authorization: Bearer <token>" header; a token is required to
+	listen on other addresses.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from collections import defaultdict, deque
+import pybiosis.runtime as runtime
+import ipaddress
+import functools
+import asyncio
+import hmac
+import json
+import time
+import os
+
+STATUS = {
+	200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+	415: 'Unsupported Media Type', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class GatewayError(Exception):
+	def __init__(self, status, message):
+		super().__init__(message)
+		self.status = status
+
+
+def loopback(host):
+	if host == 'localhost':
+		return True
+	try:
+		return ipaddress.ip_address(host).is_loopback
+	except ValueError:
+		return False
+
+
+class Metrics:
+	""" Request counts and a window of recent latencies per endpoint. """
+	WINDOW = 1024
+
+	def __init__(self):
+		self.started = time.time()
+		self.counts = defaultdict(lambda: defaultdict(int))
+		self.latencies = defaultdict(lambda: deque(maxlen=self.WINDOW))
+
+	def record(self, endpoint, status, seconds):
+		self.counts[endpoint][status] += 1
+		self.latencies[endpoint].append(seconds)
+
+	@staticmethod
+	def percentile(values, q):
+		return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+	def summary(self):
+		endpoints = {}
+		for endpoint, counts in self.counts.items():
+			latencies = sorted(self.latencies[endpoint])
+			endpoints[endpoint] = {
+				'requests': sum(counts.values()),
+				'status': dict(counts),
+				**{f'p{int(q * 100)}_ms': round(self.percentile(latencies, q) * 1000, 3) for q in (0.5, 0.95, 0.99)},
+			}
+		return {'uptime_s': round(time.time() - self.started, 1), 'endpoints': endpoints}
+
+
+class Gateway:
+	""" Serves the functions over HTTP. functions: {"module.name": f}. automaton: a PhraseAutomaton (or None). """
+	MAX_BODY = 1 << 20
+	KEEP_ALIVE = 15  # Seconds an idle connection is kept open.
+
+	def __init__(self, functions, automaton=None, host='127.0.0.1', port=8765, workers=4, max_concurrency=32, token=None):
+		if not token and not loopback(host):
+			raise ValueError(f"Listening on {host} requires a token (--token or PYBIOSIS_GATEWAY_TOKEN).")
+		self.functions = functions
+		self.automaton = automaton
+		self.host, self.port = host, port
+		self.token = token
+		self.max_concurrency = max_concurrency
+		self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pybiosis-gateway')
+		self.metrics = Metrics()
+		self.pending = 0
+		self.server = None
+
+	@classmethod
+	def from_functions(cls, registry, **kwargs):
+		""" Builds the gateway from Device.FUNCTIONS. The phrases are resolved by the compiled automaton,
+			or by one built from the loaded Assistant functions if it wasn't compiled yet.
+		"""
+		from pybiosis.util.automaton import PhraseAutomaton
+		from pybiosis.compilers.assistant import Assistant
+
+		functions = {f'{f.module.__name__}.{f.name}': f for _, f in registry}
+		if os.path.exists(Assistant.AUTOMATON_FILE):
+			automaton = PhraseAutomaton.load(Assistant.AUTOMATON_FILE, copy=True)  # So that it can be recompiled meanwhile.
+		else:
+			automaton = cls.build_automaton(registry)
+		return cls(functions, automaton, **kwargs)
+
+	@staticmethod
+	def build_automaton(registry):
+		""" An automaton of the phrases of the loaded Assistant functions. """
+		from pybiosis.util.automaton import PhraseAutomaton
+		from pybiosis.compilers.assistant import Assistant
+		phrases = {f'{f.module.__name__}.{f.name}': f.phrase for c, f in registry if c is Assistant}
+		return PhraseAutomaton.from_grammars(list(phrases.items()))
+
+	def refresh(self, registry):
+		""" Swaps in the functions and phrases of the registry (eg: after the user modules were reloaded). """
+		self.functions, self.automaton = {f'{f.module.__name__}.{f.name}': f for _, f in registry}, self.build_automaton(registry)
+
+	async def call(self, request):
+		""" Resolves a request ({"phrase": ...} or {"function": ...}) and runs it on the pool. """
+		if not isinstance(request, dict):
+			raise GatewayError(400, 'A request must be a JSON object.')
+		args, kwargs = request.get('args', []), request.get('kwargs', {})
+		if not isinstance(args, list):
+			raise GatewayError(400, '"args" must be a JSON list.')
+		if not isinstance(kwargs, dict):
+			raise GatewayError(400, '"kwargs" must be a JSON object.')
+		args = list(args)
+		if 'phrase' in request:
+			match = self.automaton.lookup(str(request['phrase'])) if self.automaton else None
+			if match is None:
+				raise GatewayError(404, f"No function for the phrase: {request['phrase']!r}")
+			key, argument = match
+			if argument is not None:
+				args.insert(0, argument)
+		elif 'function' in request:
+			key = request['function']
+		else:
+			raise GatewayError(400, 'A request needs a "phrase" or a "function".')
+		if key not in self.functions:
+			raise GatewayError(404, f'Unknown function: {key}')
+
+		if self.pending >= self.max_concurrency:
+			raise GatewayError(503, 'Too many calls are running.')
+		self.pending += 1
+		start = time.perf_counter()
+		try:
+			await asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(runtime.call, self.functions[key], *args, **kwargs))
+		except Exception as e:
+			raise GatewayError(500, f'{type(e).__name__}: {e}')
+		finally:
+			self.pending -= 1
+		return {'status': 'ok', 'function': key, 'args': args, 'ms': round((time.perf_counter() - start) * 1000, 3)}
+
+	def check_host(self, headers):
+		""" Without a token, only requests addressed to a loopback host are served (see DNS rebinding above). """
+		if not self.token and not loopback(urlsplit(f"//{headers.get('host', '')}").hostname or ''):
+			raise GatewayError(403, f"Requests must be sent to localhost, not {headers.get('host')!r}.")
+
+	def authorize(self, headers):
+		expected = f'Bearer {self.token}'
+		if self.token and not hmac.compare_digest(headers.get('authorization', '').encode(), expected.encode()):
+			raise GatewayError(401, 'A valid "Authorization: Bearer <token>" header is required.')
+
+	async def route(self, method, path, headers, body):
+		""" Returns (status, payload). """
+		self.check_host(headers)
+		if path == '/health':
+			return 200, {'status': 'ok', 'functions': len(self.functions)}
+		self.authorize(headers)
+		if path == '/metrics':
+			return 200, self.metrics.summary()
+		if path not in ('/phrase', '/call', '/batch'):
+			raise GatewayError(404, f'Unknown path: {path}')
+		if method != 'POST':  # A GET could be sent by any web page (eg: an <img> tag).
+			raise GatewayError(405, f'{path} only accepts POST requests.')
+		if headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+			raise GatewayError(415, 'The body must be sent as application/json.')
+
+		try:
+			request = json.loads(body or b'null')
+		except json.JSONDecodeError as e:
+			raise GatewayError(400, f'Invalid JSON: {e}')
+
+		if path in ('/phrase', '/call'):
+			return 200, await self.call(request)
+		if path == '/batch':
+			if not isinstance(request, list):
+				raise GatewayError(400, 'A batch must be a JSON list.')
+			results = await asyncio.gather(*map(self.call, request), return_exceptions=True)
+			return 200, [r if isinstance(r, dict) else {'status': 'error', 'code': getattr(r, 'status', 500), 'error': str(r)} for r in results]
+
+	async def read_request(self, reader):
+		""" Returns (method, target, version, headers, body), or None when the connection is closed. """
+		line = await asyncio.wait_for(reader.readline(), self.KEEP_ALIVE)
+		if not line.strip():
+			return None
+		method, target, version = line.decode('latin-1').split()
+		headers = {}
+		while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+			name, _, value = line.decode('latin-1').partition(':')
+			headers[name.strip().lower()] = value.strip()
+		length = int(headers.get('content-length', 0))
+		if length > self.MAX_BODY:
+			raise GatewayError(413, 'The request body is too large.')
+		body = await reader.readexactly(length) if length else b''
+		return method, target, version, headers, body
+
+	async def handle(self, reader, writer):
+		""" Serves the requests of one connection until it is closed or idle. """
+		try:
+			while True:
+				try:
+					request = await self.read_request(reader)
+				except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+					break
+				except GatewayError as e:
+					await self.respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+					break
+				if request is None:
+					break
+
+				method, target, version, headers, body = request
+				connection = headers.get('connection', '').lower()
+				keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+				url = urlsplit(target)
+				start = time.perf_counter()
+				try:
+					status, payload = await self.route(method, url.path, headers, body)
+				except GatewayError as e:
+					status, payload = e.status, {'status': 'error', 'error': str(e)}
+				self.metrics.record(url.path, status, time.perf_counter() - start)
+				await self.respond(writer, status, payload, keep_alive)
+				if not keep_alive:
+					break
+		finally:
+			writer.close()
+
+	async def respond(self, writer, status, payload, keep_alive):
+		body = json.dumps(payload).encode('utf-8')
+		head = (
+			f'HTTP/1.1 {status} {STATUS.get(status, "")}\r\n'
+			f'Content-Type: application/json\r\n'
+			f'Content-Length: {len(body)}\r\n'
+			f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+		)
+		writer.write(head.encode('latin-1') + body)
+		await writer.drain()
+
+	async def start(self):
+		""" Starts listening (port 0 picks a free port, see self.port) and returns the asyncio server. """
+		self.server = await asyncio.start_server(self.handle, self.host, self.port)
+		self.port = self.server.sockets[0].getsockname()[1]
+		return self.server
+
+	async def serve(self):
+		async with await self.start():
+			await self.server.serve_forever()
+
+	def run(self):
+		""" Serves until interrupted. """
+		try:
+			asyncio.run(self.serve())
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self.pool.shutdown(wait=False)
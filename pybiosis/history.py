@@ -0,0 +1,173 @@
+""" A record of every call of a Pybiosis function, in .compilers/history.db (SQLite).
+
+	The call path only puts a row on a queue; a background thread writes the rows in batches
+	(and once more when the process exits). The database is in WAL mode, so the processes that
+	run functions and the ones that query the history don't block each other.
+	Rows older than PYBIOSIS_HISTORY_DAYS (90 by default) are pruned when a writer starts.
+"""
+import threading
+import logging
+import sqlite3
+import atexit
+import queue
+import time
+import os
+
+STATUSES = ['ok', 'failed', 'timeout', 'memory', 'skipped']
+RETENTION_DAYS = float(os.getenv('PYBIOSIS_HISTORY_DAYS', 90))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+	id INTEGER PRIMARY KEY,
+	function TEXT NOT NULL,
+	started REAL NOT NULL,
+	duration REAL NOT NULL,
+	status TEXT NOT NULL,
+	error TEXT,
+	pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_function ON runs (function, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, started);
+CREATE INDEX IF NOT EXISTS runs_duration ON runs (duration);
+'''
+COLUMNS = ['function', 'started', 'duration', 'status', 'error', 'pid']
+
+
+def connect(path):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+	connection.execute('PRAGMA journal_mode=WAL')
+	connection.execute('PRAGMA synchronous=NORMAL')
+	connection.executescript(SCHEMA)
+	return connection
+
+
+class HistoryWriter:
+	""" Writes the recorded rows on a background thread, in batches of up to BATCH rows. """
+
+	BATCH = 500
+	INTERVAL = 0.5  # Seconds to wait for more rows before writing a batch.
+
+	def __init__(self, path, retention_days=RETENTION_DAYS):
+		self.path = path
+		self.retention_days = retention_days
+		self.rows = queue.SimpleQueue()
+		self.thread = threading.Thread(target=self.run, name='pybiosis-history', daemon=True)
+		self.thread.start()
+		atexit.register(self.close)
+
+	def record(self, function, started, duration, status, error=None):
+		if self.thread.is_alive():  # Otherwise the database couldn't be opened, and the rows are dropped.
+			self.rows.put((function, started, duration, status, error, os.getpid()))
+
+	def run(self):
+		try:
+			connection = connect(self.path)
+			prune(connection, self.retention_days)
+		except (sqlite3.Error, OSError) as e:
+			logging.warning(f"The history can't be recorded in {self.path}: {e}")
+			return
+		closing = False
+		while not closing:
+			batch = [self.rows.get()]
+			deadline = time.monotonic() + self.INTERVAL
+			while len(batch) < self.BATCH and (remaining := deadline - time.monotonic()) > 0:
+				try:
+					batch.append(self.rows.get(timeout=remaining))
+				except queue.Empty:
+					break
+			closing = None in batch
+			batch = [row for row in batch if row is not None]
+			if batch:
+				try:
+					with connection:
+						connection.executemany(f'INSERT INTO runs ({", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)', batch)
+				except sqlite3.Error as e:  # Eg: the database is locked for too long. These rows are dropped.
+					logging.warning(f"Dropped {len(batch)} history row(s): {e}")
+		connection.close()
+
+	def close(self, timeout=5):
+		""" Writes the remaining rows. """
+		if self.thread.is_alive():
+			self.rows.put(None)
+			self.thread.join(timeout)
+
+
+def prune(connection, retention_days):
+	""" Deletes the rows older than retention_days. Returns the number deleted. """
+	with connection:
+		return connection.execute('DELETE FROM runs WHERE started < ?', (time.time() - retention_days * 86400,)).rowcount
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+	global _writer
+	with _writer_lock:
+		if _writer is None:
+			from pybiosis.runtime import state_path
+			_writer = HistoryWriter(str(state_path('history.db')))
+		return _writer
+
+
+def record(function, started, duration, status, error=None):
+	""" Records a call (without waiting for it to be written). """
+	get_writer().record(function, started, duration, status, error)
+
+
+class History:
+	""" Queries the history database. """
+
+	def __init__(self, path):
+		self.connection = connect(path)
+
+	@staticmethod
+	def where(function=None, status=None, since=None, until=None):
+		""" Returns the WHERE clause and its parameters. function may contain * wildcards. """
+		clauses, parameters = [], []
+		if function:
+			clauses.append('function GLOB ?' if '*' in function else 'function = ?')
+			parameters.append(function)
+		if status:
+			clauses.append('status = ?')
+			parameters.append(status)
+		if since is not None:
+			clauses.append('started >= ?')
+			parameters.append(since)
+		if until is not None:
+			clauses.append('started < ?')
+			parameters.append(until)
+		return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', parameters
+
+	def runs(self, limit=50, **filters):
+		""" The latest runs, newest first, as dictionaries. """
+		where, parameters = self.where(**filters)
+		cursor = self.connection.execute(f'SELECT {", ".join(COLUMNS)} FROM runs{where} ORDER BY started DESC LIMIT ?', parameters + [limit])
+		return [dict(zip(COLUMNS, row)) for row in cursor]
+
+	def slowest(self, n=10, **filters):
+		where, parameters = self.where(**filters)
+		cursor = self.connection.execute(f'SELECT {", ".join(COLUMNS)} FROM runs{where} ORDER BY duration DESC LIMIT ?', parameters + [n])
+		return [dict(zip(COLUMNS, row)) for row in cursor]
+
+	def summary(self, percentiles=(50, 95, 99), **filters):
+		""" Per function: the number of runs, of failures, and the duration percentiles (in seconds). """
+		where, parameters = self.where(**filters)
+		cursor = self.connection.execute(f'SELECT function, status, duration FROM runs{where} ORDER BY function, duration', parameters)
+		summary = {}
+		for function, status, duration in cursor:
+			entry = summary.setdefault(function, {'runs': 0, 'failed': 0, 'durations': []})
+			entry['runs'] += 1
+			entry['failed'] += status in ('failed', 'timeout', 'memory')
+			entry['durations'].append(duration)
+		for entry in summary.values():
+			durations = entry.pop('durations')
+			for p in percentiles:
+				entry[f'p{p}'] = durations[min(len(durations) - 1, int(len(durations) * p / 100))]
+		return summary
+
+	def prune(self, retention_days=RETENTION_DAYS):
+		return prune(self.connection, retention_days)
@@ -0,0 +1,148 @@
+""" Import-time report of the user modules, for `bb load --timings`.
+
+	Every user module is timed (wall time) and measured (the growth of the process' RSS) while it is imported,
+	and `builtins.__import__` is wrapped meanwhile, so the modules it imports for the first time (directly or not)
+	are attributed to it, with their own time. A baseline is kept in .compilers/import_timings.json, and
+	the modules that got slower than it by more than a threshold are flagged.
+"""
+import importlib.util
+import contextlib
+import builtins
+import time
+import json
+import sys
+import os
+
+try:
+	import psutil
+except ImportError:
+	psutil = None
+
+MIN_REGRESSION_MS = 5  # Below this, a slowdown is noise.
+
+
+def rss():
+	""" The resident memory of this process in bytes (None if it can't be read). """
+	if psutil is not None:
+		return psutil.Process().memory_info().rss
+	try:
+		with open('/proc/self/statm') as file:
+			return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError, AttributeError):
+		return None
+
+
+class ImportTimings:
+	""" Collects the timings of load_user_modules: self.modules = {user module: entry}, where an entry has
+		the module's 'ms', 'memory' (bytes), 'status' and 'imports' ({nested module: [cumulative ms, self ms]}).
+	"""
+
+	def __init__(self):
+		self.modules = {}
+		self.stack = []  # [name, start, time of the children] of the imports in progress.
+		self.current = None
+
+	@contextlib.contextmanager
+	def measure(self, module):
+		""" Measures the import of a user module (its path, as given by get_user_modules). """
+		entry = self.modules[module] = {'ms': 0.0, 'memory': None, 'status': 'ok', 'imports': {}}
+		original = builtins.__import__
+		builtins.__import__ = self.timed_import(original)
+		self.current = entry
+		memory, start = rss(), time.perf_counter()
+		try:
+			yield entry
+		except BaseException as e:
+			entry['status'] = type(e).__name__
+			raise
+		finally:
+			entry['ms'] = (time.perf_counter() - start) * 1000
+			if memory is not None:
+				entry['memory'] = rss() - memory
+			builtins.__import__ = original
+			self.current = None
+
+	def timed_import(self, original):
+		def __import__(name, globals=None, locals=None, fromlist=(), level=0):
+			if level:
+				try:
+					name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+				except (ImportError, ValueError):
+					return original(name, globals, locals, fromlist, level)
+			if self.current is None:
+				return original(name, globals, locals, fromlist, 0)
+			if name not in sys.modules:
+				self.timed(name, original)
+
+			# The submodules of `from package import submodule` are imported without going through __import__.
+			module = sys.modules.get(name)
+			for item in fromlist or ():
+				if item != '*' and hasattr(module, '__path__') and not hasattr(module, item) and f'{name}.{item}' not in sys.modules:
+					try:
+						self.timed(f'{name}.{item}', original)
+					except ModuleNotFoundError as e:
+						if e.name != f'{name}.{item}':  # Otherwise, it's an attribute that doesn't exist (an ImportError below).
+							raise
+			return original(name, globals, locals, fromlist, 0)
+		return __import__
+
+	def timed(self, name, original):
+		""" Imports the module, recording its cumulative and own time. """
+		frame = [name, time.perf_counter(), 0.0]
+		self.stack.append(frame)
+		try:
+			original(name, None, None, (), 0)
+		finally:
+			self.stack.pop()
+			cumulative = (time.perf_counter() - frame[1]) * 1000
+			if self.stack:
+				self.stack[-1][2] += cumulative
+			self.current['imports'][name] = [cumulative, cumulative - frame[2]]
+
+	def report(self, baseline=None, threshold=25, top=3):
+		""" The lines of the report, slowest module first. With a baseline, flags the modules that are
+			more than threshold % (and MIN_REGRESSION_MS) slower than it.
+		"""
+		baseline = baseline or {}
+		lines = [f"{'module':<40} {'ms':>9} {'memory':>10} {'imports':>8}  heaviest imports (self ms)"]
+		for module, entry in sorted(self.modules.items(), key=lambda item: -item[1]['ms']):
+			memory = '' if entry['memory'] is None else f"{entry['memory'] / 2**20:.1f} MiB"
+			heaviest = sorted(entry['imports'].items(), key=lambda item: -item[1][1])[:top]
+			line = f"{module:<40} {entry['ms']:>9.1f} {memory:>10} {len(entry['imports']):>8}  " + ', '.join(f'{name} ({own:.1f})' for name, (_, own) in heaviest)
+			if entry['status'] != 'ok':
+				line += f"  [{entry['status']}]"
+			if (regression := self.regression(module, baseline, threshold)) is not None:
+				line += f"  ⚠ +{regression:.0f}% vs baseline ({baseline[module]['ms']:.1f} ms)"
+			lines.append(line)
+		total = sum(entry['ms'] for entry in self.modules.values())
+		lines.append(f"{'total':<40} {total:>9.1f}")
+		return lines
+
+	def regression(self, module, baseline, threshold):
+		""" The slowdown of the module in % if it is beyond the threshold, otherwise None. """
+		if module not in baseline or module not in self.modules:
+			return None
+		before, after = baseline[module]['ms'], self.modules[module]['ms']
+		if after - before < MIN_REGRESSION_MS or after <= before * (1 + threshold / 100):
+			return None
+		return (after / before - 1) * 100 if before else float('inf')
+
+	def regressions(self, baseline, threshold=25):
+		return [m for m in self.modules if self.regression(m, baseline, threshold) is not None]
+
+	def to_json(self):
+		return {module: {'ms': entry['ms'], 'memory': entry['memory']} for module, entry in self.modules.items()}
+
+
+def load_baseline(path):
+	try:
+		with open(path) as file:
+			return json.load(file)
+	except FileNotFoundError:
+		return None
+
+
+def save_baseline(path, timings):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, 'w') as file:
+		json.dump(timings.to_json(), file, indent=4)
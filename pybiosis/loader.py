@@ -1,7 +1,7 @@
 from pybiosis.util.config import ConfigurationManager
+import pybiosis.util.general as general
 from pathlib import Path
 import pybiosis.validate as validate
-import importlib
 import glob
 import sys
 import os
@@ -21,35 +21,23 @@ def get_user_modules():
 	modules = [m.replace(str(get_user_path()), '') for m in modules if __file__ not in m]
 	return modules
 
-def load_user_modules():
+def load_user_modules(timings=None):
+	""" Imports the user modules. With timings (see pybiosis.importtime), each import is timed and measured. """
 	for module in get_user_modules():
 		try:
-			import_from_path(module)
+			if timings is None:
+				import_from_path(module)
+			else:
+				with timings.measure(module):
+					import_from_path(module)
 		except ModuleNotFoundError as e:
 			# Hmm... new streamlit dashboard in my user dir is causing an error.
 			# I'm ignoring it as an exception since I dont need it to import.
 			print(f"Error loading user module: {module}, {e}")
 
 def import_from_path(module):
-	module = module.replace('\\', '.')
-	module = module.replace('/', '.')
-	module = module.lstrip('.')
-	module = module.rpartition('.py')[0]
-	module = importlib.import_module(module)
-	return module
+	""" Imports a user module given its path relative to the user path (eg: /folder/module.py), once. """
+	return general.import_module(module, get_user_path())
 
 def import_user_module(path):
-	file_path = get_user_path() / path
-	
-	# Extract the module name from the file path
-	module_name = str(file_path).split('/')[-1].split('.')[0]
-
-	# # Add the directory containing the file to the system path
-	# sys.path.append('/'.join(file_path.split('/')[:-1]))
-
-	# Load the module
-	spec = importlib.util.spec_from_file_location(module_name, file_path)
-	module = importlib.util.module_from_spec(spec)
-	spec.loader.exec_module(module)
-
-	return module
\ No newline at end of file
+	return general.import_module(path, get_user_path())
\ No newline at end of file
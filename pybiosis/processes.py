@@ -0,0 +1,292 @@
+""" Runs the user's driver.py with its output pumped into rotating logs, so it never blocks on a full pipe.
+
+	Threads read the driver's stdout and stderr as the data arrives, and write each line to
+	.compilers/user/driver.log (rotated at PYBIOSIS_USER_LOG_BYTES, 5 MiB by default, keeping LOG_BACKUPS files)
+	and to a ring buffer of the latest lines. The exit status and runtime are written to .compilers/user/driver.json
+	and recorded in the history (as "driver.py").
+
+	A detached driver is run by a supervisor process (`python -m pybiosis.processes -- command...`) that keeps
+	pumping its output after `bb user` exits (its own errors go to .compilers/user/supervisor.log). `bb user --tail`
+	shows the end of the log, and follows it while the driver runs.
+"""
+from logging.handlers import RotatingFileHandler
+from collections import deque
+import subprocess
+import threading
+import logging
+import time
+import json
+import sys
+import os
+
+LOG_BYTES = int(os.getenv('PYBIOSIS_USER_LOG_BYTES', 5 * 2**20))
+LOG_BACKUPS = 3
+CHUNK = 1 << 16
+
+
+def user_state(name):
+	from pybiosis.runtime import state_path
+	path = state_path('user', name)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	return str(path)
+
+
+class OutputPump(threading.Thread):
+	""" Reads a pipe as the data arrives (not only whole lines, so prompts are echoed), and passes each line to write.
+		A line longer than CHUNK is split, so memory stays bounded whatever is written.
+	"""
+
+	def __init__(self, pipe, write, echo=None):
+		super().__init__(name='pybiosis-output', daemon=True)
+		self.pipe, self.write, self.echo = pipe, write, echo
+		self.bytes = 0
+
+	def run(self):
+		partial = b''
+		try:
+			while chunk := os.read(self.pipe.fileno(), CHUNK):
+				self.bytes += len(chunk)
+				if self.echo is not None:
+					self.echo.write(chunk)
+					self.echo.flush()
+				*lines, partial = (partial + chunk).split(b'\n')
+				if len(partial) >= CHUNK:
+					lines.append(partial)
+					partial = b''
+				for line in lines:
+					self.write(line)
+			if partial:
+				self.write(partial)
+		finally:
+			self.pipe.close()
+
+
+class DriverLog(RotatingFileHandler):
+	""" A RotatingFileHandler that keeps writing to the log while it can't be rotated (on Windows, when another process
+		has it open), rather than losing the record and shifting the backups at every attempt.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.rotation_failed = False
+
+	def doRollover(self):
+		if not self.backupCount:
+			return super().doRollover()
+		if self.stream:
+			self.stream.close()
+			self.stream = None
+		pending = self.baseFilename + '.rotating'
+		try:
+			os.replace(self.baseFilename, pending)
+		except PermissionError as e:
+			if not self.rotation_failed:
+				logging.warning(f"Pybiosis: could not rotate {self.baseFilename}, retrying with the next lines ({e}).")
+			self.rotation_failed = True
+			self.stream = self._open()
+			return
+		self.rotation_failed = False
+		super().doRollover()  # Shifts the backups, and opens a new log.
+		os.replace(pending, self.rotation_filename(f'{self.baseFilename}.1'))
+
+
+class DriverProcess:
+	""" A driver process whose output goes to a rotating log and a ring buffer (see self.tail). """
+
+	def __init__(self, command, cwd, log_path=None, status_path=None, ring_size=1000, echo=False,
+			max_bytes=LOG_BYTES, backups=LOG_BACKUPS):
+		self.command, self.cwd, self.echo = command, cwd, echo
+		self.log_path = log_path or user_state('driver.log')
+		self.status_path = status_path or user_state('driver.json')
+		self.log = DriverLog(self.log_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+		self.log.setFormatter(logging.Formatter('%(message)s'))
+		self.ring = deque(maxlen=ring_size)
+		self.process = None
+		self.pumps = []
+		self.started = None
+		self.returncode = None
+
+	def start(self):
+		self.started = time.time()
+		self.clock = time.perf_counter()
+		env = dict(os.environ, PYTHONUNBUFFERED='1')  # Otherwise a piped driver only writes when its buffer is full.
+		self.process = subprocess.Popen(self.command, cwd=self.cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		self.pumps = [
+			OutputPump(self.process.stdout, lambda line: self.write(line), self.echo_stream(sys.stdout)),
+			OutputPump(self.process.stderr, lambda line: self.write(line, 'stderr: '), self.echo_stream(sys.stderr)),
+		]
+		for pump in self.pumps:
+			pump.start()
+		self.write_line(f"[pybiosis] Started {' '.join(map(str, self.command))} (pid {self.process.pid}).")
+		self.save_status('running')
+		return self
+
+	def echo_stream(self, stream):
+		return getattr(stream, 'buffer', None) if self.echo else None
+
+	def write(self, line, prefix=''):
+		self.write_line(prefix + line.decode('utf-8', errors='replace').rstrip('\r'))
+
+	def write_line(self, text):
+		self.ring.append(text)
+		self.log.handle(logging.makeLogRecord({'msg': text, 'levelno': logging.INFO}))
+
+	def tail(self, n=None):
+		""" The latest lines of output (at most ring_size). """
+		lines = list(self.ring)
+		return lines if n is None else lines[-n:]
+
+	def wait(self):
+		""" Waits for the driver to exit (and its output to be written). Returns its exit status. """
+		while True:
+			try:
+				self.returncode = self.process.wait()
+				break
+			except KeyboardInterrupt:  # The driver is interrupted as well, so wait for it to finish.
+				continue
+		for pump in self.pumps:
+			pump.join()
+		duration = time.perf_counter() - self.clock
+		self.write_line(f"[pybiosis] Exited with status {self.returncode} after {duration:.3f}s.")
+		self.save_status('exited', duration)
+		self.log.close()
+
+		from pybiosis.runtime import HISTORY
+		if HISTORY:
+			import pybiosis.history as history
+			history.record('driver.py', self.started, duration, 'ok' if self.returncode == 0 else 'failed',
+				None if self.returncode == 0 else f'Exit status {self.returncode}')
+		return self.returncode
+
+	def save_status(self, state, duration=None):
+		status = {
+			'state': state,
+			'command': list(map(str, self.command)),
+			'pid': self.process.pid,
+			'supervisor': os.getpid(),
+			'started': self.started,
+			'returncode': self.returncode,
+			'duration': duration,
+			'output_bytes': sum(pump.bytes for pump in self.pumps),
+			'log': self.log_path,
+		}
+		temporary = self.status_path + '.tmp'
+		with open(temporary, 'w') as file:
+			json.dump(status, file, indent=4)
+		os.replace(temporary, self.status_path)
+
+
+def load_status(path=None):
+	try:
+		with open(path or user_state('driver.json')) as file:
+			return json.load(file)
+	except (FileNotFoundError, json.JSONDecodeError):
+		return None
+
+
+def alive(pid):
+	if os.name == 'nt':  # os.kill would terminate the process, so the status file is trusted.
+		return True
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+
+def running(status):
+	return bool(status) and status['state'] == 'running' and alive(status['supervisor'])
+
+
+def read_lines(file, position=0):
+	""" The complete lines of an open (binary) file from position, and the position after them
+		(a partial line is read the next time).
+	"""
+	file.seek(position)
+	data = file.read()
+	data = data[:data.rfind(b'\n') + 1]
+	return data.decode('utf-8', errors='replace').splitlines(), position + len(data)
+
+
+def last_lines(log_path, n):
+	""" The last n lines of the log (and its rotated files), and where they end: (lines, (inode of the log, position)). """
+	lines, end = deque(maxlen=n), (None, 0)
+	for path in [f'{log_path}.{i}' for i in range(LOG_BACKUPS, 0, -1)] + [log_path]:
+		try:
+			with open(path, 'rb') as file:
+				found, position = read_lines(file)
+				if path == log_path:
+					end = (os.fstat(file.fileno()).st_ino, position)
+		except FileNotFoundError:
+			continue
+		lines.extend(found)
+	return list(lines), end
+
+
+def rotated_lines(log_path, inode, position):
+	""" The lines of a rotated log from position (found among the backups by its inode), and of the backups
+		rotated after it (when the log was rotated several times since it was read).
+	"""
+	lines, found = [], False
+	for path in [f'{log_path}.{i}' for i in range(LOG_BACKUPS, 0, -1)] + [f'{log_path}.rotating']:
+		try:
+			with open(path, 'rb') as file:
+				if os.fstat(file.fileno()).st_ino == inode:
+					lines, found = read_lines(file, position)[0], True
+				elif found:
+					lines += read_lines(file)[0]
+		except FileNotFoundError:
+			continue
+	return lines
+
+
+def follow(log_path, status_path=None, interval=0.2, output=print, start=None):
+	""" Prints the lines added to the log while the driver runs, from start ((inode of the log, position), its end by default).
+		The log is only open while it's read, since Windows can't rotate an open file. When it has been rotated,
+		the rest of the previous log is read from its backup first.
+	"""
+	current, position = start or (None, 0)
+	if start is None and os.path.exists(log_path):
+		current, position = os.stat(log_path).st_ino, os.path.getsize(log_path)
+	while True:
+		try:
+			with open(log_path, 'rb') as file:
+				latest = os.fstat(file.fileno()).st_ino
+				if latest != current:
+					if current is not None:
+						for line in rotated_lines(log_path, current, position):
+							output(line)
+					current, position = latest, 0
+				lines, position = read_lines(file, position)
+		except FileNotFoundError:
+			lines = []
+		for line in lines:
+			output(line)
+		if not running(load_status(status_path)):
+			return
+		time.sleep(interval)
+
+
+def tail(n=50, log_path=None, status_path=None, output=print):
+	""" Prints the last n lines of the driver's output, and follows it while the driver runs. """
+	log_path = log_path or user_state('driver.log')
+	lines, end = last_lines(log_path, n)  # Following from where they end, so no line is missed in between.
+	for line in lines:
+		output(line)
+	follow(log_path, status_path, output=output, start=end)
+	status = load_status(status_path)
+	if status and status['state'] == 'exited':
+		output(f"The driver exited with status {status['returncode']} after {status['duration']:.3f}s.")
+
+
+def main(argv=None):
+	""" The supervisor of a detached driver: `python -m pybiosis.processes -- command...`. """
+	argv = sys.argv[1:] if argv is None else argv
+	command = argv[argv.index('--') + 1:] if '--' in argv else argv
+	return DriverProcess(command, os.getcwd()).start().wait()
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,161 @@
+""" Profiling of Pybiosis functions, written to .compilers/profiles/.
+
+	A profiled call writes:
+		<function>-<time>.pstats           cProfile statistics (`python -m pstats file`, snakeviz, ...).
+		<function>-<time>.collapsed        collapsed stacks, for flame graphs (flamegraph.pl, speedscope, ...).
+		<function>-<time>.allocations.txt  the top allocations and peak memory (only with memory=True, using tracemalloc).
+
+	It is used by `bb run --profile module.function`, and by `Device(profile=...)` for production calls:
+		profile=True profiles every call, profile=N profiles every Nth call (counted across processes),
+		and profile_memory=True also traces the allocations.
+"""
+from pybiosis.util.locks import FileLock
+import tracemalloc
+import threading
+import datetime
+import cProfile
+import logging
+import pstats
+import os
+
+TOP_ALLOCATIONS = 25
+MAX_DEPTH = 100
+MAX_STACKS = 20000
+MIN_SHARE = 0.001  # Stacks with less of the total time than this are merged into an "[other]" frame of their caller.
+ACTIVE = threading.Lock()  # Held while a call is profiled: since Python 3.12, only one profiler can be enabled at once.
+
+
+def label(function):
+	""" A short name for a pstats function key (file, line, name). """
+	file, line, name = function
+	if file == '~':  # Built-in
+		return name
+	return f'{os.path.basename(file)}:{line}({name})'
+
+
+def collapsed_stacks(stats):
+	""" Returns {"root;caller;callee": microseconds of self time}, from the caller/callee graph of pstats.
+
+		cProfile doesn't record full stacks, so the time of a function called from several places is split
+		between its callers in proportion to the cumulative time spent on each call edge.
+		The number of paths can grow exponentially with the depth of the graph, so the paths with less than
+		MIN_SHARE of the total time (or beyond MAX_DEPTH and MAX_STACKS) are merged into an "[other]" frame.
+	"""
+	children = {}
+	for function, (_, _, _, _, callers) in stats.items():
+		for caller, (_, _, _, edge_time) in callers.items():
+			children.setdefault(caller, []).append((function, edge_time))
+
+	stacks = {}
+	pending = [((root,), stats[root][3]) for root, entry in stats.items() if not entry[4]]
+	threshold = sum(time for _, time in pending) * MIN_SHARE
+	expanded = 0
+	while pending:
+		path, time_on_path = pending.pop()
+		function = path[-1]
+		_, _, self_time, total_time, _ = stats[function]
+		fraction = time_on_path / total_time if total_time else 0
+		key = ';'.join(map(label, path))
+		stacks[key] = stacks.get(key, 0) + self_time * fraction * 1e6
+		expanded += 1
+		for child, edge_time in children.get(function, []):
+			if child in path:
+				continue
+			if edge_time * fraction < threshold or len(path) >= MAX_DEPTH or expanded + len(pending) >= MAX_STACKS:
+				stacks[key + ';[other]'] = stacks.get(key + ';[other]', 0) + edge_time * fraction * 1e6
+			else:
+				pending.append((path + (child,), edge_time * fraction))
+	return stacks
+
+
+class Profiler:
+	""" Profiles the code in its context, and writes the reports on exit (see self.paths). """
+
+	def __init__(self, key, memory=False, directory=None):
+		if directory is None:
+			from pybiosis.runtime import state_path
+			directory = state_path('profiles')
+		self.key = key
+		self.memory = memory
+		self.directory = directory
+		self.profile = cProfile.Profile()
+		self.paths = []
+
+	def __enter__(self):
+		self.active = ACTIVE.acquire(blocking=False)
+		if not self.active:
+			logging.warning(f"Not profiling {self.key}: another call is being profiled.")
+			return self
+		try:
+			self.profile.enable()
+		except ValueError as e:  # Another profiler (eg: a debugger) is enabled.
+			ACTIVE.release()
+			self.active = False
+			logging.warning(f"Not profiling {self.key}: {e}")
+			return self
+		self.tracing = self.memory and not tracemalloc.is_tracing()
+		if self.tracing:
+			tracemalloc.start()
+		return self
+
+	def __exit__(self, *exc):
+		if not self.active:
+			return
+		try:
+			self.profile.disable()
+		finally:
+			ACTIVE.release()
+		snapshot = tracemalloc.take_snapshot() if self.memory else None
+		peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+		if self.tracing:
+			tracemalloc.stop()
+		self.write(snapshot, peak)
+
+	def write(self, snapshot=None, peak=None):
+		os.makedirs(self.directory, exist_ok=True)
+		stem = os.path.join(self.directory, f"{self.key}-{datetime.datetime.now():%Y%m%d-%H%M%S-%f}")
+
+		self.profile.dump_stats(stem + '.pstats')
+		self.paths.append(stem + '.pstats')
+
+		stats = pstats.Stats(self.profile).stats
+		with open(stem + '.collapsed', 'w') as file:
+			for stack, microseconds in sorted(collapsed_stacks(stats).items()):
+				if round(microseconds):
+					file.write(f'{stack} {round(microseconds)}\n')
+		self.paths.append(stem + '.collapsed')
+
+		if snapshot is not None:
+			with open(stem + '.allocations.txt', 'w') as file:
+				file.write(f'Peak traced memory: {peak / 2**20:.2f} MiB\n\n')
+				for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+					file.write(f'{statistic}\n')
+			self.paths.append(stem + '.allocations.txt')
+
+
+def sampled(key, every):
+	""" Counts a call of the function (in a file, so calls from every process are counted), and returns
+		whether it is the Nth one.
+	"""
+	from pybiosis.runtime import state_path
+	path = state_path('profiles', f'{key}.count')
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with FileLock(str(path) + '.lock'):
+		try:
+			with open(path) as file:
+				count = int(file.read() or 0) + 1
+		except (FileNotFoundError, ValueError):
+			count = 1
+		with open(path, 'w') as file:
+			file.write(str(count))
+	return count % every == 0
+
+
+def for_call(f, key):
+	""" Returns a Profiler if this call of f should be profiled (see Device(profile=...)), otherwise None. """
+	every = getattr(f, 'profile', None)
+	if not every:
+		return None
+	if every is not True and int(every) > 1 and not sampled(key, int(every)):
+		return None
+	return Profiler(key, memory=bool(getattr(f, 'profile_memory', None)))
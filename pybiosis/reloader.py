@@ -0,0 +1,330 @@
+""" Hot reload of the user modules that changed, for long-running processes (the GUI, `bb serve --reload`, a REPL).
+
+	A watcher reports the user files that changed (inotify on Linux, otherwise a polling stat cache).
+	The modules to reload are the changed ones and those that import them (directly or not), from an import
+	graph of the user modules (their import statements, parsed again only when a file changes). Their functions
+	are unregistered from Device.FUNCTIONS, and the modules are reloaded in import order, dependencies first,
+	so the registry holds exactly one entry per function however many times the modules are reloaded.
+
+		reloader = Reloader(get_user_path())
+		reloader.start()  # Or reloader.poll() now and then.
+"""
+from pybiosis.core import Device
+from pathlib import Path
+import pybiosis.util.general as general
+import pybiosis.loader as loader
+import importlib
+import threading
+import ctypes
+import select
+import struct
+import time
+import ast
+import sys
+import os
+
+IGNORED_DIRECTORIES = {'__pycache__'}
+
+
+def watched(path):
+	""" Whether a path is a user file that can change what's loaded (not hidden, not a cache). """
+	parts = Path(path).parts
+	return str(path).endswith('.py') and not any(p.startswith('.') or p in IGNORED_DIRECTORIES for p in parts[:-1])
+
+
+def user_files(root):
+	""" The paths of the watched files under root. """
+	for directory, directories, files in os.walk(root):
+		directories[:] = [d for d in directories if not d.startswith('.') and d not in IGNORED_DIRECTORIES]
+		yield from (os.path.join(directory, file) for file in files if file.endswith('.py'))
+
+
+class PollingWatcher:
+	""" Finds the changed files by comparing the (mtime, size) of every user file with the previous scan. """
+
+	def __init__(self, root, interval=1.0):
+		self.root = Path(root)
+		self.interval = interval
+		self.stats = self.scan()
+
+	def scan(self):
+		stats = {}
+		for path in user_files(self.root):
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			stats[path] = (stat.st_mtime_ns, stat.st_size)
+		return stats
+
+	def changes(self, timeout=None):
+		""" Returns the paths that were changed, added or removed, waiting up to timeout seconds for one. """
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			stats = self.scan()
+			changed = {p for p in stats.keys() | self.stats.keys() if stats.get(p) != self.stats.get(p)}
+			self.stats = stats
+			if changed or (deadline is not None and time.monotonic() >= deadline):
+				return changed
+			time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+
+	def close(self):
+		pass
+
+
+class InotifyWatcher:
+	""" Finds the changed files with inotify (Linux), so nothing is scanned while the files don't change. """
+
+	IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x2, 0x8, 0x40, 0x80
+	IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_ISDIR = 0x100, 0x200, 0x400, 0x40000000
+	IN_NONBLOCK, IN_CLOEXEC = os.O_NONBLOCK, 0o2000000
+	MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+	EVENT = struct.Struct('iIII')
+	DEBOUNCE = 0.05  # Seconds to wait for the other events of a save (editors often write, rename and delete).
+
+	def __init__(self, root):
+		self.libc = ctypes.CDLL('libc.so.6', use_errno=True)
+		self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+		self.directories = {}  # Watch descriptor -> directory.
+		self.add(str(root))
+
+	def add(self, root):
+		""" Watches a directory and its subdirectories. """
+		for directory, directories, _ in os.walk(root):
+			directories[:] = [d for d in directories if not d.startswith('.') and d not in IGNORED_DIRECTORIES]
+			wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+			if wd >= 0:
+				self.directories[wd] = directory
+
+	def read(self):
+		changed = set()
+		try:
+			data = os.read(self.fd, 1 << 16)
+		except BlockingIOError:
+			return changed
+		offset = 0
+		while offset < len(data):
+			wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+			name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0').decode(errors='replace')
+			offset += self.EVENT.size + length
+			directory = self.directories.get(wd)
+			if directory is None:
+				continue
+			if mask & self.IN_DELETE_SELF:
+				del self.directories[wd]
+				continue
+			path = os.path.join(directory, name)
+			if mask & self.IN_ISDIR:
+				if mask & (self.IN_CREATE | self.IN_MOVED_TO) and not name.startswith('.') and name not in IGNORED_DIRECTORIES:
+					self.add(path)
+					changed.update(user_files(path))  # Files moved in with the directory.
+			elif watched(path):
+				changed.add(path)
+		return changed
+
+	def changes(self, timeout=None):
+		""" Returns the paths that were changed, added or removed, waiting up to timeout seconds for one. """
+		if not select.select([self.fd], [], [], timeout)[0]:
+			return set()
+		changed = self.read()
+		while select.select([self.fd], [], [], self.DEBOUNCE)[0]:
+			changed |= self.read()
+		return changed
+
+	def close(self):
+		if self.fd >= 0:
+			os.close(self.fd)
+			self.fd = -1
+
+
+def make_watcher(root, interval=1.0):
+	""" An InotifyWatcher where inotify is available, otherwise a PollingWatcher. """
+	if sys.platform.startswith('linux'):
+		try:
+			return InotifyWatcher(root)
+		except (OSError, AttributeError):
+			pass
+	return PollingWatcher(root, interval)
+
+
+class ImportGraph:
+	""" Which user files import which, from their import statements (parsed again when a file changes). """
+
+	def __init__(self, root):
+		self.root = Path(root).resolve()
+		self.imports = {}  # file -> the user files it imports.
+		self.stamps = {}
+
+	def update(self, files=None):
+		""" Parses the files that changed (all the user files by default), and forgets the deleted ones. """
+		for file in map(str, user_files(self.root) if files is None else files):
+			try:
+				stat = os.stat(file)
+			except OSError:
+				self.imports.pop(file, None)
+				self.stamps.pop(file, None)
+				continue
+			if self.stamps.get(file) != (stat.st_mtime_ns, stat.st_size):
+				self.stamps[file] = (stat.st_mtime_ns, stat.st_size)
+				self.imports[file] = self.parse(file)
+
+	def parse(self, file):
+		try:
+			with open(file, 'rb') as source:
+				tree = ast.parse(source.read(), file)
+		except (SyntaxError, ValueError, OSError):
+			return self.imports.get(file, set())  # Keep the previous edges until the file is fixed.
+
+		package = list(Path(file).relative_to(self.root).parent.parts)
+		imported = set()
+		for node in ast.walk(tree):
+			if isinstance(node, ast.Import):
+				names = [alias.name for alias in node.names]
+			elif isinstance(node, ast.ImportFrom):
+				base = package[:max(0, len(package) - node.level + 1)] if node.level else []
+				module = base + (node.module.split('.') if node.module else [])
+				names = ['.'.join(module)] + ['.'.join(module + [alias.name]) for alias in node.names]
+			else:
+				continue
+			for name in names:
+				parts = name.split('.')
+				for i in range(1, len(parts) + 1):  # `import a.b` imports a and a.b.
+					if (target := self.file_of(parts[:i])) is not None:
+						imported.add(target)
+		imported.discard(file)
+		return imported
+
+	def file_of(self, parts):
+		""" The user file of a module (given as name parts), or None. """
+		if not parts or not all(parts):
+			return None
+		for candidate in (self.root.joinpath(*parts).with_suffix('.py'), self.root.joinpath(*parts, '__init__.py')):
+			if candidate.is_file():
+				return str(candidate)
+		return None
+
+	def dependents(self, files):
+		""" The files, and every file that imports one of them (directly or not). """
+		importers = {}
+		for file, imported in self.imports.items():
+			for target in imported:
+				importers.setdefault(target, set()).add(file)
+		affected, pending = set(files), list(files)
+		while pending:
+			for importer in importers.get(pending.pop(), ()):
+				if importer not in affected:
+					affected.add(importer)
+					pending.append(importer)
+		return affected
+
+	def order(self, files):
+		""" The files sorted so that a file comes after the files it imports (within the set). """
+		files, ordered, visiting = set(files), [], set()
+
+		def visit(file):
+			if file in visiting or file in ordered:  # An import cycle, or already placed.
+				return
+			visiting.add(file)
+			for target in sorted(self.imports.get(file, ())):
+				if target in files:
+					visit(target)
+			visiting.discard(file)
+			ordered.append(file)
+
+		for file in sorted(files):
+			visit(file)
+		return ordered
+
+
+class Reloader:
+	""" Reloads the changed user modules (and the ones importing them), replacing their registered functions.
+		on_reload(module names) is called after each reload (eg: to refresh a gateway's functions).
+	"""
+
+	def __init__(self, user_path, watcher=None, on_reload=None):
+		self.root = Path(user_path).resolve()
+		self.graph = ImportGraph(self.root)
+		self.graph.update()
+		self.watcher = watcher or make_watcher(self.root)
+		self.on_reload = on_reload
+		self.lock = threading.Lock()
+		self.thread = None
+		self.running = False
+		self.reloads = 0
+
+	def modules_of(self, file):
+		""" The loaded modules of a file (a package's __init__.py may be loaded as `pkg` and `pkg.__init__`). """
+		modules = []
+		for name, module in list(sys.modules.items()):
+			path = getattr(module, '__file__', None)
+			if path and os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(file)):
+				modules.append(module)
+		return modules
+
+	def reload(self, paths):
+		""" Reloads the modules affected by the changed paths. Returns the names of the reloaded modules. """
+		paths = [os.path.abspath(p) for p in paths if watched(p)]
+		if not paths:
+			return []
+		with self.lock:
+			self.graph.update(paths)
+			reloaded = []
+			for file in self.graph.order(self.graph.dependents(paths)):
+				modules = self.modules_of(file)
+				names = [m.__name__ for m in modules]
+				if not os.path.exists(file):  # Deleted: forget its functions and the module.
+					Device.unregister(names)
+					for name in names:
+						sys.modules.pop(name, None)
+					continue
+				if not modules:  # A new file (or one that failed to import before), which may have registered functions before failing.
+					modules = [None]
+					names = [general.module_name(os.path.relpath(file, self.root))]
+
+				removed = Device.unregister(names)
+				try:
+					for module in modules:
+						if module is None:
+							loader.import_from_path(os.path.relpath(file, self.root))
+						else:
+							importlib.reload(module)
+					reloaded.extend(names)
+				except Exception as e:
+					print(f"Error reloading user module: {file}, {e}")
+					Device.unregister(names)  # Keep the functions of the previous version.
+					for c, g in removed:
+						Device.ORIGINALS[Device.key(g)] = g.original
+					Device.FUNCTIONS.extend(removed)
+			self.reloads += 1
+		if reloaded and self.on_reload is not None:
+			self.on_reload(reloaded)
+		return reloaded
+
+	def poll(self, timeout=0):
+		""" Reloads what changed since the last check. """
+		return self.reload(self.watcher.changes(timeout))
+
+	def run(self):
+		while self.running:
+			changed = self.watcher.changes(timeout=0.5)
+			if changed and self.running:
+				reloaded = self.reload(changed)
+				if reloaded:
+					print(f"Pybiosis: reloaded {', '.join(map(str, reloaded))}")
+
+	def start(self):
+		""" Watches and reloads on a background thread. """
+		if self.thread is None:
+			self.running = True
+			self.thread = threading.Thread(target=self.run, name='pybiosis-reloader', daemon=True)
+			self.thread.start()
+		return self
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		self.watcher.close()
@@ -0,0 +1,265 @@
+""" This file implements what happens when a decorated function is called.
+
+	Every call of a function wrapped by `Device` goes through `invoke`,
+	whether it is triggered by a StreamDeck button, the Scheduler, the CLI or the GUI.
+"""
+from pybiosis.util.locks import FileLock
+from pybiosis.util.resources import FunctionTimeout, process_limits, time_limit
+from pybiosis.loader import get_user_path
+from pybiosis.validate import InvalidEnvironment
+import pybiosis.history as history
+import pybiosis.profiling as profiling
+from types import SimpleNamespace
+from pathlib import Path
+import contextlib
+import threading
+import logging
+import signal
+import json
+import time
+import os
+
+CONCURRENCY_POLICIES = ['skip', 'queue', 'replace']
+POLICIES = ['concurrency', 'max_concurrency', 'debounce_ms', 'timeout', 'max_rss', 'nice', 'cpu_affinity', 'profile', 'profile_memory']
+HISTORY = os.getenv('PYBIOSIS_HISTORY', '1') != '0'  # Record every call in .compilers/history.db (see pybiosis.history).
+SKIPPED = object()
+HOSTED = False  # Whether this process calls many functions (the GUI, `serve`, `schedule --run`), see call.
+
+
+def state_path(*parts):
+	""" A path under the user's .compilers directory (or the current directory if there is no user path). """
+	try:
+		root = get_user_path()
+	except InvalidEnvironment:
+		root = Path().absolute()
+	return root.joinpath('.compilers', *parts)
+
+def function_key(f):
+	module = getattr(f.module, '__name__', None) or f.__module__
+	return f'{module}.{f.name}'.replace('<', '_').replace('>', '_')
+
+
+def policies(f):
+	""" The policies of the function that f wraps. Each one is taken from the outermost Device wrapper that sets it,
+		so the entries in Device.FUNCTIONS (eg: a StreamDeck entry under `@Device(concurrency='skip')`) share them.
+	"""
+	wrappers = getattr(getattr(f, 'original', None), 'pybiosis_wrappers', None) or [f]
+	values = {k: next((getattr(w, k) for w in reversed(wrappers) if getattr(w, k, None) is not None), None) for k in POLICIES}
+	return SimpleNamespace(module=f.module, name=f.name, __module__=f.__module__, **values)
+
+
+class ConcurrencyGuard:
+	""" Enforces the concurrency policy of a function across processes.
+
+		concurrency: 'skip' - don't run if max_concurrency runs are in progress.
+		             'queue' - wait for a run to finish.
+		             'replace' - stop a run in progress, and run instead. Only a process that runs that one function
+		                         (eg: a StreamDeck button or `bb run`) is stopped, otherwise the run is queued.
+		max_concurrency: the number of runs allowed at the same time (1 by default).
+		debounce_ms: runs started within this many milliseconds of the previous start are dropped.
+	"""
+
+	def __init__(self, key, concurrency=None, max_concurrency=None, debounce_ms=None):
+		if concurrency is None and max_concurrency is not None:
+			concurrency = 'skip'
+		if concurrency is not None and concurrency not in CONCURRENCY_POLICIES:
+			raise ValueError(f"concurrency must be one of {CONCURRENCY_POLICIES}, not: {concurrency}")
+		self.key = key
+		self.concurrency = concurrency
+		self.max_concurrency = max(1, max_concurrency or 1)
+		self.debounce_ms = debounce_ms
+		self.directory = state_path('locks')
+
+	@classmethod
+	def from_function(cls, f):
+		""" Returns the guard for a function, or None if it doesn't have a policy. """
+		values = {k: getattr(f, k, None) for k in ['concurrency', 'max_concurrency', 'debounce_ms']}
+		if not any(v is not None for v in values.values()):
+			return None
+		return cls(function_key(f), **values)
+
+	def debounced(self):
+		""" Returns True if the previous run started too recently, otherwise records this start. """
+		if not self.debounce_ms:
+			return False
+		stamp = self.directory / f'{self.key}.stamp'
+		with FileLock(str(self.directory / f'{self.key}.stamp.lock')):
+			now = time.time()
+			try:
+				if (now - stamp.stat().st_mtime) * 1000 < self.debounce_ms:
+					return True
+			except FileNotFoundError:
+				pass
+			stamp.touch()
+			os.utime(stamp, (now, now))
+			return False
+
+	def slots(self):
+		return [FileLock(str(self.directory / f'{self.key}.{i}.lock')) for i in range(self.max_concurrency)]
+
+	def acquire(self):
+		""" Returns a held slot lock, or None if this run should not happen. """
+		slots = self.slots()
+		tag = 'host' if HOSTED else 'single'
+		queued = False
+		while True:
+			for slot in slots:
+				if slot.acquire(blocking=False, tag=tag):
+					return slot
+			match self.concurrency:
+				case 'skip' | None:
+					return None
+				case 'replace':
+					stoppable = [slot for slot in slots if self.stoppable(slot)]
+					for slot in stoppable:
+						with contextlib.suppress(OSError):
+							os.kill(slot.holder(), signal.SIGTERM)
+					if not stoppable and not queued:
+						logging.warning(f"Pybiosis: {self.key} is running in a process that runs other functions, so it is queued rather than replaced.")
+						queued = True
+			time.sleep(FileLock.POLL_INTERVAL)
+
+	@staticmethod
+	def stoppable(slot):
+		""" Whether the slot is held by another live process that only runs this function. The holder is read again
+			after a moment, since a new holder may not have written its pid yet (leaving the one of a crashed holder).
+		"""
+		from pybiosis.processes import alive
+		holder = slot.holder()
+		if holder is None or holder == os.getpid() or slot.holder_tag() != 'single' or not alive(holder):
+			return False
+		time.sleep(FileLock.POLL_INTERVAL)
+		return slot.holder() == holder  # Otherwise, it was released or taken by another run meanwhile.
+
+	@contextlib.contextmanager
+	def guard(self):
+		""" Yields whether the function should run. """
+		if self.debounced():
+			yield False
+			return
+		slot = self.acquire() if self.concurrency else None
+		if self.concurrency and slot is None:
+			yield False
+			return
+		try:
+			yield True
+		finally:
+			if slot:
+				slot.release()
+
+
+class Usage:
+	""" Records the resource usage of a function with limits in .compilers/stats/<function>.json. """
+
+	FIELDS = ['calls', 'timeouts', 'memory_kills', 'failures', 'cpu_seconds', 'wall_seconds']
+
+	def __init__(self, key):
+		self.path = state_path('stats', f'{key}.json')
+
+	def load(self):
+		try:
+			with open(self.path) as file:
+				return {**dict.fromkeys(self.FIELDS, 0), **json.load(file)}
+		except (FileNotFoundError, json.decoder.JSONDecodeError):
+			return dict.fromkeys(self.FIELDS, 0)
+
+	def add(self, **counts):
+		with FileLock(str(self.path) + '.lock'):
+			stats = self.load()
+			for key, value in counts.items():
+				stats[key] += value
+			with open(self.path, 'w') as file:
+				json.dump(stats, file, indent=4)
+
+	@contextlib.contextmanager
+	def measure(self):
+		""" Records one call, how long it took and why it failed (if it did). """
+		cpu_clock = time.process_time if threading.current_thread() is threading.main_thread() else time.thread_time
+		wall, cpu = time.perf_counter(), cpu_clock()
+		counts = {'calls': 1}
+		try:
+			yield
+		except FunctionTimeout:
+			counts['timeouts'] = 1
+			raise
+		except MemoryError:
+			counts['memory_kills'] = 1
+			raise
+		except Exception:
+			counts['failures'] = 1
+			raise
+		finally:
+			self.add(cpu_seconds=cpu_clock() - cpu, wall_seconds=time.perf_counter() - wall, **counts)
+
+
+def run_limited(f, func, args, kwargs):
+	""" Calls func under the resource controls stored on f: timeout, max_rss, nice and cpu_affinity. """
+	limits = {k: getattr(f, k, None) for k in ['timeout', 'max_rss', 'nice', 'cpu_affinity']}
+	if all(v is None for v in limits.values()):  # The history records the other calls, without a lock or a file per call.
+		return func(*args, **kwargs)
+	with Usage(function_key(f)).measure(), process_limits(limits['max_rss'], limits['nice'], limits['cpu_affinity']), time_limit(limits['timeout']):
+		return func(*args, **kwargs)
+
+
+def run_profiled(f, func, args, kwargs):
+	""" Calls run_limited, under a profiler if this call is sampled (see Device(profile=...)). """
+	profiler = profiling.for_call(f, function_key(f))
+	if profiler is None:
+		return run_limited(f, func, args, kwargs)
+	with profiler:
+		return run_limited(f, func, args, kwargs)
+
+
+def guarded(f, func, args, kwargs):
+	""" Calls func under the concurrency policy stored on f. Returns SKIPPED if the policy didn't allow it. """
+	guard = ConcurrencyGuard.from_function(f)
+	if guard is None:
+		return run_profiled(f, func, args, kwargs)
+	with guard.guard() as allowed:
+		if not allowed:
+			print(f"Pybiosis: not running {function_key(f)}, a run is already in progress (or started too recently).")
+			return SKIPPED
+		return run_profiled(f, func, args, kwargs)
+
+
+def invoke(f, func, args, kwargs):
+	""" Calls the decorated function (f.original), applying its policies, and records the call in the history.
+
+		The stacked wrappers of a function are skipped: whichever one is called, the function runs once,
+		under one guard, and is recorded once.
+	"""
+	func = getattr(f, 'original', func)
+	f = policies(f)
+	if not HISTORY:
+		result = guarded(f, func, args, kwargs)
+		return None if result is SKIPPED else result
+
+	started, clock = time.time(), time.perf_counter()
+	status, error = 'ok', None
+	try:
+		result = guarded(f, func, args, kwargs)
+		if result is SKIPPED:
+			status, result = 'skipped', None
+		return result
+	except FunctionTimeout as e:
+		status, error = 'timeout', str(e)
+		raise
+	except MemoryError as e:
+		status, error = 'memory', str(e)
+		raise
+	except BaseException as e:
+		status, error = 'failed', f'{type(e).__name__}: {e}'
+		raise
+	finally:
+		history.record(function_key(f), started, time.perf_counter() - clock, status, error)
+
+
+def call(f, *args, **kwargs):
+	""" Calls a registered function (any of its wrappers) with its policies, and raises its errors,
+		where the Device wrapper would report them in a dialog. Plain functions are called as they are.
+	"""
+	global HOSTED
+	HOSTED = True  # So that 'replace' doesn't stop this process, which runs other functions.
+	if not hasattr(f, 'original'):
+		return f(*args, **kwargs)
+	return invoke(f, f.original, args, kwargs)
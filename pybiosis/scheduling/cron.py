@@ -0,0 +1,129 @@
+""" Registers `Scheduler` functions in the user's crontab on Linux (and other unix-likes).
+
+	Every entry lives in one block of the crontab, delimited by BEGIN and END.
+	The crontab is read once, and installed once, only if the block changed.
+	Triggers that cron can't express exactly (eg: every 7 minutes) raise a ValueError; consider the systemd backend.
+"""
+from pybiosis.scheduling.triggers import EPOCH
+import subprocess
+import tempfile
+import shlex
+import os
+
+BEGIN = '# >>> pybiosis >>>'
+END = '# <<< pybiosis <<<'
+
+
+def guard(condition):
+	""" A shell test prepended to the command, for conditions cron can't express. % must be escaped in crontabs. """
+	return condition.replace('%', '\\%') + ' && '
+
+def field(values):
+	""" A crontab field for the values: a-b/step when they are evenly spaced, otherwise a list. """
+	step = values[1] - values[0] if len(values) > 2 else None
+	if step and all(b - a == step for a, b in zip(values, values[1:])):
+		return f'{values[0]}-{values[-1]}/{step}'
+	return ','.join(map(str, values))
+
+def cron_lines(trigger):
+	""" Translates a Trigger into [(schedule, guard)]. """
+	t = trigger
+	time = t.start_time
+	minute, hour = (time.minute, time.hour) if time else (0, 0)
+	months = ','.join(map(str, t.months)) if t.months and len(t.months) < 12 else '*'
+	condition = ''
+	if t.start_date and t.start_date != EPOCH:
+		condition += guard(f'[ "$(date +%Y%m%d%H%M)" -ge {t.start:%Y%m%d%H%M} ]')
+	if t.end:
+		condition += guard(f'[ "$(date +%Y%m%d%H%M)" -le {t.end:%Y%m%d%H%M} ]')
+
+	match t.kind:
+		case 'minute' | 'hourly' if t.window:  # A line per group of hours, so the window's first and last hours are exact.
+			return [(f'{field(minutes)} {field(hours)} * * *', condition) for hours, minutes in t.window_times()]
+		case 'minute' if 60 % t.interval == 0:
+			return [(f'{minute % t.interval}-59/{t.interval} * * * *', condition)]
+		case 'minute' if t.interval % 60 == 0 and 24 % (t.interval // 60) == 0:
+			return [(f'{minute} {hour % (t.interval // 60)}-23/{t.interval // 60} * * *', condition)]
+		case 'hourly' if 24 % t.interval == 0:
+			return [(f'{minute} {hour % t.interval}-23/{t.interval} * * *', condition)]
+		case 'daily' if t.interval == 1:
+			return [(f'{minute} {hour} * * *', condition)]
+		case 'weekly' if t.interval == 1:
+			return [(f'{minute} {hour} * * {",".join(str((d + 1) % 7) for d in t.weekdays)}', condition)]
+		case 'monthly' if t.last_day:
+			return [(f'{minute} {hour} 28-31 {months} *', condition + guard('[ "$(date -d tomorrow +%d)" = 01 ]'))]
+		case 'monthly' if t.weeks:
+			days = ','.join(str((d + 1) % 7) for d in t.weekdays)
+			if t.weeks == [5]:
+				week = guard('[ "$(date -d "+7 days" +%m)" != "$(date +%m)" ]')
+			else:
+				week = guard(f'[ $(( ($(date +%-d) - 1) / 7 + 1 )) -eq {t.weeks[0]} ]')
+			return [(f'{minute} {hour} * {months} {days}', condition + week)]
+		case 'monthly':
+			return [(f'{minute} {hour} {",".join(map(str, t.monthdays))} {months} *', condition)]
+		case 'once':
+			return [(f'{minute} {hour} {t.start.day} {t.start.month} *', guard(f'[ "$(date +%Y)" = {t.start.year} ]'))]
+		case 'onstart' | 'onlogon':
+			return [('@reboot', '')]
+	raise ValueError(f"cron cannot express {t}.")
+
+def crontab(arguments):
+	""" Runs crontab, which may print warnings on stderr when it succeeds, so only its exit status is checked. Returns stdout. """
+	return subprocess.run(arguments, check=True, capture_output=True, text=True).stdout
+
+def render_block(tasks):
+	""" Takes {name: ([triggers], command)} and returns the crontab block. """
+	lines = [BEGIN]
+	for name, (triggers, action) in sorted(tasks.items()):
+		lines.append(f'# {name}')
+		for schedule, condition in [line for t in triggers for line in cron_lines(t)]:
+			lines.append(f'{schedule} {condition}{action.replace("%", chr(92) + "%")}')
+	lines.append(END)
+	return '\n'.join(lines) + '\n'
+
+def replace_block(crontab, block):
+	""" Replaces the Pybiosis block of a crontab (or appends it). """
+	if BEGIN in crontab and END in crontab:
+		before, rest = crontab.split(BEGIN, 1)
+		after = rest.split(END, 1)[1].lstrip('\n')
+		return before + block + after
+	return crontab + ('' if not crontab or crontab.endswith('\n') else '\n') + block
+
+
+class CronBackend:
+	""" Synchronizes the user's crontab with a set of tasks. """
+
+	EXE = os.getenv('PYBIOSIS_CRONTAB', 'crontab')
+
+	def __init__(self, exe=EXE, runner=crontab):
+		self.exe = exe
+		self.runner = runner
+
+	def read(self):
+		try:
+			return self.runner([self.exe, '-l'])
+		except subprocess.CalledProcessError as e:
+			if 'no crontab' in (e.stderr or '').lower():
+				return ''
+			raise
+
+	def install(self, crontab):
+		with tempfile.NamedTemporaryFile('w', suffix='.crontab', delete=False) as file:
+			file.write(crontab)
+		try:
+			self.runner([self.exe, file.name])
+		finally:
+			os.remove(file.name)
+
+	def sync(self, tasks):
+		""" Takes {name: ([triggers], command)} and returns True if the crontab was changed. """
+		current = self.read()
+		updated = replace_block(current, render_block(tasks))
+		if updated == current:
+			return False
+		self.install(updated)
+		return True
+
+
+def shell_command(user_path, executable, module_name, function_name):
+	return f'cd {shlex.quote(str(user_path))} && {shlex.quote(str(executable))} -c "import {module_name}; {module_name}.{function_name}()"'
@@ -0,0 +1,205 @@
+""" An in-process scheduler for `Scheduler` functions, which works on any platform.
+
+	Unlike the Task Scheduler (which cold-starts Python through a .vbs/.bat file for every run),
+	the engine keeps the user's modules imported and calls the functions directly on a worker pool.
+
+	Jobs are kept in a heap ordered by their next run, so each tick only looks at the jobs that are due,
+	and the next run of a job is computed from its Trigger only after it fires.
+
+	Policies:
+		catch_up: what to do with runs that were missed (the process was asleep, stopped or too busy).
+			'skip' - don't run them, 'once' - run once for all of them, 'all' - run each of them (up to MAX_CATCH_UP).
+		overlap: what to do when a job is due while it is still running.
+			'skip' - don't run it, 'queue' - run it when the current run finishes, 'parallel' - run it anyway.
+"""
+from pybiosis.scheduling.triggers import Trigger
+import pybiosis.runtime as runtime
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import threading
+import traceback
+import logging
+import heapq
+import json
+import os
+
+CATCH_UP_POLICIES = ['skip', 'once', 'all']
+OVERLAP_POLICIES = ['skip', 'queue', 'parallel']
+
+
+class Job:
+	""" A function with one trigger, and its run state. """
+
+	def __init__(self, name, function, trigger):
+		self.name = name
+		self.function = function
+		self.trigger = trigger
+		self.next_run = None
+		self.running = 0
+		self.queued = 0
+		self.lock = threading.Lock()
+		self.stats = {'runs': 0, 'failures': 0, 'missed': 0, 'skipped': 0}
+
+
+class SchedulerEngine:
+	""" Runs jobs when their triggers fire. See the module docstring for the policies. """
+
+	MAX_CATCH_UP = 100
+	GRACE = dt.timedelta(seconds=60)  # A run that starts within this delay is on time.
+	MAX_SLEEP = 60  # Seconds, so that clock changes (eg: after a suspend) are noticed.
+
+	def __init__(self, max_workers=4, catch_up='once', overlap='skip', state_file=None, now=dt.datetime.now):
+		if catch_up not in CATCH_UP_POLICIES:
+			raise ValueError(f"catch_up must be one of {CATCH_UP_POLICIES}, not: {catch_up}")
+		if overlap not in OVERLAP_POLICIES:
+			raise ValueError(f"overlap must be one of {OVERLAP_POLICIES}, not: {overlap}")
+		self.max_workers = max_workers
+		self.catch_up = catch_up
+		self.overlap = overlap
+		self.state_file = state_file
+		self.now = now
+		self.jobs = []
+		self.heap = []  # [(next_run, sequence, job)]
+		self.sequence = 0
+		self.condition = threading.Condition()
+		self.stopping = threading.Event()
+		self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pybiosis-scheduler')
+		self.last_runs = self.load_state()
+
+	@classmethod
+	def from_functions(cls, functions, **kwargs):
+		""" Creates an engine from the functions registered with the Scheduler decorator.
+			A function with several Scheduler decorators has a job per decorator: name, name#2, name#3...
+		"""
+		engine = cls(**kwargs)
+		counts = {}
+		for f in functions:
+			name = f'{f.module.__name__}.{getattr(getattr(f, "original", None), "__qualname__", f.name)}'
+			counts[name] = counts.get(name, 0) + 1
+			engine.add(name if counts[name] == 1 else f'{name}#{counts[name]}', f, Trigger.from_values(f.values))
+		return engine
+
+	def add(self, name, function, trigger):
+		job = Job(name, function, trigger)
+		self.jobs.append(job)
+		if trigger.kind in ('onidle',):
+			logging.warning(f"{name}: '{trigger.kind}' triggers are not supported by the engine, so it will not run.")
+			return job
+
+		last = self.last_runs.get(name)
+		after = dt.datetime.fromisoformat(last) if last else self.now()
+		if trigger.kind in ('onstart', 'onlogon'):  # The engine starting is the closest equivalent.
+			self.push(self.now(), job)
+		elif (next_run := trigger.next_after(after)) is not None:
+			self.push(next_run, job)
+		return job
+
+	def push(self, when, job):
+		with self.condition:
+			job.next_run = when
+			heapq.heappush(self.heap, (when, self.sequence, job))
+			self.sequence += 1
+			self.condition.notify()
+
+	def load_state(self):
+		if self.state_file and os.path.exists(self.state_file):
+			with open(self.state_file) as file:
+				return json.load(file)
+		return {}
+
+	def save_state(self):
+		if self.state_file:
+			with open(self.state_file, 'w') as file:
+				json.dump(self.last_runs, file, indent=4)
+
+	def tick(self):
+		""" Dispatches every job that is due, and returns the number of seconds until the next one. """
+		now = self.now()
+		while True:
+			with self.condition:
+				if not self.heap or self.heap[0][0] > now:
+					break
+				due, _, job = heapq.heappop(self.heap)
+
+			# Count the runs that have been missed since this one was due, without walking far into the past.
+			runs = 1
+			if now - due > self.GRACE and job.trigger.kind not in ('onstart', 'onlogon'):
+				missed = 0
+				moment = due
+				while missed < self.MAX_CATCH_UP and (moment := job.trigger.next_after(moment)) is not None and moment <= now:
+					missed += 1
+				with job.lock:
+					job.stats['missed'] += missed + 1
+				runs = {'skip': 0, 'once': 1, 'all': min(missed + 1, self.MAX_CATCH_UP)}[self.catch_up]
+
+			if runs:
+				self.dispatch(job, runs)
+			if (next_run := job.trigger.next_after(now)) is not None:
+				self.push(next_run, job)
+
+		with self.condition:
+			if not self.heap:
+				return self.MAX_SLEEP
+			return min(self.MAX_SLEEP, max(0, (self.heap[0][0] - self.now()).total_seconds()))
+
+	def dispatch(self, job, runs=1):
+		""" Starts the job, for `runs` consecutive runs (the runs that are caught up follow each other). """
+		with job.lock:
+			if job.running and self.overlap == 'skip':
+				job.stats['skipped'] += runs
+				return
+			if job.running and self.overlap == 'queue':
+				job.queued += runs
+				return
+			job.running += 1
+			job.queued += runs - 1
+		self.last_runs[job.name] = self.now().isoformat()
+		self.pool.submit(self.execute, job)
+
+	def call(self, job):
+		""" Calls the decorated function through the runtime (its policies and history), rather than its
+			Device wrapper, which would report the errors in a dialog instead of raising them.
+		"""
+		return runtime.call(job.function)
+
+	def execute(self, job):
+		while True:
+			try:
+				self.call(job)
+				outcome = 'runs'
+			except Exception:
+				outcome = 'failures'
+				logging.error(f"{job.name} failed:\n{traceback.format_exc()}")
+			with job.lock:
+				job.stats[outcome] += 1
+				if job.queued and not self.stopping.is_set():
+					job.queued -= 1
+					continue
+				job.running -= 1
+				return
+
+	def run(self):
+		""" Runs until `stop()` is called (or a KeyboardInterrupt). """
+		try:
+			while not self.stopping.is_set():
+				delay = self.tick()
+				with self.condition:
+					self.condition.wait(timeout=delay)
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self.stopping.set()
+			self.pool.shutdown(wait=True)
+			self.save_state()
+
+	def stop(self):
+		self.stopping.set()
+		with self.condition:
+			self.condition.notify()
+
+	def summary(self):
+		summary = {}
+		for job in self.jobs:
+			with job.lock:
+				summary[job.name] = {'next_run': job.next_run, **job.stats}
+		return summary
@@ -0,0 +1,130 @@
+""" Previews when `Scheduler` functions will fire, to find where they pile up.
+
+	Every trigger is expanded into an array of fire times (numpy datetime64, minute resolution) over a horizon,
+	using whole-array operations rather than stepping from one run to the next.
+	The arrays are then merged into a per-minute load histogram.
+"""
+from pybiosis.scheduling.triggers import Trigger
+import datetime as dt
+import numpy as np
+import re
+
+MINUTE = np.timedelta64(1, 'm')
+DAY = np.timedelta64(1, 'D')
+HORIZON_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_horizon(value):
+	""" Parses '90m', '12h', '7d' or '2w' into a timedelta. """
+	match = re.fullmatch(r'\s*(\d+)\s*([mhdw])\s*', str(value).lower())
+	if not match:
+		raise ValueError(f"Could not parse the horizon {value}, expected something like 30m, 12h, 7d or 2w.")
+	return dt.timedelta(**{HORIZON_UNITS[match[2]]: int(match[1])})
+
+def minutes(moment):
+	return np.datetime64(moment.replace(second=0, microsecond=0), 'm')
+
+def day_times(days, trigger):
+	""" The fire times on the given days, at the trigger's start time. """
+	time = trigger.start_time or dt.time(0, 0)
+	return days.astype('M8[m]') + np.timedelta64(time.hour * 60 + time.minute, 'm')
+
+def fire_times(trigger, begin, end):
+	""" Returns the (sorted) times in [begin, end) that the trigger fires, as datetime64[m]. """
+	t = trigger
+	begin, end = minutes(begin), minutes(end)
+	anchor = minutes(t.start)
+	days = np.arange(begin.astype('M8[D]') - DAY, end.astype('M8[D]') + DAY)  # Padded for windows that cross midnight.
+
+	match t.kind:
+		case 'minute' | 'hourly' if t.window:
+			window_start, window_end = t.window
+			opens = window_start.hour * 60 + window_start.minute
+			length = ((window_end.hour * 60 + window_end.minute) - opens) % (24 * 60) or 24 * 60
+			step = int(t.period.total_seconds() // 60)
+			offsets = np.arange(0, length + 1, step).astype('m8[m]')
+			times = (days.astype('M8[m]') + np.timedelta64(opens, 'm'))[:, None] + offsets[None, :]
+			times = times.ravel()
+		case 'minute' | 'hourly' | 'daily':
+			step = np.timedelta64(int(t.period.total_seconds() // 60), 'm')
+			first = anchor if begin <= anchor else anchor + step * -(-(begin - anchor) // step)
+			times = np.arange(first, max(first, end), step)
+		case 'weekly':
+			first_monday = np.datetime64(t.start.date() - dt.timedelta(days=t.start.weekday()), 'D')
+			weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday, Monday is 0.
+			week = (days - first_monday).astype(np.int64) // 7
+			times = day_times(days[np.isin(weekday, t.weekdays) & (week % t.interval == 0)], t)
+		case 'monthly':
+			month_start = days.astype('M8[M]')
+			month = month_start.astype(np.int64) % 12 + 1
+			day = (days - month_start.astype('M8[D]')).astype(np.int64) + 1
+			length = ((month_start + 1).astype('M8[D]') - month_start.astype('M8[D]')).astype(np.int64)
+			if t.last_day:
+				mask = day == length
+			elif t.weeks:
+				weekday = (days.astype(np.int64) + 3) % 7
+				in_week = np.zeros(len(days), dtype=bool)
+				for week in t.weeks:
+					in_week |= (day + 7 > length) if week == 5 else ((day - 1) // 7 + 1 == week)
+				mask = in_week & np.isin(weekday, t.weekdays)
+			else:
+				mask = np.isin(day, t.monthdays)
+			times = day_times(days[mask & np.isin(month, t.months)], t)
+		case 'once':
+			times = np.array([anchor])
+		case _:  # Event based triggers have no fire times.
+			times = np.array([], dtype='M8[m]')
+
+	mask = (times >= begin) & (times < end) & (times >= anchor)
+	if t.end is not None:
+		mask &= times <= minutes(t.end)
+	return times[mask]
+
+
+class Preview:
+	""" The fire times of a set of named triggers over a horizon. """
+
+	def __init__(self, triggers, begin=None, horizon=dt.timedelta(days=7)):
+		""" triggers is [(name, Trigger)]. """
+		self.begin = begin or dt.datetime.now()
+		self.end = self.begin + horizon
+		self.names = [name for name, _ in triggers]
+		expanded = [fire_times(trigger, self.begin, self.end) for _, trigger in triggers]
+		self.times = np.concatenate(expanded) if expanded else np.array([], dtype='M8[m]')
+		self.owners = np.repeat(np.arange(len(expanded)), [len(e) for e in expanded])
+		order = np.argsort(self.times, kind='stable')
+		self.times, self.owners = self.times[order], self.owners[order]
+
+	@classmethod
+	def from_functions(cls, functions, **kwargs):
+		return cls([(f'{f.module.__name__}.{f.name}', Trigger.from_values(f.values)) for f in functions], **kwargs)
+
+	def histogram(self):
+		""" Returns (minutes, loads): every minute with at least one run, and the number of runs in it. """
+		return np.unique(self.times, return_counts=True)
+
+	def load_distribution(self):
+		""" Returns {load: number of minutes with that many runs}. """
+		_, loads = self.histogram()
+		values, counts = np.unique(loads, return_counts=True)
+		return dict(zip(values.tolist(), counts.tolist()))
+
+	def collisions(self, threshold=2, top=10):
+		""" Returns [(minute, [names])] for the busiest minutes with at least `threshold` runs. """
+		minutes_, loads = self.histogram()
+		busiest = np.argsort(-loads, kind='stable')[:top]
+		starts = np.searchsorted(self.times, minutes_[busiest], side='left')
+		return [
+			(minutes_[i].astype(dt.datetime), [self.names[o] for o in self.owners[s:s + loads[i]]])
+			for i, s in zip(busiest, starts) if loads[i] >= threshold
+		]
+
+	def stagger(self, threshold=2, spread=10):
+		""" Suggests {name: offset in minutes} so that schedules which collide are spread over `spread` minutes.
+			Schedules are offset in the order they collide, and each one is only offset once.
+		"""
+		offsets = {}
+		for _, names in self.collisions(threshold=threshold, top=len(self.times)):
+			for rank, name in enumerate(n for n in dict.fromkeys(names) if n not in offsets):
+				offsets[name] = rank % spread
+		return {name: offset for name, offset in offsets.items() if offset}
@@ -0,0 +1,165 @@
+""" Registers `Scheduler` functions with the Windows Task Scheduler in bulk.
+
+	Rather than one `schtasks /create` per function (and one `/delete` per existing task),
+	every task is rendered as Task Scheduler XML, and compared with a single `schtasks /query /xml` snapshot.
+	Only tasks that were added, changed or removed are passed to schtasks.exe, a few at a time.
+
+	The schtasks.exe invocations go through `runner` (`pybiosis.utility.command` by default),
+	so the rendering and diffing can be exercised on any platform with a stub.
+"""
+from pybiosis.scheduling.triggers import Trigger
+from pybiosis.utility import command
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+from pathlib import Path
+import hashlib
+import re
+
+NAMESPACE = 'http://schemas.microsoft.com/windows/2004/02/mit/task'
+SOURCE = 'Pybiosis'
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+WEEK_NAMES = ['1', '2', '3', '4', 'Last']
+TASK_PATTERN = re.compile(r'<!--\s*\\?(?P<name>[^>]*?)\s*-->\s*(?:<\?xml[^>]*\?>\s*)?(?P<task><Task\b.*?</Task>)', re.DOTALL)
+DIGEST_PATTERN = re.compile(r'<Documentation>(?P<digest>[0-9a-f]+)</Documentation>')
+
+
+def boundary(value):
+	return value.strftime('%Y-%m-%dT%H:%M:%S')
+
+def duration(delta):
+	minutes = int(delta.total_seconds() // 60)
+	return f'PT{minutes}M'
+
+def render_trigger(trigger):
+	""" Renders one Trigger as a Task Scheduler trigger element. """
+	t = trigger
+	common = f'<StartBoundary>{boundary(t.start)}</StartBoundary>'
+	if t.end:
+		common += f'<EndBoundary>{boundary(t.end)}</EndBoundary>'
+	common += '<Enabled>true</Enabled>'
+	weekdays = lambda days: '<DaysOfWeek>' + ''.join(f'<{DAY_NAMES[d]} />' for d in days) + '</DaysOfWeek>'
+	months = lambda ms: '<Months>' + ''.join(f'<{MONTH_NAMES[m - 1]} />' for m in ms) + '</Months>'
+
+	match t.kind:
+		case 'minute' | 'hourly':
+			repetition = f'<Repetition><Interval>{duration(t.period)}</Interval>'
+			if t.window:  # Repeat within a daily window, eg: every 100 minutes between 17:00 and 08:00.
+				start, end = [a.hour * 60 + a.minute for a in t.window]
+				repetition += f'<Duration>PT{(end - start) % (24 * 60) or 24 * 60}M</Duration><StopAtDurationEnd>false</StopAtDurationEnd></Repetition>'
+				return f'<CalendarTrigger>{repetition}{common}<ScheduleByDay><DaysInterval>1</DaysInterval></ScheduleByDay></CalendarTrigger>'
+			repetition += '<StopAtDurationEnd>false</StopAtDurationEnd></Repetition>'
+			return f'<TimeTrigger>{repetition}{common}</TimeTrigger>'
+		case 'daily':
+			return f'<CalendarTrigger>{common}<ScheduleByDay><DaysInterval>{t.interval}</DaysInterval></ScheduleByDay></CalendarTrigger>'
+		case 'weekly':
+			return f'<CalendarTrigger>{common}<ScheduleByWeek><WeeksInterval>{t.interval}</WeeksInterval>{weekdays(t.weekdays)}</ScheduleByWeek></CalendarTrigger>'
+		case 'monthly' if t.weeks:
+			weeks = '<Weeks>' + ''.join(f'<Week>{WEEK_NAMES[w - 1]}</Week>' for w in t.weeks) + '</Weeks>'
+			return f'<CalendarTrigger>{common}<ScheduleByMonthDayOfWeek>{weeks}{weekdays(t.weekdays)}{months(t.months)}</ScheduleByMonthDayOfWeek></CalendarTrigger>'
+		case 'monthly':
+			days = ['Last'] if t.last_day else t.monthdays
+			days = '<DaysOfMonth>' + ''.join(f'<Day>{d}</Day>' for d in days) + '</DaysOfMonth>'
+			return f'<CalendarTrigger>{common}<ScheduleByMonth>{days}{months(t.months)}</ScheduleByMonth></CalendarTrigger>'
+		case 'once':
+			return f'<TimeTrigger>{common}</TimeTrigger>'
+		case 'onstart':
+			return '<BootTrigger><Enabled>true</Enabled></BootTrigger>'
+		case 'onlogon':
+			return '<LogonTrigger><Enabled>true</Enabled></LogonTrigger>'
+		case 'onidle':
+			return '<IdleTrigger><Enabled>true</Enabled></IdleTrigger>'
+
+def split_action(action):
+	""" Splits the action returned by `save_function` into an executable and its arguments. """
+	if action.lower().startswith('cmd.exe '):
+		return 'cmd.exe', action[len('cmd.exe '):]
+	if action.lower().endswith('.vbs'):
+		return 'wscript.exe', f'"{action}"'
+	return action, ''
+
+def render_task(triggers, action, description='', working_directory=None):
+	""" Renders a complete task, with a digest of its contents stored in RegistrationInfo/Documentation. """
+	idle = [t.idle for t in triggers if t.kind == 'onidle' and t.idle]
+	executable, arguments = split_action(action)
+	body = (
+		'<Triggers>' + ''.join(render_trigger(t) for t in triggers) + '</Triggers>'
+		'<Settings>'
+		'<MultipleInstancesPolicy>IgnoreNew</MultipleInstancesPolicy>'
+		'<DisallowStartIfOnBatteries>false</DisallowStartIfOnBatteries>'
+		'<StopIfGoingOnBatteries>false</StopIfGoingOnBatteries>'
+		+ (f'<IdleSettings><Duration>PT{idle[0]}M</Duration><WaitTimeout>PT1H</WaitTimeout><StopOnIdleEnd>false</StopOnIdleEnd><RestartOnIdle>false</RestartOnIdle></IdleSettings>' if idle else '') +
+		'<Enabled>true</Enabled>'
+		'</Settings>'
+		'<Actions Context="Author"><Exec>'
+		f'<Command>{escape(executable)}</Command>'
+		+ (f'<Arguments>{escape(arguments)}</Arguments>' if arguments else '')
+		+ (f'<WorkingDirectory>{escape(str(working_directory))}</WorkingDirectory>' if working_directory else '') +
+		'</Exec></Actions>'
+	)
+	description = escape(' '.join(description.split()))
+	digest = hashlib.sha1((description + body).encode('utf-8')).hexdigest()
+	return (
+		'<?xml version="1.0" encoding="UTF-16"?>\n'
+		f'<Task version="1.2" xmlns="{NAMESPACE}">'
+		f'<RegistrationInfo><Source>{SOURCE}</Source><Description>{description}</Description><Documentation>{digest}</Documentation></RegistrationInfo>'
+		f'{body}</Task>'
+	)
+
+def digest_of(xml):
+	match = DIGEST_PATTERN.search(xml)
+	return match['digest'] if match else None
+
+def parse_snapshot(output, prefix):
+	""" Returns {task name: digest} for the tasks in `schtasks /query /xml` output whose name starts with prefix.
+		Tasks that weren't created by Pybiosis (or have no digest) map to None, so they are always updated.
+	"""
+	tasks = {}
+	for match in TASK_PATTERN.finditer(output):
+		name = match['name'].strip().lstrip('\\')
+		if name.startswith(prefix):
+			tasks[name] = digest_of(match['task']) if f'<Source>{SOURCE}</Source>' in match['task'] else None
+	return tasks
+
+def diff(desired, installed):
+	""" Compares {name: xml} with {name: digest}, returning (created, updated, deleted) names. """
+	created = [name for name in desired if name not in installed]
+	updated = [name for name in desired if name in installed and installed[name] != digest_of(desired[name])]
+	deleted = [name for name in installed if name not in desired]
+	return created, updated, deleted
+
+
+class TaskSchedulerBackend:
+	""" Synchronizes the Task Scheduler with a set of rendered tasks. """
+
+	EXE = 'schtasks'
+	MAX_WORKERS = 4
+
+	def __init__(self, directory, prefix='PYBIOSIS_', runner=command, max_workers=MAX_WORKERS):
+		self.directory = Path(directory)
+		self.prefix = prefix
+		self.runner = runner
+		self.max_workers = max_workers
+
+	def snapshot(self):
+		return parse_snapshot(self.runner([self.EXE, '/query', '/xml']), self.prefix)
+
+	def create(self, name, xml):
+		path = self.directory / f'{name}.xml'
+		path.write_text(xml, encoding='utf-16')  # schtasks.exe expects a unicode file.
+		return self.runner([self.EXE, '/create', '/tn', name, '/xml', str(path), '/f'])
+
+	def delete(self, name):
+		(self.directory / f'{name}.xml').unlink(missing_ok=True)
+		return self.runner([self.EXE, '/delete', '/tn', name, '/f'])
+
+	def sync(self, desired):
+		""" Takes {name: xml}, applies the differences and returns (created, updated, deleted). """
+		self.directory.mkdir(parents=True, exist_ok=True)
+		created, updated, deleted = diff(desired, self.snapshot())
+		with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+			jobs = [pool.submit(self.create, name, desired[name]) for name in created + updated]
+			jobs += [pool.submit(self.delete, name) for name in deleted]
+			for job in jobs:
+				job.result()  # Re-raises any errors.
+		return created, updated, deleted
@@ -0,0 +1,134 @@
+""" Registers `Scheduler` functions as systemd user timers on Linux.
+
+	Each function becomes a pybiosis-<name>.service and pybiosis-<name>.timer in the user unit directory.
+	Only units whose contents changed are written (atomically), stale units are removed,
+	and systemctl is called a fixed number of times (disable stale timers, daemon-reload, enable and restart changed timers),
+	however many units there are. Nothing is called if no unit changed.
+"""
+from pybiosis.scheduling.triggers import EPOCH, DAYS
+from pathlib import Path
+import subprocess
+import re
+import os
+
+PREFIX = 'pybiosis-'
+DAY_NAMES = [d.title() for d in DAYS]
+
+
+def unit_name(name):
+	return PREFIX + re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+def timer_lines(trigger):
+	""" Translates a Trigger into the [Timer] lines that fire it. """
+	t = trigger
+	time = t.start_time
+	minute, hour = (time.minute, time.hour) if time else (0, 0)
+	months = ','.join(f'{m:02}' for m in t.months) if t.months and len(t.months) < 12 else '*'
+	weekdays = lambda: ','.join(DAY_NAMES[d] for d in t.weekdays)
+	listed = lambda values: ','.join(f'{v:02}' for v in values)
+
+	match t.kind:
+		case 'minute' | 'hourly' if t.window:  # A line per group of hours, so the window's first and last hours are exact.
+			return [f'OnCalendar=*-*-* {listed(hours)}:{listed(minutes)}:00' for hours, minutes in t.window_times()]
+		case 'minute' if 60 % t.interval == 0:
+			return [f'OnCalendar=*-*-* *:{minute % t.interval:02}/{t.interval}:00']
+		case 'hourly' if 24 % t.interval == 0:
+			return [f'OnCalendar=*-*-* {hour % t.interval:02}/{t.interval}:{minute:02}:00']
+		case 'minute' | 'hourly' | 'daily' if t.kind != 'daily' or t.interval > 1:
+			# Periods that don't divide the hour/day are kept relative to the timer's last activation.
+			return [f'OnActiveSec=0', f'OnUnitActiveSec={int(t.period.total_seconds())}s']
+		case 'daily':
+			return [f'OnCalendar=*-*-* {hour:02}:{minute:02}:00']
+		case 'weekly' if t.interval == 1:
+			return [f'OnCalendar={weekdays()} *-*-* {hour:02}:{minute:02}:00']
+		case 'monthly' if t.last_day:
+			return [f'OnCalendar=*-{months}~01 {hour:02}:{minute:02}:00']
+		case 'monthly' if t.weeks:
+			days = '~07/1' if t.weeks == [5] else f'-{(t.weeks[0] - 1) * 7 + 1:02}..{t.weeks[0] * 7:02}'
+			return [f'OnCalendar={weekdays()} *-{months}{days} {hour:02}:{minute:02}:00']
+		case 'monthly':
+			return [f'OnCalendar=*-{months}-{",".join(f"{d:02}" for d in t.monthdays)} {hour:02}:{minute:02}:00']
+		case 'once':
+			return [f'OnCalendar={t.start:%Y-%m-%d %H:%M}:00']
+		case 'onstart' | 'onlogon':  # The user manager starts at login.
+			return ['OnStartupSec=0']
+	raise ValueError(f"systemd timers cannot express {t}.")
+
+def systemctl(arguments):
+	""" Runs systemctl, which reports what it did on stderr (eg: "Created symlink..."), so only its exit status is checked. """
+	subprocess.run(arguments, check=True, stdout=subprocess.DEVNULL)
+
+def render_units(name, triggers, working_directory, exec_start, description=''):
+	""" Returns {filename: contents} for the service and timer of one function. """
+	unit = unit_name(name)
+	conditions = []
+	for t in triggers:  # Start and end dates are enforced when the service runs, which only works for a single trigger.
+		if t.start_date and t.start_date != EPOCH and len(triggers) == 1:
+			conditions.append(f"ExecCondition=/bin/sh -c 'test $(date +%%s) -ge {int(t.start.timestamp())}'")
+		if t.end and len(triggers) == 1:
+			conditions.append(f"ExecCondition=/bin/sh -c 'test $(date +%%s) -le {int(t.end.timestamp())}'")
+	description = ' '.join((description or name).split())
+	service = '\n'.join([
+		'[Unit]',
+		f'Description={description}',
+		'',
+		'[Service]',
+		'Type=oneshot',
+		f'WorkingDirectory={working_directory}',
+		*conditions,
+		f'ExecStart={exec_start}',
+		'',
+	])
+	timer = '\n'.join([
+		'[Unit]',
+		f'Description={description}',
+		'',
+		'[Timer]',
+		*dict.fromkeys(line for t in triggers for line in timer_lines(t)),
+		'',
+		'[Install]',
+		'WantedBy=timers.target',
+		'',
+	])
+	return {f'{unit}.service': service, f'{unit}.timer': timer}
+
+
+class SystemdBackend:
+	""" Synchronizes a systemd user unit directory with a set of units. """
+
+	EXE = os.getenv('PYBIOSIS_SYSTEMCTL', 'systemctl')
+	UNIT_DIRECTORY = Path('~/.config/systemd/user').expanduser()
+
+	def __init__(self, directory=UNIT_DIRECTORY, exe=EXE, runner=systemctl):
+		self.directory = Path(directory)
+		self.exe = exe
+		self.runner = runner
+
+	def installed(self):
+		return {path.name: path.read_text() for path in self.directory.glob(PREFIX + '*') if path.suffix in ('.service', '.timer')}
+
+	def sync(self, units):
+		""" Takes {filename: contents} and returns (written, removed) filenames. """
+		self.directory.mkdir(parents=True, exist_ok=True)
+		installed = self.installed()
+		written = [name for name, contents in units.items() if installed.get(name) != contents]
+		removed = [name for name in installed if name not in units]
+		if not written and not removed:
+			return written, removed
+
+		stale_timers = [name for name in removed if name.endswith('.timer')]
+		if stale_timers:
+			self.runner([self.exe, '--user', 'disable', '--now', *stale_timers])
+		for name in removed:
+			(self.directory / name).unlink(missing_ok=True)
+		for name in written:
+			temporary = self.directory / f'.{name}.tmp'
+			temporary.write_text(units[name])
+			os.replace(temporary, self.directory / name)
+
+		self.runner([self.exe, '--user', 'daemon-reload'])
+		timers = [name for name in units if name.endswith('.timer') and (name in written or name.replace('.timer', '.service') in written)]
+		if timers:  # Restarting changed timers applies their new schedule.
+			self.runner([self.exe, '--user', 'enable', *timers])
+			self.runner([self.exe, '--user', 'restart', *timers])
+		return written, removed
@@ -0,0 +1,262 @@
+""" Parses the trigger vocabulary of the `Scheduler` decorator.
+
+	The vocabulary is the one used by schtasks.exe (see `pybiosis.compilers.scheduler`):
+		trigger: minute, hourly, daily, weekly, monthly, once, onstart, onlogon, onidle
+		modifier: the interval (#), or for monthly: lastday, FIRST, SECOND, THIRD, FOURTH, LAST
+		start/end: yyyy/MM/dd-hh:mm, yyyy/MM/dd, hh:mm, today-5:01pm or now
+		day: MON,FRI or # (day of the month)
+		month: FEB,MAR or *
+		idle: minutes (#) for onidle
+
+	The backends (Task Scheduler XML, cron, systemd, the in-process engine) all work from a `Trigger`.
+"""
+import datetime as dt
+import calendar
+
+DAYS = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+WEEKS = ['FIRST', 'SECOND', 'THIRD', 'FOURTH', 'LAST']
+KINDS = ['minute', 'hourly', 'daily', 'weekly', 'monthly', 'once', 'onstart', 'onlogon', 'onidle']
+
+EPOCH = dt.date(2000, 1, 1)  # Used when no start date is given, so that compiled schedules are stable.
+DATE_FORMATS = ['%Y/%m/%d', '%m/%d/%Y']
+TIME_FORMATS = ['%H:%M', '%H:%M:%S', '%I:%M%p', '%I%p']
+NOW_DELAY = dt.timedelta(minutes=2)
+
+
+def parse_date(value, now=None):
+	if value.lower() == 'today':
+		return (now or dt.datetime.now()).date()
+	for fmt in DATE_FORMATS:
+		try:
+			return dt.datetime.strptime(value, fmt).date()
+		except ValueError:
+			pass
+	raise ValueError(f"Could not parse the date: {value}")
+
+def parse_time(value):
+	for fmt in TIME_FORMATS:
+		try:
+			return dt.datetime.strptime(value.upper().replace(' ', ''), fmt).time()
+		except ValueError:
+			pass
+	raise ValueError(f"Could not parse the time: {value}")
+
+def parse_boundary(value, now=None):
+	""" Returns (date, time) for a start or end value, either of which may be None. """
+	if value is None:
+		return None, None
+	value = str(value).strip()
+	if value.lower() == 'now':  # Soon enough that the first run isn't missed.
+		soon = ((now or dt.datetime.now()) + NOW_DELAY).replace(second=0, microsecond=0)
+		return soon.date(), soon.time()
+	if '-' in value:
+		date, time = value.rsplit('-', 1)
+		return parse_date(date, now), parse_time(time)
+	try:
+		return parse_date(value, now), None
+	except ValueError:
+		return None, parse_time(value)
+
+def parse_names(value, names):
+	""" Parses 'MON,FRI' into [0, 4] (or '*' into every index). Numbers are kept as they are. """
+	if value is None:
+		return None
+	if str(value).strip() == '*':
+		return list(range(len(names)))
+	parsed = []
+	for item in str(value).upper().split(','):
+		item = item.strip()
+		if item.isdigit():
+			parsed.append(int(item))
+		elif item in names:
+			parsed.append(names.index(item))
+		else:
+			raise ValueError(f"Expected one of {', '.join(names)}, not: {item}")
+	return parsed
+
+def parse_months(value):
+	""" Parses 'FEB,MAR', '2,3' or '*' into [2, 3] (or [1, ..., 12]). """
+	if str(value).strip() == '*':
+		return list(range(1, 13))
+	return [int(m) if m.strip().isdigit() else MONTHS.index(m.strip()) + 1 for m in str(value).upper().split(',')]
+
+
+class Trigger:
+	""" The normalized form of the values of a `Scheduler(...)` decorator.
+
+		kind: one of KINDS.
+		interval: every N minutes/hours/days/weeks/months.
+		weekdays: [0-6] (Monday is 0), for weekly and monthly-by-week triggers.
+		monthdays: [1-31], for monthly-by-date triggers.
+		weeks: [1-5] (5 is the last week), for monthly-by-week triggers.
+		months: [1-12], for monthly triggers.
+		last_day: for 'monthly lastday' triggers.
+		window: (start time, end time) that minute and hourly triggers are limited to each day, or None.
+	"""
+
+	def __init__(self, trigger, modifier=None, start=None, end=None, day=None, month=None, idle=None, now=None):
+		self.kind = str(trigger).lower()
+		if self.kind not in KINDS:
+			raise ValueError(f"Unknown trigger {trigger}, expected one of: {', '.join(KINDS)}.")
+		self.start_date, self.start_time = parse_boundary(start, now)
+		self.end_date, self.end_time = parse_boundary(end, now)
+		self.idle = int(idle) if idle is not None else None
+		self.interval = 1
+		self.weekdays = None
+		self.monthdays = None
+		self.weeks = None
+		self.months = None
+		self.last_day = False
+
+		modifier = str(modifier).upper() if modifier is not None else None
+		if self.kind == 'monthly' and modifier in WEEKS:
+			self.weeks = [WEEKS.index(modifier) + 1]
+			self.weekdays = parse_names(day or 'MON', DAYS)
+		elif self.kind == 'monthly' and modifier == 'LASTDAY':
+			self.last_day = True
+		elif modifier is not None:
+			self.interval = int(modifier)
+			if self.interval < 1:
+				raise ValueError(f"The modifier must be positive, not: {modifier}")
+
+		if self.kind == 'weekly':
+			self.weekdays = parse_names(day or 'MON', DAYS)
+		if self.kind == 'monthly':
+			if self.weeks is None and not self.last_day:
+				self.monthdays = parse_names(day or 1, [])
+			if month is not None:
+				self.months = parse_months(month)
+			else:  # Every N months, counting from the start month.
+				first = self.start.month
+				self.months = sorted({(first - 1 + k * self.interval) % 12 + 1 for k in range(12)})
+
+		if self.kind == 'once' and self.start_date is None and self.start_time is None:
+			raise ValueError("A 'once' trigger requires a start.")
+
+	@classmethod
+	def from_values(cls, values, now=None):
+		""" Accepts the `values` dict stored by the `Scheduler` decorator. """
+		return cls(**values, now=now)
+
+	@property
+	def start(self):
+		return dt.datetime.combine(self.start_date or EPOCH, self.start_time or dt.time(0, 0))
+
+	@property
+	def end(self):
+		""" The last moment that the trigger may fire, or None. """
+		if self.end_date is None:
+			return None
+		return dt.datetime.combine(self.end_date, self.end_time or dt.time(23, 59, 59))
+
+	@property
+	def window(self):
+		if self.kind in ('minute', 'hourly') and self.end_date is None and self.end_time is not None:
+			return self.start_time or dt.time(0, 0), self.end_time
+		return None
+
+	def window_times(self):
+		""" The times of day that a windowed trigger fires, as [(hours, minutes)]: the hours that share the same minutes.
+			eg: every 20 minutes from 17:30 to 08:15 is [([17], [30, 50]), ([18, ..., 7], [10, 30, 50]), ([8], [10])].
+		"""
+		start, end = self.window
+		opens = start.hour * 60 + start.minute
+		length = ((end.hour * 60 + end.minute) - opens) % (24 * 60) or 24 * 60
+		step = int(self.period.total_seconds() // 60)
+		by_hour = {}
+		for offset in range(0, length + 1, step):
+			hour, minute = divmod((opens + offset) % (24 * 60), 60)
+			by_hour.setdefault(hour, set()).add(minute)
+		groups = {}
+		for hour, minutes in by_hour.items():  # In the order of the window, eg: 17, ..., 23, 0, ..., 8.
+			groups.setdefault(tuple(sorted(minutes)), []).append(hour)
+		return [(hours, list(minutes)) for minutes, hours in groups.items()]
+
+	@property
+	def period(self):
+		""" The fixed period between runs, for the triggers that have one. """
+		return {
+			'minute': dt.timedelta(minutes=self.interval),
+			'hourly': dt.timedelta(hours=self.interval),
+			'daily': dt.timedelta(days=self.interval),
+		}.get(self.kind)
+
+	def next_after(self, moment):
+		""" Returns the first time after `moment` that the trigger fires, or None if it never will again.
+			onstart, onlogon and onidle triggers are event based, so they return None.
+		"""
+		start = self.start
+		match self.kind:
+			case 'once':
+				found = start if start > moment else None
+			case 'minute' | 'hourly' if self.window:
+				found = self._next_in_window(moment)
+			case 'minute' | 'hourly' | 'daily':
+				found = start + self.period * (0 if moment < start else (moment - start) // self.period + 1)
+			case 'weekly':
+				found = self._next_weekly(moment)
+			case 'monthly':
+				found = self._next_monthly(moment)
+			case _:
+				found = None
+		if found is None or (self.end is not None and found > self.end):
+			return None
+		return found
+
+	def _next_in_window(self, moment):
+		window_start, window_end = self.window
+		length = dt.timedelta(minutes=((window_end.hour * 60 + window_end.minute) - (window_start.hour * 60 + window_start.minute)) % (24 * 60) or 24 * 60)
+		day = max(moment.date() - dt.timedelta(days=1), self.start_date or EPOCH)  # The previous window may cross midnight.
+		for _ in range(3):
+			opens = dt.datetime.combine(day, window_start)
+			if moment < opens + length:
+				found = opens + self.period * (0 if moment < opens else (moment - opens) // self.period + 1)
+				if found <= opens + length:
+					return found
+			day += dt.timedelta(days=1)
+		return dt.datetime.combine(day, window_start)
+
+	def _next_weekly(self, moment):
+		start = self.start
+		first_monday = start.date() - dt.timedelta(days=start.weekday())
+		time = self.start_time or dt.time(0, 0)
+		week = max(0, (moment.date() - first_monday).days // 7)
+		week -= week % self.interval  # Align to a week that runs.
+		for w in (week, week + self.interval):
+			monday = first_monday + dt.timedelta(weeks=w)
+			for day in sorted(self.weekdays):
+				found = dt.datetime.combine(monday + dt.timedelta(days=day), time)
+				if found > moment and found >= start:
+					return found
+		return None
+
+	def _next_monthly(self, moment):
+		start = self.start
+		time = self.start_time or dt.time(0, 0)
+		year, month = max(moment, start).year, max(moment, start).month
+		for _ in range(12 * 8 + 1):  # Long enough to reach a Feb 29th.
+			if month in self.months:
+				for day in sorted(self.days_in_month(year, month)):
+					found = dt.datetime.combine(dt.date(year, month, day), time)
+					if found > moment and found >= start:
+						return found
+			year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+		return None
+
+	def days_in_month(self, year, month):
+		""" The days of the given month that a monthly trigger fires on. """
+		length = calendar.monthrange(year, month)[1]
+		if self.last_day:
+			return [length]
+		if self.weeks:
+			days = []
+			for weekday in self.weekdays:
+				first = (weekday - dt.date(year, month, 1).weekday()) % 7 + 1
+				occurrences = list(range(first, length + 1, 7))
+				days.extend(occurrences[-1] if week == 5 else occurrences[week - 1] for week in self.weeks)
+			return days
+		return [d for d in self.monthdays if d <= length]
+
+	def __repr__(self):
+		return f'Trigger({self.kind}, interval={self.interval}, start={self.start}, end={self.end})'
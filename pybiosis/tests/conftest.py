@@ -0,0 +1,22 @@
+import pytest
+import sys
+
+
+@pytest.fixture(autouse=True)
+def user_path(tmp_path, monkeypatch):
+	""" Runs each test with a temporary user path (`--local` makes it the current directory). """
+	monkeypatch.setattr(sys, 'argv', ['bb', '--local'])
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setattr('pybiosis.runtime.HISTORY', False)
+	return tmp_path
+
+
+@pytest.fixture
+def registry():
+	""" Restores Device.FUNCTIONS after the test registers functions. """
+	from pybiosis.core import Device
+	functions, originals = list(Device.FUNCTIONS), dict(Device.ORIGINALS)
+	yield Device.FUNCTIONS
+	Device.FUNCTIONS[:] = functions
+	Device.ORIGINALS.clear()
+	Device.ORIGINALS.update(originals)
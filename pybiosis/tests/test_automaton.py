@@ -0,0 +1,43 @@
+from pybiosis.compilers.assistant import PhraseGrammar, multi_phrase
+from pybiosis.util.automaton import PhraseAutomaton
+import random
+
+WORDS = ['open', 'play', 'the', 'spire', 'fire', 'volume', 'up', 'down', 'lights']
+
+
+def random_grammar(rng):
+	""" One or two alternatives of one to three slots, with synonyms of one or two words. """
+	synonym = lambda: ' '.join(rng.sample(WORDS, rng.randrange(1, 3)))
+	return PhraseGrammar([[[synonym() for _ in range(rng.randrange(1, 3))] for _ in range(rng.randrange(1, 4))] for _ in range(rng.randrange(1, 3))])
+
+
+def test_the_automaton_accepts_what_the_expanded_grammars_list():
+	rng = random.Random(3)
+	items = [(f'module.f{i}', random_grammar(rng)) for i in range(30)]
+	automaton = PhraseAutomaton.from_grammars(items)
+	phrases = {}  # The first key listing a phrase wins, as in the automaton.
+	for key, grammar in items:
+		for phrase in grammar:
+			phrases.setdefault(phrase, key)
+
+	utterances = list(phrases) + [' '.join(rng.choices(WORDS, k=rng.randrange(1, 5))) for _ in range(500)]
+	for utterance in utterances:
+		expected = (phrases[utterance], None) if utterance in phrases else None
+		assert automaton.lookup(utterance) == expected
+
+
+def test_arguments_and_saved_automatons(tmp_path):
+	items = [('module.volume', multi_phrase(['volume', 'sound'], ['to $'])), ('module.mute', multi_phrase(['volume', 'sound'], ['to zero']))]
+	automaton = PhraseAutomaton.from_grammars(items)
+	automaton.save(tmp_path / 'phrases.bin')
+	for loaded in (automaton, PhraseAutomaton.load(tmp_path / 'phrases.bin'), PhraseAutomaton.load(tmp_path / 'phrases.bin', copy=True)):
+		assert loaded.lookup('Sound to 30') == ('module.volume', '30')
+		assert loaded.lookup('volume to zero') == ('module.mute', None)  # An exact phrase wins over an argument.
+		assert loaded.lookup('volume to') is None
+
+
+def test_only_a_trailing_argument_word_takes_an_argument():
+	assert multi_phrase(['volume'], ['to $']).takes_argument
+	grammar = multi_phrase(['price'], ['in US$'])  # Ends with '$', but not with a '$' word.
+	assert not grammar.takes_argument
+	assert grammar.match('price in US$') == (True, None)
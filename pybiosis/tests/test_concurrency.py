@@ -0,0 +1,150 @@
+from pybiosis.core import Device, StreamDeck, Scheduler
+from pybiosis.runtime import ConcurrencyGuard, policies, state_path
+from pybiosis.util.locks import FileLock
+from pathlib import Path
+import pybiosis
+import subprocess
+import threading
+import signal
+import pytest
+import sys
+import os
+
+
+def registered(registry, function):
+	return [f for c, f in registry if f.original is function.original]
+
+
+def test_stacked_wrappers_share_the_outer_policies(registry):
+	@Device(concurrency='skip', timeout=30)
+	@StreamDeck(location='auto:Tests')
+	@Scheduler(trigger='daily')
+	def job():
+		pass
+
+	entries = registered(registry, job)
+	assert len(entries) == 3
+	for entry in entries:
+		assert policies(entry).concurrency == 'skip'
+		assert policies(entry).timeout == 30
+
+
+def test_stacked_skip_runs_once(registry):
+	calls = []
+
+	@Device(concurrency='skip')
+	@StreamDeck(location='auto:Tests')
+	def job():
+		calls.append(1)
+
+	job()
+	for entry in registered(registry, job):
+		entry()
+	assert len(calls) == 3
+
+
+def test_stacked_queue_does_not_deadlock(registry):
+	calls = []
+
+	@Device(concurrency='queue')
+	@Scheduler(trigger='daily')
+	def job():
+		calls.append(1)
+
+	thread = threading.Thread(target=job, daemon=True)
+	thread.start()
+	thread.join(5)
+	assert not thread.is_alive()
+	assert calls == [1]
+
+
+def test_skip_while_another_run_holds_the_slot(registry):
+	calls = []
+
+	@Device(concurrency='skip')
+	@StreamDeck(location='auto:Tests')
+	def job():
+		calls.append(1)
+
+	guard = ConcurrencyGuard.from_function(policies(job))
+	slot = FileLock(str(state_path('locks', f'{guard.key}.0.lock')))
+	assert slot.acquire(blocking=False)
+	try:
+		entry = registered(registry, job)[0]  # What the GUI, gateway and scheduler call.
+		entry()
+		job()
+		assert calls == []
+	finally:
+		slot.release()
+	job()
+	assert calls == [1]
+
+
+def test_debounce_drops_quick_repeats(registry):
+	calls = []
+
+	@Device(debounce_ms=60_000)
+	def job():
+		calls.append(1)
+
+	job()
+	job()
+	assert calls == [1]
+
+
+def test_holder_is_readable_while_locked(tmp_path):
+	lock = FileLock(str(tmp_path / 'held.lock'))
+	other = FileLock(str(tmp_path / 'held.lock'))
+	assert lock.acquire(blocking=False)
+	assert not other.acquire(blocking=False)
+	assert other.holder() == os.getpid()
+	lock.release()
+	assert other.holder() is None
+	assert other.acquire(blocking=False)
+	other.release()
+
+
+HOLDER = '''
+import sys, time
+from pybiosis.util.locks import FileLock
+lock = FileLock(sys.argv[1])
+assert lock.acquire(blocking=False, tag=sys.argv[2])
+print('ready', flush=True)
+time.sleep(float(sys.argv[3]))
+lock.release()
+'''
+
+
+def hold(guard, tag, seconds):
+	""" A process that holds the first slot of the guard (tagged as a host, or a single run) for a while. """
+	process = subprocess.Popen([sys.executable, '-c', HOLDER, str(state_path('locks', f'{guard.key}.0.lock')), tag, str(seconds)],
+		stdout=subprocess.PIPE, text=True, env=dict(os.environ, PYTHONPATH=str(Path(pybiosis.__file__).parent.parent)))
+	assert process.stdout.readline().strip() == 'ready'
+	return process
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Stopping a process is checked with its exit signal.')
+def test_replace_stops_a_single_run(registry):
+	calls = []
+
+	@Device(concurrency='replace')
+	def job():
+		calls.append(1)
+
+	process = hold(ConcurrencyGuard.from_function(policies(job)), 'single', 30)
+	job()
+	assert process.wait(5) == -signal.SIGTERM
+	assert calls == [1]
+
+
+def test_replace_queues_behind_a_host_running_other_work(registry):
+	calls = []
+
+	@Device(concurrency='replace')
+	def job():
+		calls.append(1)
+
+	process = hold(ConcurrencyGuard.from_function(policies(job)), 'host', 0.5)
+	job()
+	assert process.wait(5) == 0  # It finished its work, and then the job ran.
+	assert calls == [1]
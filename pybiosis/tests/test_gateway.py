@@ -0,0 +1,105 @@
+from pybiosis.gateway import Gateway
+from pybiosis.core import Device
+from types import SimpleNamespace
+import asyncio
+import json
+import pytest
+
+
+def request(gateway, method, path, body=None, headers=None):
+	""" Sends one request to a gateway listening on a free port, and returns (status, payload). """
+	async def send():
+		await gateway.start()
+		try:
+			reader, writer = await asyncio.open_connection('127.0.0.1', gateway.port)
+			data = b'' if body is None else json.dumps(body).encode()
+			fields = {'Host': f'127.0.0.1:{gateway.port}', 'Content-Length': len(data), 'Connection': 'close', **(headers or {})}
+			lines = [f'{method} {path} HTTP/1.1'] + [f'{k}: {v}' for k, v in fields.items() if v is not None]
+			writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + data)
+			response = await reader.read()
+			writer.close()
+		finally:
+			gateway.server.close()
+			await gateway.server.wait_closed()
+		head, _, payload = response.partition(b'\r\n\r\n')
+		return int(head.split()[1]), json.loads(payload)
+	return asyncio.run(send())
+
+
+JSON = {'Content-Type': 'application/json'}
+
+
+@pytest.fixture
+def user(registry):
+	""" The registered functions of the tests, and the values passed to record. """
+	calls = []
+
+	@Device(title='Record')
+	def record(value):
+		calls.append(value)
+
+	@Device(title='Broken')
+	def broken():
+		raise KeyError('missing')
+
+	functions = {f'{__name__}.{f.name}': f for c, f in registry if f.module.__name__ == __name__}
+	return SimpleNamespace(functions=functions, calls=calls)
+
+
+def test_calls_need_a_json_post(user):
+	gateway = Gateway(user.functions, port=0)
+	assert request(gateway, 'GET', f'/call?function={__name__}.record')[0] == 405
+	assert request(gateway, 'POST', '/call', {'function': f'{__name__}.record', 'args': [1]})[0] == 415
+	status, payload = request(gateway, 'POST', '/call', {'function': f'{__name__}.record', 'args': [1]}, JSON)
+	assert (status, payload['status'], user.calls) == (200, 'ok', [1])
+
+
+def test_errors_are_reported_as_500(user):
+	status, payload = request(Gateway(user.functions, port=0), 'POST', '/call', {'function': f'{__name__}.broken'}, JSON)
+	assert status == 500 and 'KeyError' in payload['error']
+
+
+def test_malformed_arguments_are_rejected(user):
+	gateway = Gateway(user.functions, port=0)
+	for body in ({'function': f'{__name__}.record', 'args': 5}, {'function': f'{__name__}.record', 'kwargs': [1, 2]}, {'phrase': 'x', 'args': 'abc'}):
+		assert request(gateway, 'POST', '/call', body, JSON)[0] == 400
+	status, payload = request(gateway, 'POST', '/batch', [{'function': f'{__name__}.record', 'args': 5}, {'function': f'{__name__}.record', 'args': [3]}], JSON)
+	assert status == 200 and [r.get('code') for r in payload] == [400, None]
+	assert user.calls == [3]
+
+
+def test_only_loopback_hosts_are_served_without_a_token(user):
+	gateway = Gateway(user.functions, port=0)
+	body = {'function': f'{__name__}.record', 'args': [4]}
+	assert request(gateway, 'POST', '/call', body, {**JSON, 'Host': 'attacker.example:8765'})[0] == 403
+	assert request(gateway, 'GET', '/health', headers={'Host': None})[0] == 403
+	for host in ('localhost:8765', '[::1]:8765', '127.0.0.1'):
+		assert request(gateway, 'POST', '/call', body, {**JSON, 'Host': host})[0] == 200
+	assert request(Gateway(user.functions, port=0, token='secret'), 'POST', '/call', body, {**JSON, 'Host': 'pc.lan', 'Authorization': 'Bearer secret'})[0] == 200
+	assert user.calls == [4, 4, 4, 4]
+
+
+def test_a_token_is_required_beyond_localhost(user):
+	with pytest.raises(ValueError):
+		Gateway(user.functions, host='0.0.0.0')
+	gateway = Gateway(user.functions, port=0, token='secret')
+	body = {'function': f'{__name__}.record', 'args': [2]}
+	assert request(gateway, 'POST', '/call', body, JSON)[0] == 401
+	assert request(gateway, 'POST', '/call', body, {**JSON, 'Authorization': 'Bearer wrong'})[0] == 401
+	assert request(gateway, 'POST', '/call', body, {**JSON, 'Authorization': 'Bearer secret'})[0] == 200
+	assert request(gateway, 'GET', '/health')[0] == 200
+	assert user.calls == [2]
+
+
+def test_refresh_swaps_in_the_phrases(registry):
+	from pybiosis.compilers.assistant import Assistant
+	gateway = Gateway({}, Gateway.build_automaton(registry), port=0)
+
+	@Device(title='Lights')
+	@Assistant('lights on')
+	def lights():
+		pass
+
+	gateway.refresh(registry)
+	assert gateway.automaton.lookup('lights on') == (f'{__name__}.lights', None)
+	assert request(gateway, 'POST', '/phrase', {'phrase': 'lights on'}, JSON)[0] == 200
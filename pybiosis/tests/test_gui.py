@@ -0,0 +1,39 @@
+from pybiosis.core import Device, StreamDeck
+from pybiosis.util.resources import FunctionTimeout
+from pybiosis.compilers.gui import Executor
+import time
+import sys
+
+
+def run(registry, original):
+	""" Clicks the StreamDeck entry of a function, and waits for it to finish. """
+	entry = next(f for c, f in registry if c is StreamDeck and f.original is original)
+	executor = Executor(max_workers=2)
+	execution = executor.submit(entry)
+	executor.pool.shutdown(wait=True)
+	return execution
+
+
+def test_the_output_is_captured_during_the_execution_only(registry):
+	@Device(title='Talk')
+	@StreamDeck(location='auto:Tests')
+	def talk():
+		print('hello')
+		print('oops', file=sys.stderr)
+
+	stdout = sys.stdout
+	execution = run(registry, talk.original)
+	assert execution.status == 'done'
+	assert execution.output.getvalue() == 'hello\noops\n'
+	assert sys.stdout is stdout
+
+
+def test_the_device_policies_apply_to_the_streamdeck_entry(registry):
+	@Device(title='Slow', timeout=0.05)
+	@StreamDeck(location='auto:Tests')
+	def slow():
+		for _ in range(100):
+			time.sleep(0.01)
+
+	execution = run(registry, slow.original)
+	assert execution.status == 'failed' and isinstance(execution.error, FunctionTimeout)
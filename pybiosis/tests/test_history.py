@@ -0,0 +1,64 @@
+from pybiosis.core import Device, StreamDeck, Scheduler
+from pybiosis.history import HistoryWriter, History
+import pybiosis.runtime as runtime
+import pytest
+import time
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+	""" Records the calls with a writer of its own, and returns a function that flushes and reads the rows. """
+	writer = HistoryWriter(str(tmp_path / 'history.db'))
+	monkeypatch.setattr(runtime, 'HISTORY', True)
+	monkeypatch.setattr(runtime.history, 'get_writer', lambda: writer)
+
+	def runs(**filters):
+		writer.close()
+		return History(writer.path).runs(**filters)
+	return runs
+
+
+def test_a_stacked_call_is_recorded_once(registry, history):
+	@Device(title='Both')
+	@Scheduler(trigger='daily')
+	@StreamDeck(location='auto:Tests')
+	def both():
+		pass
+
+	both()
+	rows = history()
+	assert [(r['function'], r['status']) for r in rows] == [(f'{__name__}.both', 'ok')]
+
+
+def test_a_failure_is_recorded_once_as_failed(registry, history):
+	@Device(title='Broken')
+	@StreamDeck(location='auto:Tests')
+	def broken():
+		raise KeyError('missing')
+
+	entry = next(f for c, f in registry if c is StreamDeck and f.original is broken.original)
+	with pytest.raises(KeyError):
+		runtime.invoke(entry, entry.original, (), {})
+	rows = history()
+	assert len(rows) == 1
+	assert rows[0]['status'] == 'failed' and 'KeyError' in rows[0]['error']
+
+
+def test_an_unusable_database_drops_the_rows(tmp_path):
+	(tmp_path / 'file').write_text('')
+	writer = HistoryWriter(str(tmp_path / 'file' / 'history.db'))  # Its directory can't be created.
+	writer.thread.join(5)
+	assert not writer.thread.is_alive()
+	for _ in range(100):
+		writer.record('mod.function', 0, 0, 'ok')
+	assert writer.rows.empty()
+
+
+def test_summary_percentiles(tmp_path):
+	writer = HistoryWriter(str(tmp_path / 'history.db'))
+	for i in range(100):
+		writer.record('mod.f', time.time(), i / 100, 'ok' if i % 10 else 'failed')
+	writer.close()
+	summary = History(writer.path).summary()['mod.f']
+	assert summary['runs'] == 100 and summary['failed'] == 10
+	assert summary['p50'] == pytest.approx(0.5) and summary['p99'] == pytest.approx(0.99)
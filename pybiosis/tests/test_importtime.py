@@ -0,0 +1,61 @@
+from pybiosis.importtime import ImportTimings, load_baseline, save_baseline
+from types import SimpleNamespace
+import pybiosis.__main__ as main
+import importlib
+import argparse
+import textwrap
+import sys
+
+
+def entry(ms):
+	return {'ms': ms, 'memory': None, 'status': 'ok', 'imports': {}}
+
+
+def test_imports_are_timed_with_the_modules_they_import(user_path, monkeypatch):
+	monkeypatch.syspath_prepend(str(user_path))
+	(user_path / 'pybiosis_slow_dependency.py').write_text('import time\ntime.sleep(0.05)\n')
+	(user_path / 'pybiosis_slow.py').write_text(textwrap.dedent('''
+		import time
+		import pybiosis_slow_dependency
+		time.sleep(0.05)
+	'''))
+	timings = ImportTimings()
+	try:
+		with timings.measure('pybiosis_slow.py'):
+			importlib.import_module('pybiosis_slow')
+	finally:
+		sys.modules.pop('pybiosis_slow', None)
+		sys.modules.pop('pybiosis_slow_dependency', None)
+	measured = timings.modules['pybiosis_slow.py']
+	assert measured['ms'] >= 100
+	assert 50 <= measured['imports']['pybiosis_slow_dependency'][1] < measured['ms']
+
+
+def test_the_report_lists_the_slowest_first_and_flags_regressions():
+	timings = ImportTimings()
+	timings.modules = {'fast.py': entry(10.0), 'slow.py': entry(300.0), 'noisy.py': entry(4.0)}
+	baseline = {'fast.py': {'ms': 5.0}, 'slow.py': {'ms': 290.0}, 'noisy.py': {'ms': 1.0}}
+	lines = timings.report(baseline, threshold=25)
+	assert [line.split()[0] for line in lines[1:]] == ['slow.py', 'fast.py', 'noisy.py', 'total']
+	assert '+100% vs baseline' in lines[2]
+	assert 'baseline' not in lines[1] and 'baseline' not in lines[3]  # Within the threshold, or below MIN_REGRESSION_MS.
+	assert timings.regressions(baseline) == ['fast.py']
+
+
+def test_the_baseline_round_trips(user_path):
+	path = str(user_path / '.compilers' / 'import_timings.json')
+	assert load_baseline(path) is None
+	timings = ImportTimings()
+	timings.modules = {'module.py': entry(12.5)}
+	save_baseline(path, timings)
+	assert load_baseline(path) == {'module.py': {'ms': 12.5, 'memory': None}}
+	assert timings.regressions(load_baseline(path)) == []
+
+
+def test_the_load_command_is_the_first_to_import_the_user_modules(monkeypatch):
+	loaded = []
+	monkeypatch.setattr(main, 'ConfigurationManager', lambda path: SimpleNamespace(has=lambda key: True))
+	monkeypatch.setattr(main.pybiosis, 'load', lambda *args: loaded.append(args))
+	monkeypatch.setattr(sys, 'argv', ['bb', '--local', 'load', '--timings'])
+	main.Commands().add_run(setup=argparse.ArgumentParser(), args=None)
+	assert loaded == []
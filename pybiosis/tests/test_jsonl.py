@@ -0,0 +1,34 @@
+from pybiosis.util.jsonl import JsonlWriter, JsonlReader
+import pytest
+
+
+@pytest.fixture
+def data(tmp_path):
+	path = str(tmp_path / 'data.jsonl')
+	with JsonlWriter(path) as writer:
+		for i in range(50):
+			writer.write({'function': f'module.f{i}'}, keys=[f'module.f{i}', f'Play  Song {i}'])
+	return path
+
+
+def test_records_round_trip_in_order(data):
+	with JsonlReader(data) as reader:
+		assert [record['function'] for record in reader] == [f'module.f{i}' for i in range(50)]
+
+
+def test_records_are_read_by_any_of_their_keys(data):
+	with JsonlReader(data) as reader:
+		assert reader.get('module.f7') == {'function': 'module.f7'}
+		assert reader.get('play song 42') == {'function': 'module.f42'}  # Keys are normalized.
+		assert reader.get('module.missing') is None
+		assert reader.get('module.missing', default={}) == {}
+	assert reader.get('module.f7') is None  # Nothing is left to search once closed.
+
+
+def test_an_empty_index(tmp_path):
+	path = str(tmp_path / 'empty.jsonl')
+	with JsonlWriter(path):
+		pass
+	with JsonlReader(path) as reader:
+		assert reader.get('anything') is None
+		assert list(reader) == []
@@ -0,0 +1,59 @@
+from pybiosis.experimental.matching import BKTree, PhraseMatcher, levenshtein
+from pybiosis.compilers.assistant import Assistant, multi_phrase
+from pybiosis.core import Device
+import random
+import time
+
+
+def test_the_docstring_examples():
+	play_spire, volume = object(), object()
+	matcher = PhraseMatcher.from_phrases({'play spire': play_spire, 'volume $': volume})
+	assert matcher.match('play spier') == ('play spire', play_spire, None, 1.0)
+	assert matcher.match('lay spire')[:3] == ('play spire', play_spire, None)
+	assert round(matcher.match('lay spire').confidence, 2) == 0.8
+	assert matcher.match('play fire') is None
+	assert PhraseMatcher.from_phrases({'play spire': play_spire}, threshold=0.6).match('play fire').value is play_spire
+	assert matcher.match('volume 30') == ('volume $', volume, '30', 1.0)
+
+
+def test_levenshtein_matches_the_dynamic_programming_distance():
+	def reference(a, b):
+		row = list(range(len(b) + 1))
+		for i, x in enumerate(a, 1):
+			previous, row[0] = row[0], i
+			for j, y in enumerate(b, 1):
+				previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (x != y))
+		return row[-1]
+
+	rng = random.Random(1)
+	for _ in range(500):
+		a, b = (''.join(rng.choices('ABKST', k=rng.randrange(12))) for _ in range(2))
+		assert levenshtein(a, b) == reference(a, b)
+
+
+def test_the_bk_tree_finds_what_brute_force_finds():
+	rng = random.Random(2)
+	words = {''.join(rng.choices('PLSFRKT', k=rng.randrange(2, 9))) for _ in range(500)}
+	tree = BKTree()
+	for word in words:
+		tree.add(word, word)
+	for _ in range(200):
+		query, radius = ''.join(rng.choices('PLSFRKT', k=rng.randrange(2, 9))), rng.randrange(4)
+		found = sorted(key for _, key, _ in tree.search(query, radius))
+		assert found == sorted(word for word in words if levenshtein(query, word) <= radius)
+
+
+def test_grammars_are_indexed_without_listing_their_phrases(registry):
+	slots = [[f'word{i}', f'other{i}', f'third{i}'] for i in range(12)]  # 3 ** 12 = 531441 phrases.
+
+	@Device(title='Many')
+	@Assistant(multi_phrase(*slots))
+	def many():
+		pass
+
+	start = time.perf_counter()
+	matcher = PhraseMatcher.from_functions(registry)
+	assert time.perf_counter() - start < 1
+	assert len(matcher) == sum(map(len, slots)) - len(slots) + 1
+	assert matcher.match(' '.join(slot[i % 3] for i, slot in enumerate(slots))).value.original is many.original
+	assert matcher.match(' '.join(slot[0] for slot in slots).replace('word5', 'ward5')).value.original is many.original
@@ -0,0 +1,50 @@
+from pybiosis.processes import DriverLog, last_lines, follow
+import logging
+import os
+
+
+def write(log, *lines):
+	for line in lines:
+		log.handle(logging.makeLogRecord({'msg': line, 'levelno': logging.INFO}))
+
+
+def test_following_continues_where_the_last_lines_end(user_path):
+	path = str(user_path / 'driver.log')
+	log = DriverLog(path, maxBytes=0, backupCount=3)
+	write(log, 'one', 'two')
+	lines, end = last_lines(path, 10)
+	write(log, 'three')  # Written before the log is followed.
+	followed = []
+	follow(path, str(user_path / 'driver.json'), output=followed.append, start=end)
+	log.close()
+	assert lines + followed == ['one', 'two', 'three']
+
+
+def test_following_reads_the_rest_of_a_rotated_log(user_path):
+	path = str(user_path / 'driver.log')
+	log = DriverLog(path, maxBytes=20, backupCount=3)
+	write(log, 'line 0')
+	_, end = last_lines(path, 10)
+	write(log, *[f'line {i}' for i in range(1, 6)])
+	followed = []
+	follow(path, str(user_path / 'driver.json'), output=followed.append, start=end)
+	log.close()
+	assert os.path.exists(path + '.1')
+	assert followed == [f'line {i}' for i in range(1, 6)]
+
+
+def test_a_log_that_cannot_be_rotated_keeps_its_lines(user_path, monkeypatch):
+	path = str(user_path / 'driver.log')
+	log = DriverLog(path, maxBytes=20, backupCount=3)
+	replace = os.replace
+	def locked(source, destination):
+		if source == path:
+			raise PermissionError(13, 'The file is being used by another process')
+		replace(source, destination)
+	monkeypatch.setattr(os, 'replace', locked)
+	write(log, *[f'line {i}' for i in range(6)])
+	monkeypatch.setattr(os, 'replace', replace)
+	write(log, 'line 6')  # Rotated once the log can be renamed.
+	log.close()
+	assert last_lines(path, 10)[0] == [f'line {i}' for i in range(7)]
+	assert not os.path.exists(path + '.2')
@@ -0,0 +1,50 @@
+from pybiosis.profiling import Profiler, collapsed_stacks
+import threading
+import pytest
+import time
+
+
+def layered_stats(layers):
+	""" pstats-like stats of a root calling two functions, which both call the next two functions, and so on,
+		so the number of paths doubles with each layer. Every function spends 1s in itself.
+	"""
+	rows = [[('user.py', 0, 'root')]] + [[('user.py', layer, f'a{layer}'), ('user.py', layer, f'b{layer}')] for layer in range(1, layers)]
+	stats, below = {}, 0
+	for layer in reversed(range(layers)):
+		callers = rows[layer - 1] if layer else []
+		total = 1 + below
+		for function in rows[layer]:
+			stats[function] = (1, 1, 1, total, {caller: (1, 1, 0, total / len(callers)) for caller in callers})
+		below = total * len(rows[layer]) / len(callers) if callers else 0  # The time each caller spends in this layer.
+	return stats
+
+
+def test_collapsed_stacks_of_a_deep_graph_are_bounded():
+	stats = layered_stats(40)
+	start = time.perf_counter()
+	stacks = collapsed_stacks(stats)
+	assert time.perf_counter() - start < 5
+	assert sum(stacks.values()) == pytest.approx(sum(entry[2] for entry in stats.values()) * 1e6)
+
+
+def test_concurrent_profilers_do_not_fail(tmp_path):
+	barrier = threading.Barrier(2)
+	errors, profilers = [], []
+
+	def profile():
+		try:
+			with Profiler('concurrent', directory=str(tmp_path)) as profiler:
+				barrier.wait()
+				sum(range(1000))
+				barrier.wait()
+			profilers.append(profiler)
+		except Exception as e:
+			errors.append(e)
+
+	threads = [threading.Thread(target=profile) for _ in range(2)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert errors == []
+	assert sorted(len(p.paths) for p in profilers) == [0, 2]
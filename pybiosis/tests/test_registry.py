@@ -0,0 +1,45 @@
+from pybiosis.core import Device, StreamDeck
+from pybiosis.util.general import module_name
+
+
+def keys(registry):
+	return sorted(Device.key(f)[1] for c, f in registry if f.module.__name__ == __name__)
+
+
+def test_functions_sharing_a_name_in_nested_classes_are_kept(registry):
+	class Brightness:
+		@Device(title='Up')
+		def up():
+			pass
+
+	class Contrast:
+		@Device(title='Up')
+		def up():
+			pass
+
+	assert keys(registry) == [
+		'test_functions_sharing_a_name_in_nested_classes_are_kept.<locals>.Brightness.up',
+		'test_functions_sharing_a_name_in_nested_classes_are_kept.<locals>.Contrast.up',
+	]
+
+
+def test_a_function_executed_again_replaces_its_entries(registry):
+	def execute():  # Like a module that is reloaded: the same function, defined again.
+		@Device(title='Job')
+		@StreamDeck(location='auto:Tests')
+		def job():
+			pass
+		return job
+
+	for _ in range(50):
+		job = execute()
+	entries = [f for c, f in registry if f.module.__name__ == __name__]
+	assert len(entries) == 2
+	assert all(f.original is job.original for f in entries)
+
+
+def test_module_names_only_drop_a_leading_directory_prefix():
+	assert module_name('./pkg/mod.py') == module_name('pkg\\mod.py') == 'pkg.mod'
+	assert module_name('pkg/__init__.py') == 'pkg'
+	assert module_name('./.hidden/mod.py') == '.hidden.mod'  # Not 'hidden.mod', as stripping the characters './' gave.
+	assert module_name('utils.py') == 'utils'
@@ -0,0 +1,52 @@
+from pybiosis.reloader import Reloader, PollingWatcher
+from pybiosis.core import Device
+import textwrap
+import pytest
+import sys
+
+MODULE = 'pybiosis_reloaded_jobs'
+
+
+@pytest.fixture
+def user_module(user_path, registry, monkeypatch):
+	""" Writes the user module (and returns its path), and forgets it after the test. """
+	monkeypatch.syspath_prepend(str(user_path))  # As pybiosis.load does.
+	path = user_path / f'{MODULE}.py'
+	def write(source):
+		path.write_text(textwrap.dedent(source))
+		return str(path)
+	yield write
+	sys.modules.pop(MODULE, None)
+
+
+def registered(registry):
+	return [g.name for c, g in registry if g.module.__name__ == MODULE]
+
+
+SOURCE = '''
+	from pybiosis.core import Device, StreamDeck
+
+	@Device(title='Backup')
+	@StreamDeck(location='auto:Jobs')
+	def backup():
+		pass
+'''
+
+
+def test_reloading_keeps_one_entry_per_function(user_path, user_module, registry):
+	file = user_module(SOURCE)
+	reloader = Reloader(user_path, watcher=PollingWatcher(user_path))
+	for _ in range(20):
+		assert reloader.reload([file]) == [MODULE]
+	assert registered(registry) == ['backup', 'backup']
+
+
+def test_a_new_file_that_fails_to_import_leaves_nothing_registered(user_path, user_module, registry):
+	file = user_module(SOURCE + '\nraise RuntimeError("half way")\n')
+	reloader = Reloader(user_path, watcher=PollingWatcher(user_path))
+	assert reloader.reload([file]) == []
+	assert registered(registry) == []
+
+	user_module(SOURCE)
+	assert reloader.reload([file]) == [MODULE]
+	assert registered(registry) == ['backup', 'backup']
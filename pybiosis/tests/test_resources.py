@@ -0,0 +1,80 @@
+from pybiosis.util.resources import FunctionTimeout, process_limits, time_limit
+from pybiosis.runtime import Usage, run_limited
+from types import SimpleNamespace
+import threading
+import cProfile
+import pytest
+import time
+import os
+
+
+def run_in_thread(target):
+	result = {}
+	def run():
+		try:
+			result['value'] = target()
+		except BaseException as e:
+			result['error'] = e
+	thread = threading.Thread(target=run)
+	thread.start()
+	thread.join()
+	return result
+
+
+def test_thread_timeout_interrupts_the_block():
+	def slow():
+		with time_limit(0.05):
+			for _ in range(200):
+				time.sleep(0.01)
+	assert isinstance(run_in_thread(slow).get('error'), FunctionTimeout)
+
+
+def test_thread_timeout_does_not_leak_after_the_block():
+	def quick():
+		with time_limit(0.05):
+			pass
+		for _ in range(30):  # Past the deadline, outside of the block.
+			time.sleep(0.01)
+		return 'done'
+	assert run_in_thread(quick) == {'value': 'done'}
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'), reason="needs sched_setaffinity")
+def test_process_limits_are_restored():
+	cpus = os.sched_getaffinity(0)
+	with process_limits(cpu_affinity=min(cpus)):
+		assert os.sched_getaffinity(0) == {min(cpus)}
+	assert os.sched_getaffinity(0) == cpus
+
+
+def test_usage_is_only_recorded_with_limits(user_path):
+	plain = SimpleNamespace(module=SimpleNamespace(__name__='jobs'), name='plain')
+	assert run_limited(plain, lambda: 'ok', (), {}) == 'ok'
+	assert not (user_path / '.compilers' / 'stats').exists()
+
+	limited = SimpleNamespace(module=SimpleNamespace(__name__='jobs'), name='limited', timeout=60)
+	assert run_limited(limited, lambda: 'ok', (), {}) == 'ok'
+	assert Usage('jobs.limited').load()['calls'] == 1
+
+
+def test_a_thread_timeout_leaves_the_interpreter_usable():
+	def quick():
+		with time_limit(0.02):
+			try:
+				time.sleep(0.1)
+			except FunctionTimeout:  # Swallowed by the block.
+				pass
+	run_in_thread(quick)
+
+	barrier = threading.Barrier(2)
+	def profiled():
+		profile = cProfile.Profile()
+		profile.enable()
+		barrier.wait()
+		profile.disable()
+	threads = [threading.Thread(target=profiled, daemon=True), threading.Thread(target=barrier.wait, daemon=True)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join(timeout=5)
+	assert not any(thread.is_alive() for thread in threads)
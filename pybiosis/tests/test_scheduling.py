@@ -0,0 +1,240 @@
+from pybiosis.scheduling.engine import SchedulerEngine
+from pybiosis.scheduling.preview import Preview, fire_times
+from pybiosis.scheduling.systemd import SystemdBackend, render_units
+from pybiosis.scheduling.schtasks import TaskSchedulerBackend, render_task, parse_snapshot, diff, digest_of
+from pybiosis.scheduling.triggers import Trigger
+from pybiosis.scheduling.cron import CronBackend, cron_lines, BEGIN, END
+from pybiosis.core import Device, Scheduler
+import datetime as dt
+import subprocess
+import threading
+import stat
+import pytest
+
+NOW = dt.datetime(2024, 3, 4, 12, 0)  # A Monday.
+
+
+def engine(**kwargs):
+	return SchedulerEngine(now=lambda: NOW, **kwargs)
+
+
+def finish(engine):
+	engine.pool.shutdown(wait=True)
+	return engine.summary()
+
+
+def test_catch_up_all_runs_each_missed_run_despite_overlap_skip():
+	calls = []
+	e = engine(catch_up='all', overlap='skip')
+	job = e.add('job', lambda: calls.append(1), Trigger('hourly'))
+	e.push(NOW - dt.timedelta(hours=5), job)
+	e.tick()
+	stats = finish(e)['job']
+	assert len(calls) == stats['runs'] == 6
+	assert stats['skipped'] == 0
+
+
+@pytest.mark.parametrize('catch_up, runs', [('skip', 0), ('once', 1)])
+def test_catch_up_policies(catch_up, runs):
+	calls = []
+	e = engine(catch_up=catch_up)
+	job = e.add('job', lambda: calls.append(1), Trigger('hourly'))
+	e.push(NOW - dt.timedelta(hours=5), job)
+	e.tick()
+	finish(e)
+	assert len(calls) == runs
+
+
+def test_overlap_skip_while_running():
+	release = threading.Event()
+	e = engine(overlap='skip')
+	job = e.add('job', release.wait, Trigger('hourly'))
+	e.dispatch(job)
+	e.dispatch(job)
+	release.set()
+	stats = finish(e)['job']
+	assert (stats['runs'], stats['skipped']) == (1, 1)
+
+
+def test_stats_are_counted_from_parallel_runs():
+	e = engine(max_workers=8, overlap='parallel')
+	job = e.add('job', lambda: None, Trigger('hourly'))
+	for _ in range(200):
+		e.dispatch(job)
+	assert finish(e)['job']['runs'] == 200
+
+
+def test_failures_raise_through_the_runtime(registry):  # The Device wrapper would swallow them, and show a dialog.
+	@Device(title='Broken')
+	@Scheduler(trigger='daily')
+	def broken():
+		raise KeyError('missing')
+
+	functions = [f for c, f in registry if c is Scheduler and f.original is broken.original]
+	e = SchedulerEngine.from_functions(functions, now=lambda: NOW)
+	e.dispatch(e.jobs[0])
+	assert finish(e)[f'{__name__}.{broken.original.__qualname__}']['failures'] == 1
+
+
+def test_each_scheduler_decorator_has_its_own_job(registry):
+	@Scheduler(trigger='daily', start='08:00')
+	@Scheduler(trigger='daily', start='20:00')
+	def twice():
+		pass
+
+	functions = [f for c, f in registry if c is Scheduler and f.original is twice.original]
+	e = SchedulerEngine.from_functions(functions, now=lambda: NOW)
+	name = f'{__name__}.{twice.original.__qualname__}'
+	assert sorted(finish(e)) == [name, f'{name}#2']
+	assert sorted(job.next_run.hour for job in e.jobs) == [8, 20]
+
+
+@pytest.mark.parametrize('values', [
+	{'trigger': 'minute', 'modifier': 7},
+	{'trigger': 'hourly', 'modifier': 2, 'start': '17:30', 'end': '08:00'},
+	{'trigger': 'daily', 'start': '09:15'},
+	{'trigger': 'weekly', 'day': 'MON,FRI', 'modifier': 2, 'start': '2024/01/01-07:00'},
+	{'trigger': 'monthly', 'modifier': 'LAST', 'day': 'SUN', 'start': '10:00'},
+	{'trigger': 'monthly', 'modifier': 'lastday', 'start': '23:00'},
+	{'trigger': 'monthly', 'day': 31, 'start': '06:00'},
+])
+def test_preview_matches_stepping_the_trigger(values):
+	trigger = Trigger.from_values(values)
+	end = NOW + dt.timedelta(days=70)
+	stepped, moment = [], NOW - dt.timedelta(microseconds=1)
+	while (moment := trigger.next_after(moment)) is not None and moment < end:
+		stepped.append(moment)
+	assert fire_times(trigger, NOW, end).astype(dt.datetime).tolist() == stepped
+
+
+def test_preview_collisions():
+	triggers = [('a', Trigger('hourly')), ('b', Trigger('daily')), ('c', Trigger('minute', 30))]
+	preview = Preview(triggers, begin=NOW, horizon=dt.timedelta(days=1))
+	minute, names = preview.collisions(top=1)[0]
+	assert minute.time() == dt.time(0, 0) and sorted(names) == ['a', 'b', 'c']
+
+
+def expand(field, values):
+	if field == '*':
+		return set(values)
+	if '/' in field:
+		span, step = field.split('/')
+		first, last = map(int, span.split('-'))
+		return set(range(first, last + 1, int(step)))
+	return set(map(int, field.split(',')))
+
+
+@pytest.mark.parametrize('values', [
+	{'trigger': 'minute', 'modifier': 20, 'start': '17:30', 'end': '08:15'},
+	{'trigger': 'minute', 'modifier': 7, 'start': '09:05', 'end': '09:50'},
+	{'trigger': 'hourly', 'modifier': 1, 'start': '22:45', 'end': '02:00'},
+])
+def test_cron_windows_stop_at_the_end_minute(values):
+	trigger = Trigger.from_values(values)
+	day = dt.datetime(2024, 3, 5)
+	stepped, moment = set(), day - dt.timedelta(microseconds=1)
+	while (moment := trigger.next_after(moment)) < day + dt.timedelta(days=1):
+		stepped.add((moment.hour, moment.minute))
+	expressed = set()
+	for schedule, _ in cron_lines(trigger):
+		minutes, hours = schedule.split()[:2]
+		expressed |= {(h, m) for h in expand(hours, range(24)) for m in expand(minutes, range(60))}
+	assert expressed == stepped
+
+
+def test_systemd_sync_accepts_progress_on_stderr(tmp_path):
+	log = tmp_path / 'calls.txt'
+	systemctl = tmp_path / 'systemctl'
+	systemctl.write_text(f'#!/bin/sh\necho "$@" >> {log}\necho "Created symlink" >&2\n')
+	systemctl.chmod(systemctl.stat().st_mode | stat.S_IEXEC)
+	units = render_units('jobs.backup', [Trigger('daily', start='03:00')], tmp_path, '/usr/bin/true')
+	backend = SystemdBackend(tmp_path / 'units', exe=str(systemctl))
+	assert sorted(backend.sync(units)[0]) == sorted(units)
+	assert backend.sync(units) == ([], [])
+	assert log.read_text().splitlines() == ['--user daemon-reload', '--user enable pybiosis-jobs.backup.timer', '--user restart pybiosis-jobs.backup.timer']
+
+
+def snapshot(tasks):
+	""" Fakes `schtasks /query /xml` output for {name: task xml}. """
+	return ''.join(f'<!-- \\{name} -->\n{xml}\n' for name, xml in tasks.items())
+
+
+def test_rendered_tasks_only_change_with_their_settings():
+	task = render_task([Trigger('daily', start='03:00')], 'C:/jobs/backup.vbs', description='Backup')
+	assert task == render_task([Trigger('daily', start='03:00')], 'C:/jobs/backup.vbs', description='Backup')
+	assert '<StartBoundary>2000-01-01T03:00:00</StartBoundary>' in task
+	assert digest_of(task) != digest_of(render_task([Trigger('daily', start='04:00')], 'C:/jobs/backup.vbs', description='Backup'))
+
+
+def test_a_start_of_now_is_pinned_when_first_compiled():
+	starts = {}
+	values = {'trigger': 'once', 'start': 'now'}
+	pinned = Scheduler.pin_now(values, 'PYBIOSIS_job', starts)
+	assert pinned['start'] == starts['PYBIOSIS_job'] and values['start'] == 'now'
+	starts['PYBIOSIS_job'] = '2024/03/04-12:00'  # As if compiled earlier.
+	first = render_task([Trigger.from_values(Scheduler.pin_now(values, 'PYBIOSIS_job', starts))], 'C:/job.vbs')
+	assert first == render_task([Trigger.from_values(Scheduler.pin_now(values, 'PYBIOSIS_job', starts))], 'C:/job.vbs')
+	assert Scheduler.pin_now({'trigger': 'daily', 'start': '03:00'}, 'PYBIOSIS_other', starts) == {'trigger': 'daily', 'start': '03:00'}
+
+
+def test_only_pybiosis_tasks_are_read_from_the_snapshot():
+	ours = render_task([Trigger('hourly')], 'C:/a.vbs')
+	output = snapshot({
+		'PYBIOSIS_a': ours,
+		'PYBIOSIS_edited': '<Task><RegistrationInfo><Source>Someone</Source></RegistrationInfo></Task>',
+		'Microsoft\\Windows\\Defrag': render_task([Trigger('daily')], 'C:/defrag.exe'),
+	})
+	assert parse_snapshot(output, 'PYBIOSIS_') == {'PYBIOSIS_a': digest_of(ours), 'PYBIOSIS_edited': None}
+
+
+def test_the_diff_only_lists_tasks_that_changed():
+	a, b = render_task([Trigger('hourly')], 'C:/a.vbs'), render_task([Trigger('daily')], 'C:/b.vbs')
+	installed = {'PYBIOSIS_a': digest_of(a), 'PYBIOSIS_b': 'outdated', 'PYBIOSIS_c': digest_of(a), 'PYBIOSIS_d': None}
+	desired = {'PYBIOSIS_a': a, 'PYBIOSIS_b': b, 'PYBIOSIS_d': a, 'PYBIOSIS_e': b}
+	assert diff(desired, installed) == (['PYBIOSIS_e'], ['PYBIOSIS_b', 'PYBIOSIS_d'], ['PYBIOSIS_c'])
+
+
+def test_task_scheduler_sync_only_runs_schtasks_for_the_changes(tmp_path):
+	kept, changed = render_task([Trigger('hourly')], 'C:/kept.vbs'), render_task([Trigger('daily')], 'C:/changed.vbs')
+	installed = {'PYBIOSIS_kept': kept, 'PYBIOSIS_changed': render_task([Trigger('hourly')], 'C:/changed.vbs'), 'PYBIOSIS_removed': kept}
+	calls = []
+	def runner(arguments):
+		calls.append(arguments)
+		return snapshot(installed) if arguments[1] == '/query' else 'SUCCESS'
+	backend = TaskSchedulerBackend(tmp_path / 'xml', prefix='PYBIOSIS_', runner=runner)
+	result = backend.sync({'PYBIOSIS_kept': kept, 'PYBIOSIS_changed': changed, 'PYBIOSIS_new': changed})
+	assert result == (['PYBIOSIS_new'], ['PYBIOSIS_changed'], ['PYBIOSIS_removed'])
+	assert calls[0] == ['schtasks', '/query', '/xml']
+	assert sorted(call[1:4] for call in calls[1:]) == [['/create', '/tn', 'PYBIOSIS_changed'], ['/create', '/tn', 'PYBIOSIS_new'], ['/delete', '/tn', 'PYBIOSIS_removed']]
+	assert (tmp_path / 'xml' / 'PYBIOSIS_new.xml').read_text(encoding='utf-16') == changed
+
+
+class Crontab:
+	""" A stub crontab runner, that keeps the installed crontab (None for none) and counts the installs. """
+	def __init__(self, installed=None):
+		self.installed = installed
+		self.installs = 0
+
+	def __call__(self, arguments):
+		if arguments[1] == '-l':
+			if self.installed is None:
+				raise subprocess.CalledProcessError(1, arguments, stderr='no crontab for user\n')
+			return self.installed
+		with open(arguments[1]) as file:
+			self.installed = file.read()
+		self.installs += 1
+		return ''
+
+
+def test_cron_sync_only_replaces_its_own_block():
+	runner = Crontab()
+	backend = CronBackend(runner=runner)
+	assert backend.sync({'backup': ([Trigger('daily', start='03:00')], 'backup.sh')})
+	assert runner.installed == f'{BEGIN}\n# backup\n0 3 * * * backup.sh\n{END}\n'
+
+	runner.installed = 'MAILTO=me\n' + runner.installed + '@reboot mine.sh\n'  # Lines the user added around the block.
+	assert not backend.sync({'backup': ([Trigger('daily', start='03:00')], 'backup.sh')})
+	assert runner.installs == 1
+
+	assert backend.sync({'backup': ([Trigger('daily', start='04:00')], 'backup.sh')})
+	assert runner.installed == f'MAILTO=me\n{BEGIN}\n# backup\n0 4 * * * backup.sh\n{END}\n@reboot mine.sh\n'
@@ -0,0 +1,33 @@
+from pybiosis.experimental.speech import NullEngine, RecordingEngine, configure, default_engine, speak
+import builtins
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def restore():
+	yield
+	configure(default_engine)
+
+
+def test_configure_sets_the_engine_of_the_shared_worker():
+	engines = []
+	configure(lambda: engines.append(RecordingEngine()) or engines[-1])
+	speak('hello').result(timeout=5)
+	assert [text for text, _, _ in engines[0].spoken] == ['hello']
+
+
+def test_the_environment_can_silence_it(monkeypatch):
+	monkeypatch.setenv('PYBIOSIS_SPEECH_ENGINE', 'null')
+	assert isinstance(default_engine(), NullEngine)
+
+
+def test_null_engine_without_pyttsx3(monkeypatch):
+	original = builtins.__import__
+	def without_pyttsx3(name, *args, **kwargs):
+		if name == 'pyttsx3':
+			raise ImportError(name)
+		return original(name, *args, **kwargs)
+	monkeypatch.setattr(builtins, '__import__', without_pyttsx3)
+	assert isinstance(default_engine(), NullEngine)
+	configure(default_engine)
+	assert speak('nothing').result(timeout=5) >= 0
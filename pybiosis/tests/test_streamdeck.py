@@ -0,0 +1,109 @@
+from pybiosis.core import StreamDeck
+from pybiosis.compilers.streamdeck import Layout, unmanaged_buttons, write_profile, get_folders
+import pybiosis.compilers.streamdeck as streamdeck
+import pytest
+import json
+import os
+
+
+class Function:
+	def __init__(self, name, location):
+		self.name = self.title = name
+		self.location = location
+		self.image = None
+
+
+def button(title, path):
+	return {'Name': 'Open', 'Settings': {'path': path}, 'States': [{'Title': title}], 'UUID': 'com.elgato.streamdeck.system.open'}
+
+
+def folder(title, ID, managed):
+	settings = {'ProfileUUID': ID, **({'pybiosis': True} if managed else {})}
+	return {'Name': 'Create Folder', 'Settings': settings, 'States': [{'Title': title}], 'UUID': 'com.elgato.streamdeck.profile.openchild'}
+
+
+def write_manifest(path, actions):
+	os.makedirs(path, exist_ok=True)
+	with open(f'{path}/manifest.json', 'w') as file:
+		json.dump({'Actions': actions, 'Name': 'Test'}, file)
+
+
+def read_manifest(path):
+	with open(f'{path}/manifest.json') as file:
+		return json.load(file)['Actions']
+
+
+@pytest.fixture
+def profile(user_path):
+	""" A profile with the user's button, a stale pybiosis button, and folders pybiosis created (one holding a user button). """
+	path = str(user_path / 'profile.sdProfile')
+	stale = str(StreamDeck.TEMP_PATH / 'removed_1.vbs')
+	write_manifest(path, {
+		'1,0': button('Mine', 'C:/Tools/mine.exe'),
+		'2,0': button('Removed', stale),
+		'3,0': folder('Old', 'OLD', managed=True),
+		'4,0': folder('Mixed', 'MIXED', managed=True),
+	})
+	write_manifest(f'{path}/Profiles/OLD.sdProfile', {'1,0': button('Removed too', stale)})
+	write_manifest(f'{path}/Profiles/MIXED.sdProfile', {'1,0': button('Removed too', stale), '2,0': button('Also mine', 'C:/Tools/also.exe')})
+	return path
+
+
+def test_explicit_locations_collide_with_the_buttons_on_the_deck(profile):
+	existing = unmanaged_buttons(profile)
+	assert existing == {'': {'1,0': 'the button "Mine"', '4,0': 'the folder "Mixed"'}, 'Mixed': {'2,0': 'the button "Also mine"'}}
+	Layout(3, 5).plan([Function('replaces_removed', '2,0')], existing)
+	with pytest.raises(ValueError, match='1,0: the button "Mine" and mine'):
+		Layout(3, 5).plan([Function('mine', '1,0')], existing)
+
+
+def test_writing_replaces_the_buttons_and_folders_written_before(profile):
+	functions = [Function('first', 'auto:New'), Function('second', 'auto:Mixed')]
+	layout = Layout(3, 5)
+	placements = layout.plan(functions, unmanaged_buttons(profile))
+	files = {f: str(StreamDeck.TEMP_PATH / f'{f.name}.vbs') for f in functions}
+	write_profile(profile, layout, placements, files)
+
+	root = read_manifest(profile)
+	assert {coords: action['States'][0]['Title'] for coords, action in root.items()} == {'1,0': 'Mine', '2,0': 'New', '4,0': 'Mixed'}
+	assert not os.path.exists(f'{profile}/Profiles/OLD.sdProfile')
+	folders = get_folders(profile)
+	assert sorted(folders) == ['Mixed', 'New'] and folders['Mixed'] == 'MIXED'
+	new = read_manifest(f"{profile}/Profiles/{folders['New']}.sdProfile")
+	assert new['1,0']['States'][0]['Title'] == 'first'
+	mixed = read_manifest(f'{profile}/Profiles/MIXED.sdProfile')
+	assert {coords: action['States'][0]['Title'] for coords, action in mixed.items()} == {'1,0': 'second', '2,0': 'Also mine'}
+
+
+def test_what_does_not_fit_is_reported_while_planning(profile):
+	existing = unmanaged_buttons(profile)
+	existing[''].update({coords: 'the button "Mine"' for coords in Layout(3, 5).slots if coords not in existing['']})
+	with pytest.raises(ValueError, match='no room in "/" for the folder "New"'):
+		Layout(3, 5).plan([Function('first', 'auto:New')], existing)
+	with pytest.raises(ValueError, match='Could not find the StreamDeck folder.*Missing'):
+		Layout(3, 5).plan([Function('first', 'Missing/1,1')], unmanaged_buttons(profile))
+	Layout(3, 5).plan([Function('first', 'Mixed/1,1'), Function('second', 'auto:Mixed/Nested')], unmanaged_buttons(profile))
+
+
+def test_a_failing_profile_is_reported_and_the_others_are_written(user_path, registry, monkeypatch):
+	profiles = user_path / 'Elgato' / 'StreamDeck' / 'ProfilesV2'
+	for ID in ('GOOD1', 'BAD', 'GOOD2'):
+		write_manifest(str(profiles / f'{ID}.sdProfile'), {})
+	(profiles / 'BAD.sdProfile' / 'Profiles').write_text('')  # Its folders can't be created.
+	commands = []
+	monkeypatch.setenv('APPDATA', str(user_path))
+	monkeypatch.delenv('PYBIOSIS_PROFILE_ID', raising=False)
+	monkeypatch.setattr(streamdeck.validate, 'require_windows', lambda: None)
+	monkeypatch.setattr(streamdeck.os, 'system', lambda command: commands.append(command) or 1)  # StreamDeck isn't running.
+
+	@StreamDeck(location='auto:Tests', profile=['GOOD1', 'BAD', 'GOOD2'])
+	def everywhere():
+		pass
+
+	with pytest.raises(ValueError, match=r'profile\(s\): "Test" \[BAD\] \(') as error:
+		StreamDeck.compile([f for c, f in registry if c is StreamDeck and f.module.__name__ == __name__])
+	assert 'GOOD' not in str(error.value)  # Only the failing profile is reported.
+	for ID in ('GOOD1', 'GOOD2'):
+		folders = get_folders(str(profiles / f'{ID}.sdProfile'))
+		assert read_manifest(str(profiles / f'{ID}.sdProfile' / 'Profiles' / f"{folders['Tests']}.sdProfile"))['1,0']['States'][0]['Title'] == 'Everywhere'
+	assert len(commands) == 2 and 'StreamDeck.exe' in commands[-1]  # Restarted once, after the profiles were written.
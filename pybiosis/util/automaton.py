@@ -0,0 +1,203 @@
+""" A compiled, word-level automaton that resolves an utterance to a registered phrase.
+
+	The automaton is built from PhraseGrammars (see compilers/assistant.py) and determinized,
+	so a lookup walks one state per word, regardless of how many phrases are registered.
+	A phrase ending in '$' captures the rest of the utterance as its argument.
+
+	It is stored as a flat binary file, which is read through mmap rather than parsed:
+		header | word offsets | states | edges | key offsets | words | keys
+	Words are sorted (looked up with a binary search), and the edges of each state are sorted by word.
+"""
+import struct
+import mmap
+
+
+MAGIC = b'PBA1'
+HEADER = struct.Struct('<4sIIII')  # magic, words, states, edges, keys
+OFFSET = struct.Struct('<I')
+STATE = struct.Struct('<IIii')  # first edge, number of edges, accepted key, captured key (-1 if none)
+EDGE = struct.Struct('<II')  # word, target state
+ARGUMENT = '$'
+
+
+def normalize(text):
+	return ' '.join(str(text).lower().split())
+
+
+def build_nfa(grammars):
+	""" grammars: objects with 'tokens', a list of alternatives of slots of word tuples (see PhraseGrammar).
+		Returns (edges, accepts, captures) of a non-deterministic automaton whose start state is 0.
+		edges: [{word: {targets}}], accepts/captures: {state: key index}.
+	"""
+	edges = [{}]
+	accepts, captures = {}, {}
+
+	def new_state():
+		edges.append({})
+		return len(edges) - 1
+
+	def chain(start, words, end=None):
+		state = start
+		for i, word in enumerate(words):
+			target = end if (end is not None and i == len(words) - 1) else new_state()
+			edges[state].setdefault(word, set()).add(target)
+			state = target
+		return state
+
+	for index, grammar in enumerate(grammars):
+		for alternative in grammar.tokens:
+			state = 0
+			for i, slot in enumerate(alternative):
+				last = i == len(alternative) - 1
+				end = new_state()
+				for synonym in slot:
+					if last and synonym and synonym[-1] == ARGUMENT:
+						captures.setdefault(chain(state, synonym[:-1]) if len(synonym) > 1 else state, index)
+					elif synonym:
+						chain(state, synonym, end)
+				if last:
+					accepts.setdefault(end, index)
+				state = end
+	return edges, accepts, captures
+
+
+def determinize(edges, accepts, captures):
+	""" Subset construction. Returns a list of (transitions {word: state}, accepted key, captured key). """
+	start = frozenset([0])
+	ids = {start: 0}
+	states = []
+	pending = [start]
+	while pending:
+		subset = pending.pop()
+		transitions = {}
+		for word in {word for state in subset for word in edges[state]}:
+			target = frozenset(t for state in subset for t in edges[state].get(word, ()))
+			if target not in ids:
+				ids[target] = len(ids)
+				pending.append(target)
+			transitions[word] = ids[target]
+		accept = min((accepts[s] for s in subset if s in accepts), default=-1)
+		capture = min((captures[s] for s in subset if s in captures), default=-1)
+		states.append((ids[subset], transitions, accept, capture))
+	return [state[1:] for state in sorted(states, key=lambda state: state[0])]
+
+
+def pack(strings):
+	""" Returns (offsets, blob) for a list of strings. """
+	encoded = [s.encode('utf-8') for s in strings]
+	offsets = [0]
+	for e in encoded:
+		offsets.append(offsets[-1] + len(e))
+	return b''.join(OFFSET.pack(o) for o in offsets), b''.join(encoded)
+
+
+class PhraseAutomaton:
+	""" Resolves utterances to keys (e.g. 'module.function'). Build it with from_grammars, or load a saved one. """
+
+	def __init__(self, buffer):
+		self.buffer = buffer
+		magic, self.num_words, self.num_states, self.num_edges, self.num_keys = HEADER.unpack_from(buffer, 0)
+		if magic != MAGIC:
+			raise ValueError('Not a phrase automaton.')
+		self.word_offsets = HEADER.size
+		self.states = self.word_offsets + OFFSET.size * (self.num_words + 1)
+		self.edges = self.states + STATE.size * self.num_states
+		self.key_offsets = self.edges + EDGE.size * self.num_edges
+		self.words = self.key_offsets + OFFSET.size * (self.num_keys + 1)
+		self.keys = self.words + self._offset(self.word_offsets, self.num_words)
+
+	@classmethod
+	def from_grammars(cls, items):
+		""" items: a list of (key, PhraseGrammar). When several keys accept an utterance, the first one wins. """
+		keys = [key for key, _ in items]
+		states = determinize(*build_nfa([grammar for _, grammar in items]))
+		words = sorted({word for transitions, _, _ in states for word in transitions})
+		word_ids = {word: i for i, word in enumerate(words)}
+
+		state_table, edge_table = [], []
+		for transitions, accept, capture in states:
+			state_table.append(STATE.pack(len(edge_table), len(transitions), accept, capture))
+			edge_table.extend(EDGE.pack(word_ids[w], t) for w, t in sorted(transitions.items(), key=lambda e: word_ids[e[0]]))
+
+		word_offsets, word_blob = pack(words)
+		key_offsets, key_blob = pack(keys)
+		header = HEADER.pack(MAGIC, len(words), len(state_table), len(edge_table), len(keys))
+		return cls(b''.join([header, word_offsets, *state_table, *edge_table, key_offsets, word_blob, key_blob]))
+
+	@classmethod
+	def load(cls, path, copy=False):
+		""" Maps the file, or reads it (copy=True) so that it can be recompiled while a long-running process
+			uses it (Windows doesn't allow replacing a mapped file).
+		"""
+		with open(path, 'rb') as file:
+			return cls(file.read() if copy else mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+	def save(self, path):
+		with open(path, 'wb') as file:
+			file.write(self.buffer)
+
+	def _offset(self, table, i):
+		return OFFSET.unpack_from(self.buffer, table + OFFSET.size * i)[0]
+
+	def _string(self, table, blob, i):
+		return bytes(self.buffer[blob + self._offset(table, i):blob + self._offset(table, i + 1)]).decode('utf-8')
+
+	def word_id(self, word):
+		""" Binary search of the sorted vocabulary. Returns None for unknown words. """
+		word = word.encode('utf-8')
+		low, high = 0, self.num_words
+		while low < high:
+			middle = (low + high) // 2
+			start = self.words + self._offset(self.word_offsets, middle)
+			candidate = bytes(self.buffer[start:self.words + self._offset(self.word_offsets, middle + 1)])
+			if candidate < word:
+				low = middle + 1
+			else:
+				high = middle
+		if low < self.num_words and self._string(self.word_offsets, self.words, low) == word.decode('utf-8'):
+			return low
+		return None
+
+	def step(self, state, word_id):
+		""" Returns the next state, or None. """
+		first, count, _, _ = STATE.unpack_from(self.buffer, self.states + STATE.size * state)
+		low, high = first, first + count
+		while low < high:
+			middle = (low + high) // 2
+			word, target = EDGE.unpack_from(self.buffer, self.edges + EDGE.size * middle)
+			if word == word_id:
+				return target
+			if word < word_id:
+				low = middle + 1
+			else:
+				high = middle
+		return None
+
+	def lookup(self, utterance):
+		""" Returns (key, argument) for the utterance, or None if it isn't a registered phrase.
+			An exact phrase wins over a '$' phrase, and the longest '$' prefix wins over shorter ones.
+		"""
+		words = normalize(utterance).split()
+		state, capture = 0, None
+		for position in range(len(words) + 1):
+			_, _, accept, captured = STATE.unpack_from(self.buffer, self.states + STATE.size * state)
+			if captured >= 0 and position < len(words):
+				capture = (captured, position)
+			if position == len(words):
+				if accept >= 0:
+					return self.key(accept), None
+				break
+			word_id = self.word_id(words[position])
+			state = None if word_id is None else self.step(state, word_id)
+			if state is None:
+				break
+		if capture:
+			key, position = capture
+			return self.key(key), ' '.join(utterance.split()[position:])
+		return None
+
+	def key(self, i):
+		return self._string(self.key_offsets, self.keys, i)
+
+	def __len__(self):
+		return self.num_states
@@ -1,6 +1,8 @@
 """ This module provides general utilities. """
 
 import os
+import sys
+import posixpath
 import importlib.util
 from pathlib import Path
 
@@ -18,11 +20,66 @@ class ChangeDir:
 		os.chdir(self.saved_dir)
 
 
-def import_module(module_path):
-	""" Imports a module given the file path. """
-	module_path = Path(module_path)
-	module_name = module_path.stem
-	spec = importlib.util.spec_from_file_location(module_name, module_path)
+_module_names = {}  # Module path -> canonical module name.
+
+
+def module_name(module_path):
+	""" The canonical name of a module given its path (relative to its root): pkg/mod.py is pkg.mod, pkg/__init__.py is pkg. """
+	module_path = str(module_path)
+	if module_path not in _module_names:
+		path = posixpath.normpath(module_path.replace('\\', '/')).lstrip('/')  # Without a leading './' or '/'.
+		parts = path.removesuffix('.py').split('/')
+		if parts[-1] == '__init__' and len(parts) > 1:
+			parts.pop()
+		_module_names[module_path] = '.'.join(parts)
+	return _module_names[module_path]
+
+
+def import_module(module_path, root=None):
+	""" Imports a module given the file path (relative to root, the current directory by default).
+
+		Modules are cached by their canonical name in sys.modules, so a module that was already imported
+		(eg: by pybiosis.load) is returned as is instead of being executed again.
+	"""
+	name = module_name(module_path)
+	file = Path(root or os.getcwd()) / str(module_path).replace('\\', '/').lstrip('/')
+	module = sys.modules.get(name)
+	if module is not None and _same_file(getattr(module, '__file__', None), file):
+		return module
+
+	if module is None and _on_path(file.parent if file.name != '__init__.py' else file.parent.parent, name):
+		return importlib.import_module(name)  # Imported the usual way, so its package and relative imports work.
+
+	spec = importlib.util.spec_from_file_location(name, file)
 	module = importlib.util.module_from_spec(spec)
-	spec.loader.exec_module(module)
+	if name in sys.modules:  # Another module has this name, so don't replace it.
+		spec.loader.exec_module(module)
+		return module
+	sys.modules[name] = module
+	try:
+		spec.loader.exec_module(module)
+	except BaseException:
+		sys.modules.pop(name, None)
+		raise
 	return module
+
+
+def _same_file(a, b):
+	try:
+		return a is not None and os.path.samefile(a, b)
+	except OSError:
+		return False
+
+
+def _on_path(directory, name):
+	""" Whether the module's root (directory, minus its package) is on sys.path, so it can be imported by name. """
+	root = Path(directory).resolve()
+	for _ in range(name.count('.')):
+		root = root.parent
+	for entry in sys.path:
+		try:
+			if Path(entry or os.getcwd()).resolve() == root:
+				return True
+		except OSError:
+			continue
+	return False
@@ -0,0 +1,103 @@
+""" JSON Lines files with an offset index, so a record can be read without parsing the whole file.
+
+	The index is a sorted array of (key hash, byte offset) pairs, next to the data file (data.jsonl -> data.index).
+	Keys are normalized (lower case, single spaces) before hashing, and a record can have several keys.
+"""
+import hashlib
+import struct
+import mmap
+import json
+import os
+
+ENTRY = struct.Struct('<QQ')  # key hash, offset of the record
+
+
+def key_hash(key):
+	normalized = ' '.join(str(key).lower().split())
+	return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def index_path(path):
+	return os.path.splitext(path)[0] + '.index'
+
+
+class JsonlWriter:
+	""" Writes records as they come, keeping only (hash, offset) pairs in memory.
+
+		with JsonlWriter('data.jsonl') as writer:
+			writer.write({"title": ...}, keys=['module.name', 'play spire'])
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.entries = []
+
+	def __enter__(self):
+		self.file = open(self.path, 'wb')
+		return self
+
+	def write(self, record, keys=()):
+		offset = self.file.tell()
+		self.file.write(json.dumps(record).encode('utf-8') + b'\n')
+		self.entries.extend((key_hash(key), offset) for key in keys)
+
+	def __exit__(self, *exc):
+		self.file.close()
+		self.entries.sort()
+		with open(index_path(self.path), 'wb') as file:
+			file.write(b''.join(ENTRY.pack(*entry) for entry in self.entries))
+
+
+class JsonlReader:
+	""" Reads records by key (a binary search of the mmapped index, then one seek), or all of them in order.
+
+		with JsonlReader('data.jsonl') as reader:
+			reader.get('play spire')
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		with open(index_path(path), 'rb') as file:
+			self.index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b''
+		self.size = len(self.index) // ENTRY.size
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		""" Unmaps the index. """
+		if isinstance(self.index, mmap.mmap):
+			self.index.close()
+		self.index, self.size = b'', 0
+
+	def offsets(self, key):
+		target = key_hash(key)
+		low, high = 0, self.size
+		while low < high:
+			middle = (low + high) // 2
+			if ENTRY.unpack_from(self.index, middle * ENTRY.size)[0] < target:
+				low = middle + 1
+			else:
+				high = middle
+		while low < self.size:
+			h, offset = ENTRY.unpack_from(self.index, low * ENTRY.size)
+			if h != target:
+				break
+			yield offset
+			low += 1
+
+	def get(self, key, default=None):
+		""" Returns the first record with the key. """
+		with open(self.path, 'rb') as file:
+			for offset in self.offsets(key):
+				file.seek(offset)
+				return json.loads(file.readline())
+		return default
+
+	def __iter__(self):
+		with open(self.path, 'rb') as file:
+			for line in file:
+				yield json.loads(line)
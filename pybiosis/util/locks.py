@@ -0,0 +1,95 @@
+""" Lightweight cross-process file locks (fcntl on unix, msvcrt on Windows).
+
+	The locks belong to an open file, so they also exclude other threads of the same process,
+	and they are released by the OS if the process dies.
+"""
+import contextlib
+import time
+import os
+
+try:
+	import fcntl
+except ImportError:  # Windows
+	fcntl = None
+	import msvcrt
+
+
+class FileLock:
+	""" An exclusive lock on a file. The pid of the holder is stored next to it (in <path>.pid), since
+		a file locked with msvcrt can't be read by other processes.
+	"""
+
+	POLL_INTERVAL = 0.05
+
+	def __init__(self, path):
+		self.path = path
+		self.file = None
+
+	def _try_lock(self):
+		try:
+			if fcntl:
+				fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+			else:
+				self.file.seek(0)
+				msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+			return True
+		except OSError:
+			return False
+
+	def acquire(self, blocking=True, timeout=None, tag=None):
+		""" Returns whether the lock was acquired. tag is stored with the pid (see holder_tag). """
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		self.file = open(self.path, 'a+')
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while not self._try_lock():
+			if not blocking or (deadline is not None and time.monotonic() > deadline):
+				self.file.close()
+				self.file = None
+				return False
+			time.sleep(self.POLL_INTERVAL)
+
+		with open(self.path + '.pid', 'w') as file:
+			file.write(f'{os.getpid()} {tag}' if tag else str(os.getpid()))
+		return True
+
+	def release(self):
+		if self.file is None:
+			return
+		try:
+			with contextlib.suppress(OSError):  # Not held by anyone anymore.
+				os.remove(self.path + '.pid')
+			if fcntl:
+				fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+			else:
+				self.file.seek(0)
+				msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+		finally:
+			self.file.close()
+			self.file = None
+
+	def _holder(self):
+		try:
+			with open(self.path + '.pid') as file:
+				pid, _, tag = file.read().strip().partition(' ')
+			return int(pid or 0) or None, tag or None
+		except (OSError, ValueError):
+			return None, None
+
+	def holder(self):
+		""" The pid that holds the lock, or None. """
+		return self._holder()[0]
+
+	def holder_tag(self):
+		""" The tag the holder acquired the lock with, or None. """
+		return self._holder()[1]
+
+	@property
+	def locked(self):
+		return self.file is not None
+
+	def __enter__(self):
+		self.acquire()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.release()
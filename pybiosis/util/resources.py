@@ -0,0 +1,222 @@
+""" Applies resource controls (timeouts, memory caps, CPU priority and affinity) to the running function.
+
+	Priority, affinity and memory caps apply to the whole process, so they are only applied when the function
+	runs on the main thread, ie: when it was launched on its own (StreamDeck, Task Scheduler, `bb run`), and they are
+	restored when it returns.
+	Timeouts also work on other threads (eg: the in-process scheduler's workers).
+"""
+import contextlib
+import threading
+import logging
+import ctypes
+import signal
+import re
+import os
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class FunctionTimeout(TimeoutError):
+	pass
+
+
+def parse_size(value):
+	""" Parses 512M, 2G, 1024K or a number of bytes. """
+	if value is None or isinstance(value, int):
+		return value
+	match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*', str(value).upper())
+	if not match:
+		raise ValueError(f"Could not parse the size: {value}, expected something like 512M or 2G.")
+	return int(float(match[1]) * UNITS[match[2]])
+
+def in_main_thread():
+	return threading.current_thread() is threading.main_thread()
+
+
+def kernel32():
+	""" Windows: kernel32 with the signatures of the functions used here (so the handles aren't truncated to 32 bits). """
+	from ctypes import wintypes
+	library = ctypes.WinDLL('kernel32', use_last_error=True)
+	library.GetCurrentProcess.restype = wintypes.HANDLE
+	library.GetPriorityClass.argtypes = [wintypes.HANDLE]
+	library.SetPriorityClass.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+	library.GetProcessAffinityMask.argtypes = [wintypes.HANDLE, ctypes.POINTER(ctypes.c_size_t), ctypes.POINTER(ctypes.c_size_t)]
+	library.SetProcessAffinityMask.argtypes = [wintypes.HANDLE, ctypes.c_size_t]
+	library.CreateJobObjectW.restype = wintypes.HANDLE
+	library.CreateJobObjectW.argtypes = [wintypes.LPVOID, wintypes.LPCWSTR]
+	library.SetInformationJobObject.argtypes = [wintypes.HANDLE, ctypes.c_int, wintypes.LPVOID, wintypes.DWORD]
+	library.AssignProcessToJobObject.argtypes = [wintypes.HANDLE, wintypes.HANDLE]
+	return library
+
+
+def set_priority(nice):
+	""" Lowers (or raises) the priority of this process. Uses the nice scale: -20 (highest) to 19 (lowest).
+		Returns a function that restores the previous priority.
+	"""
+	if hasattr(os, 'nice'):
+		previous = os.nice(0)
+		def restore():
+			try:
+				os.nice(previous - os.nice(0))
+			except PermissionError:  # Unprivileged processes can only lower their priority.
+				logging.warning(f"Restoring the priority to {previous} requires elevated privileges.")
+		try:
+			os.nice(nice - previous)  # os.nice is relative, so this is idempotent.
+		except PermissionError:
+			logging.warning(f"Raising the priority to {nice} requires elevated privileges.")
+		return restore
+	# Windows: map the nice scale onto the priority classes.
+	classes = [(-15, 0x00000080), (-5, 0x00008000), (5, 0x00000020), (15, 0x00004000), (20, 0x00000040)]  # HIGH, ABOVE_NORMAL, NORMAL, BELOW_NORMAL, IDLE
+	priority = next(c for limit, c in classes if nice < limit)
+	library = kernel32()
+	process = library.GetCurrentProcess()
+	previous = library.GetPriorityClass(process)
+	library.SetPriorityClass(process, priority)
+	return lambda: library.SetPriorityClass(process, previous)
+
+def set_affinity(cpus):
+	""" Restricts this process to the given CPUs. Returns a function that restores the previous CPUs. """
+	cpus = [cpus] if isinstance(cpus, int) else list(cpus)
+	if hasattr(os, 'sched_setaffinity'):
+		previous = os.sched_getaffinity(0)
+		os.sched_setaffinity(0, cpus)
+		return lambda: os.sched_setaffinity(0, previous)
+	try:
+		library = kernel32()
+	except AttributeError:
+		logging.warning("CPU affinity is not supported on this platform.")
+		return lambda: None
+	process = library.GetCurrentProcess()
+	previous, system = ctypes.c_size_t(), ctypes.c_size_t()
+	library.GetProcessAffinityMask(process, ctypes.byref(previous), ctypes.byref(system))
+	library.SetProcessAffinityMask(process, sum(1 << cpu for cpu in cpus))
+	return lambda: library.SetProcessAffinityMask(process, previous.value)
+
+def set_memory_limit(max_rss):
+	""" Caps the memory of this process, so that allocations beyond it raise a MemoryError.
+		Returns a function that lifts the cap.
+	"""
+	if resource is not None:
+		# RLIMIT_AS is the only limit that Linux enforces, so the address space is used as an approximation of the RSS.
+		previous = resource.getrlimit(resource.RLIMIT_AS)
+		hard = previous[1]
+		limit = max_rss if hard == resource.RLIM_INFINITY else min(max_rss, hard)
+		resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+		return lambda: resource.setrlimit(resource.RLIMIT_AS, previous)
+	return _set_job_memory_limit(max_rss)
+
+_job = None
+
+def _set_job_memory_limit(max_rss):
+	""" Windows: assigns this process to a job object with a process memory limit. """
+	global _job
+
+	class IO_COUNTERS(ctypes.Structure):
+		_fields_ = [(name, ctypes.c_ulonglong) for name in ['ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount', 'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount']]
+
+	class JOBOBJECT_BASIC_LIMIT_INFORMATION(ctypes.Structure):
+		_fields_ = [
+			('PerProcessUserTimeLimit', ctypes.c_int64), ('PerJobUserTimeLimit', ctypes.c_int64), ('LimitFlags', ctypes.c_uint32),
+			('MinimumWorkingSetSize', ctypes.c_size_t), ('MaximumWorkingSetSize', ctypes.c_size_t), ('ActiveProcessLimit', ctypes.c_uint32),
+			('Affinity', ctypes.c_size_t), ('PriorityClass', ctypes.c_uint32), ('SchedulingClass', ctypes.c_uint32),
+		]
+
+	class JOBOBJECT_EXTENDED_LIMIT_INFORMATION(ctypes.Structure):
+		_fields_ = [
+			('BasicLimitInformation', JOBOBJECT_BASIC_LIMIT_INFORMATION), ('IoInfo', IO_COUNTERS),
+			('ProcessMemoryLimit', ctypes.c_size_t), ('JobMemoryLimit', ctypes.c_size_t),
+			('PeakProcessMemoryUsed', ctypes.c_size_t), ('PeakJobMemoryUsed', ctypes.c_size_t),
+		]
+
+	JOB_OBJECT_LIMIT_PROCESS_MEMORY = 0x00000100
+	JobObjectExtendedLimitInformation = 9
+	try:
+		library = kernel32()
+	except AttributeError:
+		logging.warning("Memory limits are not supported on this platform.")
+		return lambda: None
+
+	def limit(flags, memory):
+		info = JOBOBJECT_EXTENDED_LIMIT_INFORMATION()
+		info.BasicLimitInformation.LimitFlags = flags
+		info.ProcessMemoryLimit = memory
+		library.SetInformationJobObject(_job, JobObjectExtendedLimitInformation, ctypes.byref(info), ctypes.sizeof(info))
+
+	if _job is None:  # A process can't leave its job, so the same one is reused (and its limit lifted afterwards).
+		_job = library.CreateJobObjectW(None, None)
+		library.AssignProcessToJobObject(_job, library.GetCurrentProcess())
+	limit(JOB_OBJECT_LIMIT_PROCESS_MEMORY, max_rss)
+	return lambda: limit(0, 0)
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+	""" Raises FunctionTimeout in the calling thread if the block runs for longer than `seconds`. """
+	if not seconds:
+		yield
+		return
+
+	def expire(*args):
+		raise FunctionTimeout(f"Timed out after {seconds} seconds.")
+
+	if in_main_thread() and hasattr(signal, 'setitimer'):  # Also interrupts blocking calls, like time.sleep.
+		previous = signal.signal(signal.SIGALRM, expire)
+		signal.setitimer(signal.ITIMER_REAL, seconds)
+		try:
+			yield
+		finally:
+			signal.setitimer(signal.ITIMER_REAL, 0)
+			signal.signal(signal.SIGALRM, previous)
+		return
+
+	# Otherwise, the exception is raised asynchronously in the thread (when it next runs python code).
+	# The lock makes sure that it isn't sent once the block is left, and one that is still pending then is
+	# raised and dropped here (clearing it with PyThreadState_SetAsyncExc(id, NULL) leaves the interpreter signaled).
+	thread_id = ctypes.c_ulong(threading.get_ident())
+	lock = threading.Lock()
+	state = {'finished': False, 'sent': False, 'raised': False}
+	def interrupt():
+		with lock:
+			if not state['finished']:
+				ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, ctypes.py_object(FunctionTimeout))
+				state['sent'] = True
+	timer = threading.Timer(seconds, interrupt)
+	timer.daemon = True
+	timer.start()
+	try:
+		yield
+	except FunctionTimeout:
+		state['raised'] = True
+		raise
+	finally:
+		with lock:
+			state['finished'] = True
+			timer.cancel()
+		if state['sent'] and not state['raised']:  # The block finished first (or swallowed it).
+			with contextlib.suppress(FunctionTimeout):
+				for _ in range(100):  # A pending exception is raised at the first jump.
+					pass
+
+@contextlib.contextmanager
+def process_limits(max_rss=None, nice=None, cpu_affinity=None):
+	""" Applies the process wide controls during the block, if this is the main thread, and restores them afterwards
+		(a long-lived process runs other functions after this one).
+	"""
+	with contextlib.ExitStack() as restore:
+		if max_rss is None and nice is None and cpu_affinity is None:
+			pass
+		elif not in_main_thread():
+			logging.warning("max_rss, nice and cpu_affinity only apply to functions that run in their own process.")
+		else:
+			if nice is not None:
+				restore.callback(set_priority(nice))
+			if cpu_affinity is not None:
+				restore.callback(set_affinity(cpu_affinity))
+			if max_rss is not None:
+				restore.callback(set_memory_limit(parse_size(max_rss)))
+		yield